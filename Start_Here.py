@@ -20,6 +20,8 @@ from gdpc import worldLoader as WL
 import util.util as util
 import structureLoader as loader
 import lib.interfaceUtils as iu
+import lib.chunkCache as chunkCache
+from lib import worldLoader
 import util.worldModification as worlModif
 
 import json
@@ -109,17 +111,14 @@ def buildTower(x, y, z, height=10, radius=10):
 
 
 
-def buildStructure(x, z, radius, heightMap, referenceCoordinates, rotation, structures, biomesBlocks, worlModif):
+def buildStructure(x, z, radius, heightMap, referenceCoordinates, rotation, catalog, biomesBlocks, worlModif):
 
-    potentialStructs = []
     diameter = radius * 2
-    for key in structures.keys():
-        _, size = structures[key]
-        if size[0] <= diameter and size[2] <= diameter:
-            potentialStructs.append(key)
+    potentialStructs = catalog.query(maxSizeX=diameter, maxSizeZ=diameter)
     
     chosenStruct = random.choice(potentialStructs)
-    struct, size = structures[chosenStruct]
+    struct = loader.loadStructures([chosenStruct], catalog)[chosenStruct]
+    size = struct.size
 
     xCoordinate = x + ((size[0]-2)//2) - 1
     zCoordinate = z + ((size[2]-2)//2) - 1
@@ -146,12 +145,14 @@ def buildStructure(x, z, radius, heightMap, referenceCoordinates, rotation, stru
 
 
 
-def buildAllStructure(x, z, heightMap, referenceCoordinates, structures, biomesBlocks, worlModif):
+def buildAllStructure(x, z, heightMap, referenceCoordinates, catalog, biomesBlocks, worlModif):
 
     rotation = 0
 
-    for key in structures.keys():
-        struct, size = structures[key]
+    structures = loader.loadStructures(catalog.names.tolist(), catalog)
+    for key in catalog.names.tolist():
+        struct = structures[key]
+        size = struct.size
 
         xCoordinate = x + ((size[0]-2)//2) - 1
         zCoordinate = z + ((size[2]-2)//2) - 1
@@ -201,8 +202,10 @@ if __name__ == '__main__':
         worlModif = worlModif.WorldModification(interface)
 
 
-        WORLDSLICE = WL.WorldSlice(STARTX, STARTZ,
-                           ENDX + 1, ENDZ + 1)
+        # Reuse the chunks of the last run from disk, only valid while the world is left unmodified in between
+        USE_CHUNK_CACHE = False
+        WORLDSLICE = worldLoader.WorldSlice(STARTX, STARTZ,
+                           ENDX + 1, ENDZ + 1, cache=chunkCache.defaultCache if USE_CHUNK_CACHE else None)
         
         heightMap = WORLDSLICE.heightmaps["MOTION_BLOCKING"]
 
@@ -211,7 +214,7 @@ if __name__ == '__main__':
 
         referenceCoordinates = [STARTX, STARTY, STARTZ]
 
-        structures = loader.loadAllResources()
+        catalog = loader.loadCatalog()
 
         ## Load replacement biome blocks
         with open("data/biomeBlocks.json") as json_file:
@@ -231,7 +234,7 @@ if __name__ == '__main__':
         # buildTower(xloc + STARTX, yCoordinate, zloc + STARTZ, height=20, radius=1)
 
         
-        buildAllStructure(xloc, zloc, heightMap, referenceCoordinates, structures, biomesBlocks, worlModif)
+        buildAllStructure(xloc, zloc, heightMap, referenceCoordinates, catalog, biomesBlocks, worlModif)
 
         print("Done!")
     except KeyboardInterrupt:   # useful for aborting a run-away program
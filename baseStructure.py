@@ -1,9 +1,8 @@
-import util.projectMath as _math
 import util.util as util
 import util.projectMath as projectMath
 import lib.interfaceUtils as interfaceUtils
 import random
-import math
+import numpy as np
 
 """ 
 # Main class which corresponds to a buildeable 
@@ -23,6 +22,22 @@ class BaseStructure:
     AIR_FILLING_PROBLEMATIC_BLOCS = ["minecraft:sand", "minecraft:red_sand",
                              "minecraft:gravel", "minecraft:water", "minecraft:lava"]
 
+    # Rotation by 90° steps around the y axis, x' = cos x - sin z and z' = sin x + cos z
+    ROTATION_MATRICES = np.array([
+        [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+        [[0, 0, -1], [0, 1, 0], [1, 0, 0]],
+        [[-1, 0, 0], [0, 1, 0], [0, 0, -1]],
+        [[0, 0, 1], [0, 1, 0], [-1, 0, 0]]
+    ])
+
+    # Axes mirrored by each flip, No flip = 0, Flip x = 1, flip z = 2, Flip xz = 3
+    FLIP_AXES = np.array([
+        [False, False, False],
+        [True, False, False],
+        [False, False, True],
+        [True, False, True]
+    ])
+
     """ 
     Empty constructor
     """
@@ -77,33 +92,36 @@ class BaseStructure:
     worldStructurePosition : position of the structure in real world, position in relation with reference point
     """
     def returnWorldPosition(self, localPoint, flip, rotation, referencePoint, worldStructurePosition) :
-        worldPosition = [0, 0, 0]
-        
-        # Position in building local spacereplacements
-        if flip == 1 or flip == 3 :
-            worldPosition[0] = self.size[0] - 1 - localPoint[0]
-        else : 
-            worldPosition[0] = localPoint[0]
+        localPosition = self.flipPositions([localPoint], flip)[0] - np.asarray(referencePoint)
 
-        if flip == 2 or flip == 3 :
-            worldPosition[2] = self.size[2] - 1 - localPoint[2]
-        else :
-           worldPosition[2] = localPoint[2]
+        # Rotate around the reference point then move to the real world
+        worldPosition = np.asarray(worldStructurePosition) + BaseStructure.ROTATION_MATRICES[rotation % 4] @ localPosition
 
-        worldPosition[1] = localPoint[1]
+        return worldPosition.tolist()
 
-        # Take rotation into account, apply to building local positions
-        worldPosition[0], worldPosition[2] = _math.rotatePointAround(
-            [worldStructurePosition[0] + referencePoint[0], worldStructurePosition[2] + referencePoint[2]], 
-            [worldStructurePosition[0] + worldPosition[0], worldStructurePosition[2] + worldPosition[2]], 
-            rotation *  math.pi / 2)
 
-        # Position in real world
-        worldPosition[0] = int(worldPosition[0])                        - referencePoint[0]
-        worldPosition[1] = worldStructurePosition[1] + worldPosition[1] - referencePoint[1] 
-        worldPosition[2] = int(worldPosition[2])                        - referencePoint[2]
+    """
+    Return positions with the flip applied inside the structure
+    positions : array (N, 3) of positions in the local space
+    flip : flip applied to localspace, [0|1|2|3]
+    """
+    def flipPositions(self, positions, flip):
+        positions = np.array(positions)
+        axes = BaseStructure.FLIP_AXES[flip]
+        positions[..., axes] = np.asarray(self.size)[axes] - 1 - positions[..., axes]
+        return positions
 
-        return worldPosition 
+
+    """
+    Return positions with the flip then the rotation applied, rotating around the origin of the local space
+    Flip is applied before rotation
+    positions : array (N, 3) of positions in the local space
+    flip : flip applied to localspace, [0|1|2|3]
+    rotation : rotation applied to localspace, [0|1|2|3]
+    """
+    def transformPositions(self, positions, flip, rotation):
+        positions = self.flipPositions(positions, flip)
+        return positions @ BaseStructure.ROTATION_MATRICES[rotation % 4].T.astype(positions.dtype)
 
     
     """
@@ -206,21 +224,8 @@ class BaseStructure:
     rotation : rotation applied to localspace, [0|1|2|3]
     """
     def getCornersLocalPositions(self, referencePosition, flip, rotation):
-        refPos = referencePosition.copy()
-        if flip == 1 or flip == 3 :
-            refPos[0] = self.size[0] - 1 - refPos[0]
-
-        if flip == 2 or flip == 3 :
-            refPos[2] = self.size[2] - 1 - refPos[2]
-
-        temp = _math.rotatePointAround([0, 0], [- refPos[0], - refPos[2]] , math.pi / 2 * rotation)
-
-        temp1 = _math.rotatePointAround([0, 0], [self.size[0] - 1 - refPos[0], self.size[2] - 1 - refPos[2]] , math.pi / 2 * rotation)
-        
-        return [int(min(temp[0], temp1[0])), 
-                int(min(temp[1], temp1[1])), 
-                int(max(temp[0], temp1[0])), 
-                int(max(temp[1], temp1[1]))]
+        corners = self.getCornersLocalPositionsAllFlipRotation(referencePosition, [flip], [rotation])
+        return corners[0]
 
     
     def returnFlipRotationThatIsInZone(self, position, mainEntryPosition, area):
@@ -246,15 +251,23 @@ class BaseStructure:
         return flip, rotation
 
     """
-    Get corners of all possible flip and rotation
+    Get corners of all possible flip and rotation, flip by flip
+    referencePosition : the origin of the local space, what should be the 0, 0,  [0, 0, 0]
+    flips : flips to compute, all by default
+    rotations : rotations to compute for every flip, all by default
     """
-    def getCornersLocalPositionsAllFlipRotation(self, referencePosition):
-        corners = []
-        for flip in [0, 1, 2, 3]:
-            for rotation in [0, 1, 2, 3]:
-                corners.append(self.getCornersLocalPositions(referencePosition, flip, rotation))
+    def getCornersLocalPositionsAllFlipRotation(self, referencePosition, flips=(0, 1, 2, 3), rotations=(0, 1, 2, 3)):
+        # Opposite corners of the structure relative to the flipped reference position
+        extremes = np.array([[0, 0, 0], np.asarray(self.size) - 1])
+        relative = extremes[np.newaxis] - np.array([
+            self.flipPositions(referencePosition, flip) for flip in flips])[:, np.newaxis]
+
+        # (flip, rotation, corner, axis)
+        rotated = np.einsum("rij,fcj->frci", BaseStructure.ROTATION_MATRICES[list(rotations)], relative)
+        low = rotated.min(axis=2)
+        high = rotated.max(axis=2)
 
-        return corners
+        return np.stack([low[..., 0], low[..., 2], high[..., 0], high[..., 2]], axis=-1).reshape(-1, 4).tolist()
 
 
     """
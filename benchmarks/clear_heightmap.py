@@ -0,0 +1,73 @@
+"""
+Benchmark Map.calc_clear_heightmap against the original per-column loop.
+
+Both versions run on the same world slice and the results are checked to be identical.
+Run from the repository root with the http interface running:
+    python -m benchmarks.clear_heightmap [x1 z1 x2 z2]
+Without coordinates the current build area is used.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import lib.direct_interface as di
+from lib.worldLoader import WorldSlice
+from util.map import Map
+
+
+def calc_clear_heightmap_loop(world_slice: WorldSlice):
+    """The original column-by-column implementation, kept as the reference"""
+    hm_mbnl = world_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"]
+    heightmapNoTrees = hm_mbnl[:]
+    area = world_slice.rect
+
+    for x in range(area[2]):
+        for z in range(area[3]):
+            while True:
+                y = heightmapNoTrees[x, z]
+                block = world_slice.getBlockAt(
+                    area[0] + x, y - 1, area[1] + z)
+                if block[-4:] == '_log':
+                    heightmapNoTrees[x, z] -= 1
+                else:
+                    break
+
+    return np.array(np.minimum(hm_mbnl, heightmapNoTrees), dtype='uint8')
+
+
+def time_run(function, world_slice, original_heightmap):
+    # both implementations update the world slice heightmap in place, so start from the same state every time
+    world_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"] = original_heightmap.copy()
+    start = time.perf_counter()
+    result = function(world_slice)
+    return result, time.perf_counter() - start
+
+
+def main(args):
+    if len(args) == 4:
+        x1, z1, x2, z2 = map(int, args)
+    else:
+        x1, _, z1, x2, _, z2 = di.requestBuildArea()
+
+    print(f"Loading world slice {x1}, {z1} - {x2}, {z2}")
+    world_slice = WorldSlice(x1, z1, x2, z2, dense=True)
+    original_heightmap = world_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"].copy()
+
+    loop_result, loop_time = time_run(calc_clear_heightmap_loop, world_slice, original_heightmap)
+    vectorized_result, vectorized_time = time_run(Map.calc_clear_heightmap, world_slice, original_heightmap)
+
+    print(f"loop:       {loop_time:8.3f} s")
+    print(f"vectorized: {vectorized_time:8.3f} s ({loop_time / vectorized_time:.1f}x)")
+    if np.array_equal(loop_result, vectorized_result):
+        print("results are identical")
+    else:
+        differences = np.argwhere(loop_result != vectorized_result)
+        print(f"results differ in {len(differences)} columns, first at {tuple(differences[0])}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
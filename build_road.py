@@ -18,9 +18,13 @@ from gdpc import worldLoader as WL
 from numpy import place
 
 from helper_functions import convert_coords
+import lib.interfaceUtils as iu
 
 
-def build_roads(WORLDSLICE, road_map):
+def build_roads(WORLDSLICE, road_map, interface=None):
+    # Blocks are placed through interface, the unbuffered global one by default
+    if interface is None:
+        interface = iu.globalinterface
     roads = []
 
     # find roads by parsing the road_map
@@ -41,7 +45,7 @@ def build_roads(WORLDSLICE, road_map):
         this_lamp_ind = this_lamp_ind - 1
         this_lamp_ind = (this_lamp_ind if this_lamp_ind >= 0 else BUILD_LAMP_EVERY)
         this_lamp_location = build_road(WORLDSLICE, road[0], road[1], 'oak_planks', (this_lamp_ind == 0),
-                                        find_road_orientation(road, road_map))
+                                        find_road_orientation(road, road_map), interface)
         if this_lamp_location != None:
             lamps.append(this_lamp_location)
 
@@ -73,12 +77,13 @@ def point_valid(point, heightmap):
     return True
 
 
-def place_road(x, y, z, base_block, height):
-    GEO.placeCuboid(x, y+1, z, x, y + height, z, 'air')
-    INTF.placeBlock(x, y, z, base_block)
+def place_road(x, y, z, base_block, height, interface):
+    for air_y in range(y+1, y+height+1):
+        interface.setBlock(x, air_y, z, 'air')
+    interface.setBlock(x, y, z, base_block)
 
 
-def build_bridges_and_tunnels(bridge, base_block, height, WORLDSLICE, direction):
+def build_bridges_and_tunnels(bridge, base_block, height, WORLDSLICE, direction, interface=None):
     """
     Inputs:
         bridges (list of list of int): All the points in a bridge to be built
@@ -86,7 +91,10 @@ def build_bridges_and_tunnels(bridge, base_block, height, WORLDSLICE, direction)
         height (int): The number of blocks you want cleared above the desired (x,y,z) bridge/tunnel
         direction (string): either 'along_x' or 'along_z' if that is their direction; if it is neither or None, 
             then the direciton is assumed to be diagonal.
+        interface (Interface): The interface placing the blocks, the unbuffered global one by default.
     """
+    if interface is None:
+        interface = iu.globalinterface
     heights = WORLDSLICE.heightmaps['MOTION_BLOCKING_NO_LEAVES']
     start_x, start_z, _, _ = WORLDSLICE.rect
 
@@ -95,7 +103,7 @@ def build_bridges_and_tunnels(bridge, base_block, height, WORLDSLICE, direction)
     for x, y, z in bridge:
         global_x, global_z = convert_coords((x, z), (start_x, start_z))
 
-        place_road(global_x, y, global_z, base_block, height)
+        place_road(global_x, y, global_z, base_block, height, interface)
 
         # if direction == 'along_z':
         #     if x < len(heights):
@@ -111,7 +119,7 @@ def build_bridges_and_tunnels(bridge, base_block, height, WORLDSLICE, direction)
         #     return None
 
 
-def build_road(WORLDSLICE, x, z, base_block, build_lamp, direction=None):
+def build_road(WORLDSLICE, x, z, base_block, build_lamp, direction=None, interface=None):
     """
 
     Input:
@@ -121,29 +129,32 @@ def build_road(WORLDSLICE, x, z, base_block, build_lamp, direction=None):
         x2 (int): X cordinate of our starting point for our road.
         z2 (int): Z cordinate of our starting point for our road.
         base_block (string): The type of block we want as the base rectangle
+        interface (Interface): The interface placing the blocks, the unbuffered global one by default.
     """
+    if interface is None:
+        interface = iu.globalinterface
 
     heights = WORLDSLICE.heightmaps['MOTION_BLOCKING_NO_LEAVES']
     start_x, start_z, _, _ = WORLDSLICE.rect
 
     this_y = heights[(x, z)]
     global_x, global_z = convert_coords((x, z), (start_x, start_z))
-    place_road(global_x, this_y - 1, global_z, base_block, 5)
+    place_road(global_x, this_y - 1, global_z, base_block, 5, interface)
 
     if direction == 'along_z':
         if x < len(heights):
-            place_road(global_x + 1, this_y - 1, global_z, base_block, 5)
+            place_road(global_x + 1, this_y - 1, global_z, base_block, 5, interface)
         if x > 0:
-            place_road(global_x - 1, this_y - 1, global_z, base_block, 5)
+            place_road(global_x - 1, this_y - 1, global_z, base_block, 5, interface)
             if build_lamp:
                 return (global_x - 1, this_y - 1, global_z)
         return None
 
     if direction == 'along_x':
         if z < len(heights[0]):
-            place_road(global_x, this_y - 1, global_z + 1, base_block, 5)
+            place_road(global_x, this_y - 1, global_z + 1, base_block, 5, interface)
         if z > 0:
-            place_road(global_x, this_y - 1, global_z - 1, base_block, 5)
+            place_road(global_x, this_y - 1, global_z - 1, base_block, 5, interface)
             if build_lamp:
                 return (global_x, this_y - 1, global_z - 1)
         return None
@@ -155,7 +166,7 @@ def build_road(WORLDSLICE, x, z, base_block, build_lamp, direction=None):
         # Ensures our point is in the boudaries
         if point_valid(new_point, heights):
             this_global_x, this_global_z = convert_coords(new_point, (start_x, start_z))
-            place_road(this_global_x, this_y - 1, this_global_z, base_block, 5)
+            place_road(this_global_x, this_y - 1, this_global_z, base_block, 5, interface)
     if build_lamp and point_valid(block_points[0], heights):
         lamp_x, lamp_z = convert_coords(block_points[0], (start_x, start_z))
         return (lamp_x, this_y - 1, lamp_z)
@@ -15,53 +15,81 @@ import lib.interfaceUtils as iu
 import util.worldModification as worlModif
 import json
 from util.map import Map
+from util.biomes import BiomeMap
 
 from place_villagers import place_villagers
 
-def generate_structures(building_locations, referenceCoordinates):
+def generate_structures(building_locations, referenceCoordinates, iu_interface=None, world_slice=None):
     """
     Builds a building at all building locations using building specifications
 
     :param building_locations: List of building specs
     :param heightMap: Grid map of heights in Building Area   
     :param referenceCoordinates: Coordinates of Building Area   
+    :param iu_interface: Interface to place the blocks with, flushed once all structures are built
+    :param world_slice: Slice of the Building Area to read the biomes from, the global slice by default
     """
-    ## Load replacement biome blocks
-    with open("data/biomeBlocks.json") as json_file:
-        biomesBlocks = json.load(json_file)
-
-    # Load in all structures
-    structures = loader.loadAllResources()
+    ## Biomes and their replacement blocks, read once for all buildings
+    if world_slice is None:
+        if iu.globalWorldSlice is None:
+            iu.makeGlobalSlice()
+        world_slice = iu.globalWorldSlice
+    biomeMap = BiomeMap(world_slice)
+
+    # Choose the structures from the catalog, then load only those
+    catalog = loader.loadCatalog()
+    chosenStructs = [chooseStructure(building, catalog) for building in building_locations]
+    structures = loader.loadStructures(chosenStructs, catalog)
 
     # Instantiate modifier API (puts blocks in world)
-    iu_interface = iu.Interface(buffering=True, caching = True)
+    # Full buffers are sent in the background while the next structure is prepared,
+    # with the batch size tuned to the throughput of the server
+    if iu_interface is None:
+        iu_interface = iu.Interface(buffering=True, caching = True, pipelining=True, adaptivebuffer=True)
     worldModifier = worlModif.WorldModification(iu_interface)
 
     # Build structure at every building location using building specs
-    for building in building_locations:
-        buildStructure(building, referenceCoordinates, structures, biomesBlocks, worldModifier)
+    built = []
+    for building, chosenStruct in zip(building_locations, chosenStructs):
+        built.append(buildStructure(building, structures[chosenStruct], referenceCoordinates, biomeMap, worldModifier))
+
+    # Villagers are dropped into the buildings, so every block has to be placed first
+    worldModifier.flush()
+    for struct, xCoordinate, yCoordinate, zCoordinate in built:
+        place_villagers(struct, referenceCoordinates[0] + xCoordinate, yCoordinate+20, referenceCoordinates[2] + zCoordinate)
+
+
+
+def chooseStructure(building, catalog):
+    """
+    Chooses a random structure of the building type whose footprint fits the building radius
 
+    :param building: Building specifications 
+    :param catalog: Catalog of all structures
+    :return: The name of the structure
+    """
+    buildingTypeName = building.building_type.name
+    diameter = building.building_type.radius * 2
+    # any structure of the building type if none fits
+    potentialStructs = catalog.queryFitting(buildingTypeName, diameter, diameter)
+    return random.choice(potentialStructs)
 
 
-def buildStructure(building, referenceCoordinates, structures, biomesBlocks, worlModif):
+def buildStructure(building, struct, referenceCoordinates, biomeMap, worlModif):
     """
     Builds an individual building based off building type
 
     :param building: Building specifications 
-    :param heightMap: Grid map of heights in Building Area   
+    :param struct: Structure chosen for the building, see chooseStructure
     :param referenceCoordinates: Coordinates of Building Area   
-    :param structures: Coordinates of Building Area   
-    :param biomesBlocks: Dictionary of blocks that should be used based off the biome
+    :param biomeMap: Biomes of the Building Area and the blocks that should be used based off the biome
     :param worlModif: API that puts blocks at specific coordinates   
+    :return: The structure and its coordinates, to place villagers once it is built
     """
 
-    # Choose a random structure with building_type
-    buildingTypeName = building.building_type.name
-    potentialStructs = list(structures[buildingTypeName].keys())
-    chosenStruct = random.choice(potentialStructs)
-
     # Get building coordinates
-    struct, size = structures[buildingTypeName][chosenStruct]
+    chosenStruct = struct.name
+    size = struct.size
     xCoordinate = building.x - ((size[0]-2)//2) - 1
     zCoordinate = building.z - ((size[2]-2)//2) - 1
     yCoordinate = building.y
@@ -72,16 +100,11 @@ def buildStructure(building, referenceCoordinates, structures, biomesBlocks, wor
 
 
     # Infer the biome in which the structure will be placed
-    biomeID = util.getNameBiome(util.getBiome(referenceCoordinates[0] + xCoordinate, referenceCoordinates[2]  + zCoordinate, 10, 10))
-    if str(biomeID) not in biomesBlocks:
-        replacementBiomeBlocks = biomesBlocks["0"]
-    else:
-        replacementBiomeBlocks = biomesBlocks[str(biomeID)]
+    replacementBiomeBlocks = biomeMap.get_biome_blocks(referenceCoordinates[0] + xCoordinate, referenceCoordinates[2] + zCoordinate)
 
     
     # Build structure
     struct.build([-xCoordinate, -yCoordinate, -zCoordinate], referenceCoordinates, building.rotation, worlModif, replacementBiomeBlocks)
 
-    # Place villagers
-    place_villagers(struct, referenceCoordinates[0] + xCoordinate, yCoordinate+20, referenceCoordinates[2] + zCoordinate)
+    return struct, xCoordinate, yCoordinate, zCoordinate
    
@@ -2,6 +2,7 @@
 import numpy as np
 from gdpc import interface
 import lib.interfaceUtils as iu
+import lib.chunkCache as chunkCache
 import util.worldModification as worlModif
 
 # Local imports
@@ -34,7 +35,13 @@ def driver():
         build_perimeter_around_BA((sx, sy, sz), (ex, ey, ez))
 
     # Create build area object
-    build_area = BuildArea(sx, sz, ex, ez)
+    # Reuse the chunks of the last run from disk, only valid while the world is left unmodified in between
+    USE_CHUNK_CACHE = False
+    build_area = BuildArea(sx, sz, ex, ez, cache=chunkCache.defaultCache if USE_CHUNK_CACHE else None)
+    # Record the build area for offline planning with BuildArea.from_snapshot, e.g. "snapshots/village"
+    SNAPSHOT_DIR = None
+    if SNAPSHOT_DIR is not None:
+        build_area.worldslice.save_snapshot(SNAPSHOT_DIR)
 
     # Create list of building types
     # NOTE: names here must match names in data/structure_relationshipos/structure_attraction.csv
@@ -59,24 +66,40 @@ def driver():
     if USE_HARD_CODED_BUILDINGS_AND_ROADS:
         building_locations, road_map = hard_code_buildings_and_roads(planner, False)
     else:
-        planner.seed_buildings(goal_buildings=10)
+        # Seed several plans on all cores and keep the best one, 1 seeds a single plan in this process
+        NUM_PARALLEL_PLANS = 1
+        if NUM_PARALLEL_PLANS > 1:
+            planner.seed_best_plan(goal_buildings=10, num_plans=NUM_PARALLEL_PLANS, display_map=True)
+        else:
+            planner.seed_buildings(goal_buildings=10)
         building_locations = planner.building_locations
         road_map = planner.road_map
 
+    # The world is modified from here on, so drop any cached copy of the build area
+    chunkCache.invalidateBlocks(sx, sz, ex, ez)
+
+    # One buffered interface places all blocks, so overlapping writes of land, roads and structures are merged
+    iu_interface = iu.Interface(buffering=True, caching=True, pipelining=True, adaptivebuffer=True)
+
     # For all buildings, prep the land and build a base
-    prep_land(building_locations, planner)
+    prep_land(building_locations, planner, iu_interface)
 
     # Build roads, bridges & tunnels
-    lamp_locations = build_roads(build_area.worldslice, road_map)
+    lamp_locations = build_roads(build_area.worldslice, road_map, iu_interface)
     for bridge, direction in planner.bridges:
-        build_bridges_and_tunnels(bridge, 'oak_planks', 3, build_area.worldslice, direction)
+        build_bridges_and_tunnels(bridge, 'oak_planks', 3, build_area.worldslice, direction, iu_interface)
 
     # Build structures at all building seeds
     referenceCoordinates = [sx, sy, sz]
     generate_structures(
         building_locations,
-        referenceCoordinates
+        referenceCoordinates,
+        iu_interface,
+        build_area.worldslice
     )
+    write_stats = iu_interface.getWriteStats()
+    print(f"Placed {write_stats['writes'] - write_stats['eliminated']} of {write_stats['writes']} block writes, "
+          f"{write_stats['coalesced']} overwritten before sending, {write_stats['unchanged']} unchanged")
 
 
 
@@ -1,10 +1,12 @@
 #! /usr/bin/python3
 """### Read the bitarray format used by Minecraft."""
-__all__ = ['BitArray']
+__all__ = ['BitArray', 'unpackLongArray']
 __version__ = 'v4.2_dev'
 
 from math import floor
 
+import numpy as np
+
 
 def inclusiveBetween(start, end, value):
     """**Raise an exception when the value is out of bounds**."""
@@ -14,6 +16,26 @@ def inclusiveBetween(start, end, value):
             f"of {start} to {end}")
 
 
+def unpackLongArray(longArray, bitsPerEntry, arraySize):
+    """**Decode one or more packed long arrays in a single vectorised pass**.
+
+    longArray may be a sequence of longs or a 2D array with one packed
+    array per row. Entries do not span longs, matching BitArray.getAt.
+    Returns a uint16 (or uint32 for more than 16 bits per entry) array
+    of shape (..., arraySize).
+    """
+    inclusiveBetween(1, 32, bitsPerEntry)
+    entriesPerLong = 64 // bitsPerEntry
+    longs = np.asarray(longArray, dtype=np.int64).view(np.uint64)
+    shifts = np.arange(entriesPerLong, dtype=np.uint64) \
+        * np.uint64(bitsPerEntry)
+    mask = np.uint64((1 << bitsPerEntry) - 1)
+    entries = (longs[..., np.newaxis] >> shifts) & mask
+    entries = entries.reshape(longs.shape[:-1] + (-1,))[..., :arraySize]
+    dtype = np.uint16 if bitsPerEntry <= 16 else np.uint32
+    return entries.astype(dtype)
+
+
 class BitArray:
     """**Store an array of binary values and its metrics**.
 
@@ -39,6 +61,7 @@ class BitArray:
             self.longArray = data
         else:
             self.longArray = []  # length j
+        self._unpacked = None
 
     # __repr__ displays the class well enough so __str__ is omitted
     def __repr__(self):
@@ -58,6 +81,18 @@ class BitArray:
         k = (index - i * self.entriesPerLong) * self.bitsPerEntry
         return j >> k & self.maxEntryValue
 
+    def getAll(self):
+        """**Return every stored value as a numpy array**.
+
+        The array is decoded once and reused on later calls.
+        """
+        if self._unpacked is None:
+            self._unpacked = unpackLongArray(
+                np.fromiter(self.longArray, dtype=np.int64,
+                            count=len(self.longArray)),
+                self.bitsPerEntry, self.arraySize)
+        return self._unpacked
+
     def size(self):
         """**Return self.arraySize**."""
         return self.arraySize
@@ -0,0 +1,140 @@
+#! /usr/bin/python3
+"""### Persistent on-disk cache of decoded chunk data.
+Each entry holds the decoded heightmaps, block states, palettes and biomes
+of one chunk rect in a single .npz file, so a WorldSlice of the same area
+can be rebuilt without requesting and parsing the chunks again.
+Entries overlapping modified chunks are dropped by the invalidate functions.
+Only changes made through this package invalidate entries, so the cache is
+only valid while nothing else modifies the world between runs.
+Entries are keyed by the world they were read from, see currentWorld.
+"""
+__all__ = ['ChunkCache', 'currentWorld', 'defaultCache', 'invalidateBlocks']
+__version__ = 'v4.2_dev'
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import lib.direct_interface as di
+
+DEFAULT_DIRECTORY = os.path.join("cache", "chunks")
+# bump when the layout of the stored arrays changes
+FORMAT_VERSION = 1
+INDEX_FILE = "index.json"
+
+# seed of the world served at each address, asked once
+_worldSeeds = {}
+
+
+def currentWorld():
+    """**Return an identity of the world served by the HTTP interface**.
+    Made of the host, port and seed of the world.
+    """
+    address = f"{di.HOST}:{di.PORT}"
+    if address not in _worldSeeds:
+        response = di.runCommand("seed")
+        if response == "connection error":
+            return address
+        _worldSeeds[address] = response.strip()
+    return f"{address}|{_worldSeeds[address]}"
+
+
+class ChunkCache:
+    """**Stores decoded chunk data keyed by chunk rect**."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, world=currentWorld):
+        """**Use the cache in a directory**.
+        world returns the identity of the world the chunks are read from.
+        """
+        self.directory = directory
+        self.world = world
+        self._index = None
+
+    def __repr__(self):
+        return f"ChunkCache({repr(self.directory)})"
+
+    def key(self, chunkRect, heightmapTypes):
+        """**Return the file name of the entry for a chunk rect**."""
+        description = f"{FORMAT_VERSION}|{self.world()}|{tuple(chunkRect)}|" \
+            f"{','.join(sorted(heightmapTypes))}"
+        return hashlib.sha1(description.encode()).hexdigest() + ".npz"
+
+    def load(self, chunkRect, heightmapTypes):
+        """**Return the cached arrays of a chunk rect or None**."""
+        name = self.key(chunkRect, heightmapTypes)
+        if name not in self._loadIndex():
+            return None
+        try:
+            with np.load(os.path.join(self.directory, name)) as entry:
+                return {key: entry[key] for key in entry.files}
+        except (OSError, ValueError) as e:
+            print(f"Dropping unreadable chunk cache entry {name}: {e}")
+            self._remove(name)
+            return None
+
+    def store(self, chunkRect, heightmapTypes, data):
+        """**Write the arrays of a chunk rect to the cache**."""
+        os.makedirs(self.directory, exist_ok=True)
+        name = self.key(chunkRect, heightmapTypes)
+        path = os.path.join(self.directory, name)
+        # write next to the entry first so an interrupted run never
+        # leaves a truncated file behind under the real name
+        temporaryPath = path + ".tmp"
+        with open(temporaryPath, 'wb') as file:
+            np.savez_compressed(file, **data)
+        os.replace(temporaryPath, path)
+        self._loadIndex()[name] = list(chunkRect)
+        self._saveIndex()
+
+    def invalidateChunks(self, cx1, cz1, cx2, cz2):
+        """**Drop all entries overlapping the inclusive chunk range**."""
+        index = self._loadIndex()
+        stale = [name for name, (x, z, dx, dz) in index.items()
+                 if x <= cx2 and cx1 < x + dx and z <= cz2 and cz1 < z + dz]
+        for name in stale:
+            self._remove(name)
+        return len(stale)
+
+    def invalidateBlocks(self, x1, z1, x2, z2):
+        """**Drop all entries overlapping the inclusive block range**."""
+        return self.invalidateChunks(min(x1, x2) >> 4, min(z1, z2) >> 4,
+                                     max(x1, x2) >> 4, max(z1, z2) >> 4)
+
+    def clear(self):
+        """**Drop every entry**."""
+        for name in list(self._loadIndex()):
+            self._remove(name)
+
+    def _loadIndex(self):
+        if self._index is None:
+            self._index = {}
+            path = os.path.join(self.directory, INDEX_FILE)
+            if os.path.exists(path):
+                with open(path) as file:
+                    self._index = json.load(file)
+        return self._index
+
+    def _saveIndex(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, INDEX_FILE), 'w') as file:
+            json.dump(self._index, file)
+
+    def _remove(self, name):
+        self._loadIndex().pop(name, None)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        self._saveIndex()
+
+
+defaultCache = ChunkCache()
+
+
+def invalidateBlocks(x1, z1, x2, z2):
+    """**Drop entries of the default cache overlapping modified blocks**."""
+    if not os.path.isdir(defaultCache.directory):
+        return 0
+    return defaultCache.invalidateBlocks(x1, z1, x2, z2)
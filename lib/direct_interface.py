@@ -6,28 +6,136 @@ This file contains various functions that map directly onto the HTTP interface.
 __all__ = []
 __version__ = "v4.2_dev"
 
+import time
+
 import requests
-from requests.exceptions import ConnectionError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
 from socket import *
+from urllib3.exceptions import NewConnectionError
+
+HOST = "localhost"
+PORT = 9000
+# (connect, read) timeouts in seconds, chunk requests of large areas are slow
+TIMEOUT = (5, 120)
+# failed requests are repeated this often, waiting BACKOFF * 2 ** attempt
+RETRIES = 3
+BACKOFF = 0.25
+# methods that are safe to send twice, any other method is only repeated
+#   when it never reached the server, see request
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT'}
+# start of the response of sendBlocks when the request never got an answer
+REQUEST_FAILED = "Request failed"
+
+# one keep-alive session shared by all requests instead of a connection each
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+# method and path -> [requests, failures, total seconds, max seconds]
+latencies = {}
+
+
+def setHost(host="localhost", port=9000):
+    """**Point all requests at another HTTP interface**."""
+    global HOST, PORT
+    HOST, PORT = host, port
+
+
+def getLatencyStats():
+    """**Return request counts and latencies per endpoint**."""
+    return {endpoint: {"requests": count, "failures": failures,
+                       "total": total, "mean": total / max(count, 1),
+                       "max": longest}
+            for endpoint, (count, failures, total, longest)
+            in latencies.items()}
+
+
+def resetLatencyStats():
+    """**Clear the latency counters**."""
+    latencies.clear()
+
+
+def _neverSent(error):
+    """**Return whether a failed request never reached the server**."""
+    if isinstance(error, ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    # the connection pool wraps the cause in a MaxRetryError
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
+
+def request(method, path, retries=None, **kwargs):
+    """**Send a request through the shared session**.
+
+    Connection errors and timeouts are retried with exponential backoff,
+        the last one is raised once all retries failed.
+    Other methods than IDEMPOTENT_METHODS, e.g. POST /command, are only
+        retried if they never reached the server, so a slow response does
+        not run a command twice.
+    """
+    if retries is None:
+        retries = RETRIES
+    url = f'http://{HOST}:{PORT}{path}'
+    stats = latencies.setdefault(f'{method.upper()} {path}', [0, 0, 0.0, 0.0])
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=TIMEOUT, **kwargs)
+        except (ConnectionError, Timeout) as e:
+            stats[1] += 1
+            if attempt == retries or (method.upper() not in IDEMPOTENT_METHODS
+                                      and not _neverSent(e)):
+                raise
+            print(f"Request failed: {e} Retrying ({retries - attempt} left)")
+            time.sleep(BACKOFF * 2 ** attempt)
+            continue
+        finally:
+            elapsed = time.perf_counter() - start
+            stats[0] += 1
+            stats[2] += elapsed
+            stats[3] = max(stats[3], elapsed)
+        return response
 
 
 def getBlock(x, y, z):
     """**Return the name of a block from the world**."""
-
-    url = f'http://localhost:9000/blocks?x={x}&y={y}&z={z}'
     try:
-        response = requests.get(url).text
-    except ConnectionError:
+        response = request('get', '/blocks',
+                           params={'x': x, 'y': y, 'z': z}).text
+    except (ConnectionError, Timeout):
         return "minecraft:void_air"
     return response
 
 
-def setBlock(x, y, z, blockStr, flags='0100011'):
+def getBlocks(x1, y1, z1, x2, y2, z2):
+    """**Return the blocks of an inclusive box from the world**.
+
+    The chunks covering the box are fetched in one request, see getChunks.
+    Returns an (X, Y, Z) array of block ids and the names they index into,
+        heights outside 0 to 255 are left out.
+    Sections missing from the chunk data, usually all air, are void_air.
+    """
+    # worldLoader imports this module, so it can only be imported here
+    from lib.worldLoader import WorldSlice
+
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    z1, z2 = sorted((z1, z2))
+    worldSlice = WorldSlice(x1, z1, x2 + 1, z2 + 1, heightmapTypes=[],
+                            dense=True)
+    blockIds = worldSlice.getBlocksInBox(x1, y1, z1, x2, y2, z2).copy()
+    return blockIds, worldSlice.blockNames
+
+
+def setBlock(x, y, z, blockStr, flags='0100011', retries=None):
     """**Place one or multiple blocks in the world**."""
-    url = f'http://localhost:9000/blocks?x={x}&y={y}&z={z}&customFlags={flags}'
     try:
-        response = requests.put(url, blockStr)
-    except ConnectionError:
+        response = request('put', '/blocks', retries,
+                           params={'x': x, 'y': y, 'z': z,
+                                   'customFlags': flags},
+                           data=blockStr)
+    except (ConnectionError, Timeout):
         return "0"
     return response.text
 
@@ -36,21 +144,21 @@ def sendBlocks(blockList, x=0, y=0, z=0, retries=5, flags='0100011'):
     """**Take a list of blocks and place them into the world in one go**."""
     body = str.join("\n", ['~{} ~{} ~{} {}'.format(*bp) for bp in blockList])
     try:
-        response = setBlock(x, y, z, body, flags)
-        return response
-    except ConnectionError as e:
-        print("Request failed: {} Retrying ({} left)".format(e, retries))
-        if retries > 0:
-            return sendBlocks(x, y, z, retries - 1)
-    return False
+        response = request('put', '/blocks', retries,
+                           params={'x': x, 'y': y, 'z': z,
+                                   'customFlags': flags},
+                           data=body)
+    except (ConnectionError, Timeout) as e:
+        # not numeric, so the caller keeps its buffer
+        return f"{REQUEST_FAILED}: {e}"
+    return response.text
 
 
 def runCommand(command):
     """**Run a Minecraft command in the world**."""
-    url = 'http://localhost:9000/command'
     try:
-        response = requests.post(url, bytes(command, "utf-8"))
-    except ConnectionError:
+        response = request('post', '/command', data=bytes(command, "utf-8"))
+    except (ConnectionError, Timeout):
         return "connection error"
     return response.text
 
@@ -58,7 +166,7 @@ def runCommand(command):
 def requestBuildArea():
     """**Return the building area**."""
     area = 0, 0, 0, 128, 256, 128   # default area for beginners
-    response = requests.get('http://localhost:9000/buildarea')
+    response = request('get', '/buildarea')
     if response.ok:
         buildArea = response.json()
         if buildArea != -1:
@@ -77,9 +185,10 @@ def requestBuildArea():
 
 def getChunks(x, z, dx, dz, rtype='text'):
     """**Get raw chunk data**."""
-    url = f'http://localhost:9000/chunks?x={x}&z={z}&dx={dx}&dz={dz}'
     acceptType = 'application/octet-stream' if rtype == 'bytes' else 'text/raw'
-    response = requests.get(url, headers={"Accept": acceptType})
+    response = request('get', '/chunks',
+                       params={'x': x, 'z': z, 'dx': dx, 'dz': dz},
+                       headers={"Accept": acceptType})
     if response.status_code >= 400:
         print(f"Error: {response.text}")
 
@@ -6,23 +6,36 @@ This module contains functions to:
 * Get the name of a block at a particular coordinate
 * Place blocks in the world
 """
-__all__ = ['Interface', 'requestBuildArea', 'requestPlayerArea', 'runCommand',
+__all__ = ['Interface', 'AdaptiveBatchSize', 'requestBuildArea', 'requestPlayerArea', 'runCommand',
            'isBuffering', 'setBuffering', 'getBufferLimit', 'setBufferLimit',
            'isCaching', 'setCaching', 'getCacheLimit', 'setCacheLimit',
-           'getBlock', 'fill', 'setBlock', 'sendBlocks']
+           'getBlock', 'getBlocksAt', 'fill', 'setBlock', 'sendBlocks',
+           'flush', 'DecayMap', 'BlockCache', 'WrittenBlocks']
 __version__ = "v4.2_dev"
 
+import time
 from collections import OrderedDict
+from itertools import product
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from random import choice
 
 from collections import OrderedDict
 from random import choice
 
+import lib.chunkCache as chunkCache
 import lib.direct_interface as di
 import numpy as np
 from lib.lookup import TCOLORS
 from lib.worldLoader import WorldSlice
 
+# most blocks a single /fill may change, the server's default limit
+FILL_VOLUME_LIMIT = 32768
+# /fill commands sent in one request, one command per line
+FILL_COMMANDS_PER_REQUEST = 64
+# chunks a region read of getBlocksAt may fetch per chunk holding a missing
+#   block, scattered blocks are read chunk by chunk instead
+READ_CHUNKS_PER_CHUNK = 2
+
 
 class OrderedByLookupDict(OrderedDict):
     """Limit size, evicting the least recently looked-up key when full.
@@ -50,6 +63,380 @@ class OrderedByLookupDict(OrderedDict):
             del self[oldest]
 
 
+class InternTable:
+    """**Number distinct block strings, 0 stands for no block**."""
+
+    def __init__(self):
+        self.names = [None]
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.names) - 1
+
+    def intern(self, name):
+        """**Return the id of a block string, adding it when new**."""
+        blockId = self.ids.get(name)
+        if blockId is None:
+            blockId = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return blockId
+
+
+class BlockCache:
+    """**Map global positions to block strings**.
+    Inside the area the strings are interned and their ids kept in one
+        dense array, allocated on first use, so nothing is evicted there
+    The highest bit of each id marks blocks written by the interface,
+        see WrittenBlocks, so one array serves both
+    The array takes 2 bytes per position, 4 once more distinct blocks than
+        16 bit ids can number were seen, about 34 MB for a 257x256x257 area
+    Outside the area an OrderedByLookupDict of maxsize entries is used
+    """
+
+    def __init__(self, maxsize=8192, area=None):
+        """**Cover the area from x1, y1, z1 up to but excluding x2, y2, z2**."""
+        self.outside = OrderedByLookupDict(maxsize)
+        self.table = InternTable()
+        self.origin = (0, 0, 0) if area is None else tuple(area[:3])
+        self.shape = (0, 0, 0) if area is None else tuple(
+            max(0, area[i + 3] - area[i]) for i in range(3))
+        self.blockIds = None
+        # highest bit of the ids, marks the blocks written by the interface
+        self.writtenBit = 1 << 15
+
+    def __repr__(self):
+        x1, y1, z1 = self.origin
+        dx, dy, dz = self.shape
+        return f"BlockCache({self.maxsize}, " \
+            f"({x1}, {y1}, {z1}, {x1 + dx}, {y1 + dy}, {z1 + dz}))"
+
+    @property
+    def maxsize(self):
+        """**Size limit of the blocks cached outside the area**."""
+        return self.outside.maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        self.outside.maxsize = value
+
+    def index(self, key):
+        """**Return the array index of a position or None if outside**."""
+        x, y, z = key
+        x -= self.origin[0]
+        y -= self.origin[1]
+        z -= self.origin[2]
+        dx, dy, dz = self.shape
+        if 0 <= x < dx and 0 <= y < dy and 0 <= z < dz:
+            return x, y, z
+        return None
+
+    def __blockId(self, index):
+        """**Return the id at an array index without the written mark**."""
+        if self.blockIds is None:
+            return 0
+        return int(self.blockIds[index]) & (self.writtenBit - 1)
+
+    def __len__(self):
+        inside = 0 if self.blockIds is None \
+            else int(np.count_nonzero(self.blockIds))
+        return inside + len(self.outside)
+
+    def __contains__(self, key):
+        index = self.index(key)
+        if index is None:
+            return key in self.outside
+        return self.__blockId(index) != 0
+
+    def __getitem__(self, key):
+        index = self.index(key)
+        if index is None:
+            return self.outside[key]
+        blockId = self.__blockId(index)
+        if blockId == 0:
+            raise KeyError(key)
+        return self.table.names[blockId]
+
+    def __setitem__(self, key, value):
+        index = self.index(key)
+        if index is None:
+            self.outside[key] = value
+            return
+        self.__store(index, value, False)
+
+    def __store(self, index, value, written):
+        """**Store a block string at an array index with its mark**."""
+        blockId = self.table.intern(value)
+        if self.blockIds is None:
+            self.blockIds = np.zeros(self.shape, dtype=np.uint16)
+        elif blockId >= self.writtenBit and self.blockIds.dtype == np.uint16:
+            # more distinct blocks than 15 bit ids can number,
+            #   the marks move to the new highest bit
+            marks = self.blockIds >= self.writtenBit
+            self.blockIds = self.blockIds.astype(np.uint32)
+            self.blockIds[marks] ^= self.writtenBit
+            self.writtenBit = 1 << 31
+            self.blockIds[marks] |= self.writtenBit
+        self.blockIds[index] = blockId | (self.writtenBit if written else 0)
+
+    def __delitem__(self, key):
+        index = self.index(key)
+        if index is None:
+            del self.outside[key]
+        elif key not in self:
+            raise KeyError(key)
+        else:
+            self.blockIds[index] = 0
+
+    def get(self, key, default=None):
+        """**Return the block string at a position or default**."""
+        index = self.index(key)
+        if index is None:
+            return self.outside.get(key, default)
+        blockId = self.__blockId(index)
+        return default if blockId == 0 else self.table.names[blockId]
+
+    def isWritten(self, index):
+        """**Check the written mark at an array index, see index**."""
+        return self.blockIds is not None \
+            and bool(self.blockIds[index] & self.writtenBit)
+
+    def markWritten(self, index, value):
+        """**Store a block string at an array index as written**."""
+        self.__store(index, value, True)
+
+    def unmarkWritten(self, index):
+        """**Clear the written mark at an array index, keeping the block**."""
+        if self.blockIds is not None:
+            self.blockIds[index] &= self.writtenBit - 1
+
+    def forgetBox(self, x1, y1, z1, x2, y2, z2):
+        """**Drop all blocks of an inclusive box**."""
+        x1, x2 = sorted((x1, x2))
+        y1, y2 = sorted((y1, y2))
+        z1, z2 = sorted((z1, z2))
+        if self.blockIds is not None:
+            ox, oy, oz = self.origin
+            self.blockIds[max(x1 - ox, 0):max(x2 + 1 - ox, 0),
+                          max(y1 - oy, 0):max(y2 + 1 - oy, 0),
+                          max(z1 - oz, 0):max(z2 + 1 - oz, 0)] = 0
+        for x, y, z in [p for p in self.outside
+                        if x1 <= p[0] <= x2 and y1 <= p[1] <= y2
+                        and z1 <= p[2] <= z2]:
+            del self.outside[(x, y, z)]
+
+    def clear(self):
+        """**Drop all blocks**."""
+        self.blockIds = None
+        self.writtenBit = 1 << 15
+        self.outside.clear()
+
+
+class WrittenBlocks:
+    """**Map global positions to the block strings placed there**.
+    Inside the area of the cache a written block is its cache entry with
+        the written mark set, so no second array is needed
+    Outside the area an own OrderedByLookupDict of maxsize entries is used,
+        as the cache may evict entries there independently
+    """
+
+    def __init__(self, cache, maxsize=8192):
+        self.cache = cache
+        self.outside = OrderedByLookupDict(maxsize)
+
+    def __repr__(self):
+        return f"WrittenBlocks({repr(self.cache)}, {self.maxsize})"
+
+    @property
+    def maxsize(self):
+        """**Size limit of the blocks kept outside the area**."""
+        return self.outside.maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        self.outside.maxsize = value
+
+    def __len__(self):
+        blockIds = self.cache.blockIds
+        inside = 0 if blockIds is None \
+            else int(np.count_nonzero(blockIds & self.cache.writtenBit))
+        return inside + len(self.outside)
+
+    def __contains__(self, key):
+        index = self.cache.index(key)
+        if index is None:
+            return key in self.outside
+        return self.cache.isWritten(index)
+
+    def __getitem__(self, key):
+        index = self.cache.index(key)
+        if index is None:
+            return self.outside[key]
+        if not self.cache.isWritten(index):
+            raise KeyError(key)
+        return self.cache[key]
+
+    def __setitem__(self, key, value):
+        index = self.cache.index(key)
+        if index is None:
+            self.outside[key] = value
+        else:
+            self.cache.markWritten(index, value)
+
+    def __delitem__(self, key):
+        index = self.cache.index(key)
+        if index is None:
+            del self.outside[key]
+        elif not self.cache.isWritten(index):
+            raise KeyError(key)
+        else:
+            self.cache.unmarkWritten(index)
+
+    def get(self, key, default=None):
+        """**Return the block string placed at a position or default**."""
+        return self[key] if key in self else default
+
+    def forgetBox(self, x1, y1, z1, x2, y2, z2):
+        """**Drop all blocks of an inclusive box outside the area**.
+        Inside the area use BlockCache.forgetBox, which drops the marks too
+        """
+        x1, x2 = sorted((x1, x2))
+        y1, y2 = sorted((y1, y2))
+        z1, z2 = sorted((z1, z2))
+        for x, y, z in [p for p in self.outside
+                        if x1 <= p[0] <= x2 and y1 <= p[1] <= y2
+                        and z1 <= p[2] <= z2]:
+            del self.outside[(x, y, z)]
+
+    def clear(self):
+        """**Drop all blocks outside the area**."""
+        self.outside.clear()
+
+
+class DecayMap:
+    """**Track which blocks of an area changed since it was loaded**.
+    Coordinates are global and may be scalars or arrays
+    Positions outside the area always count as decayed
+    """
+
+    def __init__(self, x1, y1, z1, x2, y2, z2):
+        """**Cover the area from x1, y1, z1 up to but excluding x2, y2, z2**."""
+        self.origin = x1, y1, z1
+        self.decayed = np.zeros((x2 - x1, y2 - y1, z2 - z1), dtype=bool)
+
+    def __repr__(self):
+        x1, y1, z1 = self.origin
+        dx, dy, dz = self.decayed.shape
+        return f"DecayMap({x1}, {y1}, {z1}, {x1 + dx}, {y1 + dy}, {z1 + dz})"
+
+    def __local(self, x, y, z):
+        """**Return local index arrays and which of them lie inside**."""
+        x = np.asarray(x) - self.origin[0]
+        y = np.asarray(y) - self.origin[1]
+        z = np.asarray(z) - self.origin[2]
+        dx, dy, dz = self.decayed.shape
+        inside = (0 <= x) & (x < dx) & (0 <= y) & (y < dy) \
+            & (0 <= z) & (z < dz)
+        return x, y, z, inside
+
+    def mark(self, x, y, z):
+        """**Mark positions as decayed, ignoring those outside**."""
+        if type(x) is int and type(y) is int and type(z) is int:
+            # single blocks are the common case, skip the array overhead
+            x, y, z = (x - self.origin[0], y - self.origin[1],
+                       z - self.origin[2])
+            dx, dy, dz = self.decayed.shape
+            if 0 <= x < dx and 0 <= y < dy and 0 <= z < dz:
+                self.decayed[x, y, z] = True
+            return
+        x, y, z, inside = self.__local(x, y, z)
+        self.decayed[x[inside], y[inside], z[inside]] = True
+
+    def markBox(self, x1, y1, z1, x2, y2, z2):
+        """**Mark an inclusive box as decayed, clipped to the area**."""
+        x1, x2 = sorted((x1 - self.origin[0], x2 - self.origin[0]))
+        y1, y2 = sorted((y1 - self.origin[1], y2 - self.origin[1]))
+        z1, z2 = sorted((z1 - self.origin[2], z2 - self.origin[2]))
+        self.decayed[max(x1, 0):max(x2 + 1, 0), max(y1, 0):max(y2 + 1, 0),
+                     max(z1, 0):max(z2 + 1, 0)] = True
+
+    def query(self, x, y, z):
+        """**Return whether positions are decayed or outside the area**."""
+        x, y, z, inside = self.__local(x, y, z)
+        result = np.ones(inside.shape, dtype=bool)
+        result[inside] = self.decayed[x[inside], y[inside], z[inside]]
+        return result if result.ndim else bool(result)
+
+    def reset(self):
+        """**Mark the whole area as unchanged**."""
+        self.decayed[:] = False
+
+
+class AdaptiveBatchSize:
+    """**Tune the number of blocks per batch to the server's speed**.
+    Hill-climbs on blocks per second: the size keeps moving in one
+        direction while throughput holds and turns around when it drops.
+    Failed requests halve the size.
+    """
+
+    def __init__(self, size=1024, minimum=128, maximum=8192,
+                 step=1.25, smoothing=0.3):
+        self.size = min(maximum, max(minimum, size))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.smoothing = smoothing
+        # smoothed measurements of recent batches, None before the first
+        self.latency = None
+        self.throughput = None
+        self.errorRate = 0.0
+        # totals over all recorded batches
+        self.batches = 0
+        self.blocks = 0
+        self.seconds = 0.0
+        self.__direction = 1
+
+    def __repr__(self):
+        return f"AdaptiveBatchSize({self.size}, {self.minimum}, " \
+            f"{self.maximum}, {self.step}, {self.smoothing})"
+
+    def totalThroughput(self):
+        """**Return the blocks per second over all batches**."""
+        return self.blocks / self.seconds if self.seconds > 0 else 0.0
+
+    def record(self, blocks, seconds, failed=False):
+        """**Record one sent batch and return the new batch size**."""
+        self.batches += 1
+        self.blocks += blocks
+        self.seconds += seconds
+        a = self.smoothing
+        self.errorRate = (1 - a) * self.errorRate + a * failed
+        if failed:
+            self.__direction = -1
+            self.size = max(self.minimum, self.size // 2)
+            return self.size
+
+        self.latency = seconds if self.latency is None \
+            else (1 - a) * self.latency + a * seconds
+        throughput = blocks / max(seconds, 1e-6)
+        # partial batches, e.g. from a flush, say little about the size
+        if blocks < self.size // 2:
+            return self.size
+        if self.throughput is not None and throughput < 0.95 * self.throughput:
+            self.__direction = -self.__direction
+        self.throughput = throughput if self.throughput is None \
+            else (1 - a) * self.throughput + a * throughput
+        self.size = int(min(self.maximum, max(
+            self.minimum, self.size * self.step ** self.__direction)))
+        return self.size
+
+
+def timedSendBlocks(blockList, x=0, y=0, z=0, retries=5):
+    """**Send blocks, returning the response and the seconds taken**."""
+    start = time.perf_counter()
+    response = di.sendBlocks(blockList, x, y, z, retries)
+    return response, time.perf_counter() - start
+
+
 class Interface():
     """**Provides tools for interacting with the HTML interface**.
     All function parameters and returns are in local coordinates.
@@ -57,20 +444,48 @@ class Interface():
 
     def __init__(self, x=0, y=0, z=0,
                  buffering=False, bufferlimit=1024,
-                 caching=False, cachelimit=8192):
-        """**Initialise an interface with offset and buffering**."""
+                 caching=False, cachelimit=8192,
+                 pipelining=False, inflightlimit=4,
+                 adaptivebuffer=False):
+        """**Initialise an interface with offset and buffering**.
+
+        With pipelining, full buffers are sent by background threads
+            with up to inflightlimit batches in flight, see flush.
+        With adaptivebuffer, bufferlimit is only the starting size and is
+            tuned to the measured throughput, see Interface.batchSize.
+        Buffered writes to the same block replace each other before sending.
+        With caching, writes of the block this interface last placed at
+            the same position are dropped, see getWriteStats.
+        """
         self.offset = x, y, z
         self.__buffering = buffering
         self.bufferlimit = bufferlimit
-        self.buffer = []    # buffer is in global coordinates
+        self.batchSize = AdaptiveBatchSize(bufferlimit) \
+            if adaptivebuffer else None
+        # buffer maps global coordinates to block strings
+        self.buffer = {}
         self.caching = caching
-        # cache is in global coordinates
-        self.cache = OrderedByLookupDict(cachelimit)
-        # Interface.cache.maxsize to change size
+        # cache is in global coordinates, dense over the build area
+        area = cacheArea()
+        self.cache = BlockCache(cachelimit, area)
+        # Interface.cache.maxsize to change size outside the build area
+        # blocks placed by this interface, in global coordinates
+        # unlike the cache this holds no blocks read from the world,
+        #   whose names lack the block states
+        # inside the build area these are marks in the cache array
+        self.written = WrittenBlocks(self.cache, cachelimit)
+        self.writeStats = {"writes": 0, "coalesced": 0, "unchanged": 0}
+        self.pipelining = pipelining
+        self.inflightlimit = inflightlimit
+        self.__sender = None
+        # batches in flight as (future, set of global coordinates, blocks)
+        self.__inflight = []
 
     def __del__(self):
         """**Clean up before destruction**."""
-        self.sendBlocks()
+        self.flush()
+        if self.__sender is not None:
+            self.__sender.shutdown()
 
     # __repr__ displays the class well enough so __str__ is omitted
     def __repr__(self):
@@ -89,55 +504,161 @@ class Interface():
         if self.caching and (x, y, z) in self.cache:
             return self.cache[(x, y, z)]
 
-        if self.caching and globalWorldSlice is not None:
-            dx, dy, dz = global2buildlocal(x, y, z)  # convert for decay index
-            if not checkOutOfBounds(x, y, z) and not globalDecay[dx][dy][dz]:
-                block = globalWorldSlice.getBlockAt(x, y, z)
-                self.cache[(x, y, z)] = block
-                return block
+        if self.caching and globalWorldSlice is not None \
+                and not globalDecay.query(x, y, z):
+            block = globalWorldSlice.getBlockAt(x, y, z)
+            self.cache[(x, y, z)] = block
+            return block
         response = di.getBlock(x, y, z)
         if self.caching:
             self.cache[(x, y, z)] = response
 
         return response
 
+    def getBlocksAt(self, positions):
+        """**Return the names of the blocks at a sequence of positions**.
+        Blocks still unchanged in the global slice are read in one call,
+            the rest with region reads, see di.getBlocks
+        Scattered blocks are read chunk by chunk, see READ_CHUNKS_PER_CHUNK
+        Takes local coordinates, works with global coordinates
+        """
+        positions = np.asarray(positions, dtype=int).reshape(-1, 3) \
+            + np.asarray(self.offset)
+        names = [None] * len(positions)
+        if self.caching:
+            for i, position in enumerate(map(tuple, positions.tolist())):
+                if position in self.cache:
+                    names[i] = self.cache[position]
+
+        if self.caching and globalWorldSlice is not None:
+            missing = np.array([name is None for name in names], dtype=bool)
+            xs, ys, zs = positions.T
+            fresh = missing & ~globalDecay.query(xs, ys, zs)
+            blockIds = globalWorldSlice.getBlockIdsAt(
+                xs[fresh], ys[fresh], zs[fresh])
+            for i, blockId in zip(np.flatnonzero(fresh).tolist(),
+                                  blockIds.tolist()):
+                names[i] = globalWorldSlice.blockNames[blockId]
+                self.cache[tuple(positions[i].tolist())] = names[i]
+
+        missing = np.array([i for i, name in enumerate(names) if name is None
+                            and 0 <= positions[i, 1] < 256], dtype=int)
+        if len(missing) > 1:
+            # region reads instead of a request per block, one over their
+            #   bounding box unless it fetches too many unneeded chunks
+            chunks = positions[missing][:, [0, 2]] >> 4
+            touched, group = np.unique(chunks, axis=0, return_inverse=True)
+            spanned = np.prod(chunks.max(axis=0) - chunks.min(axis=0) + 1)
+            if spanned <= READ_CHUNKS_PER_CHUNK * len(touched):
+                groups = [missing]
+            else:
+                group = group.ravel()
+                groups = [missing[group == g] for g in range(len(touched))]
+            for indices in groups:
+                self.__readBlocks(positions, indices, names)
+
+        for i, name in enumerate(names):
+            if name is None:
+                names[i] = di.getBlock(*positions[i].tolist())
+                if self.caching:
+                    self.cache[tuple(positions[i].tolist())] = names[i]
+        return names
+
+    def __readBlocks(self, positions, indices, names):
+        """**Read the blocks at positions[indices] with one region read**."""
+        box = positions[indices]
+        low = box.min(axis=0)
+        blockIds, blockNames = di.getBlocks(*low, *box.max(axis=0))
+        box -= low
+        for i, blockId in zip(indices.tolist(), blockIds[
+                box[:, 0], box[:, 1], box[:, 2]].tolist()):
+            names[i] = blockNames[blockId]
+            if self.caching:
+                self.cache[tuple(positions[i].tolist())] = names[i]
+
     def fill(self, x1, y1, z1, x2, y2, z2, replaceBlock):
         """**Fill the given region with the given block**.
         Supports sequences of block strings for random texturing
+        A single block is placed with /fill commands, see fillCommands
         Works with local coordinates
         """
-        from lib.toolbox import loop3d
         textured = False
         if type(replaceBlock) != str:
             textured = True
 
+        if not textured:
+            return self.__fillRegion(x1, y1, z1, x2, y2, z2, replaceBlock)
         for x, y, z in loop3d(x1, y1, z1, x2, y2, z2):
-            if textured:
-                self.setBlock(x, y, z, choice(replaceBlock))
-            else:
-                self.setBlock(x, y, z, replaceBlock)
+            self.setBlock(x, y, z, choice(replaceBlock))
 
     def replace(self, x1, y1, z1, x2, y2, z2, searchBlock, replaceBlock):
         """**Replace searchBlock with replaceBlock**.
         Supports sequences of block strings for random texturing
+        A single block is placed with /fill ... replace commands
         Works with local coordinates
         """
-        from lib.toolbox import loop3d
         textured = False
         if type(replaceBlock) != str:
             textured = True
 
-        for x, y, z in loop3d(x1, y1, z1, x2, y2, z2):
-            if self.getBlock(x, y, z) == searchBlock:
-                if textured:
-                    self.setBlock(x, y, z, choice(replaceBlock))
-                else:
-                    self.setBlock(x, y, z, replaceBlock)
+        if not textured:
+            return self.__fillRegion(x1, y1, z1, x2, y2, z2, replaceBlock,
+                                     searchBlock)
+        positions = list(loop3d(x1, y1, z1, x2, y2, z2))
+        for (x, y, z), name in zip(positions, self.getBlocksAt(positions)):
+            if name == searchBlock:
+                self.setBlock(x, y, z, choice(replaceBlock))
+
+    def __fillRegion(self, x1, y1, z1, x2, y2, z2, blockStr,
+                     searchBlock=None):
+        """**Fill a region server-side, keeping buffer and cache in step**.
+        Returns the responses of the commands
+        """
+        x1, y1, z1 = self.local2global(x1, y1, z1)
+        x2, y2, z2 = self.local2global(x2, y2, z2)
+        x1, x2 = sorted((x1, x2))
+        y1, y2 = sorted((y1, y2))
+        z1, z2 = sorted((z1, z2))
+
+        if searchBlock is None:
+            # the commands must not be overtaken by batches still in flight,
+            #   failed batches are back in the buffer once they are reaped
+            while self.__inflight:
+                self.__reapBatches(block=True)
+            # pending writes in the region would only be overwritten
+            for position in [p for p in self.buffer
+                             if x1 <= p[0] <= x2 and y1 <= p[1] <= y2
+                             and z1 <= p[2] <= z2]:
+                del self.buffer[position]
+                self.writeStats["coalesced"] += 1
+        else:
+            # the server has to see them to know what to replace
+            self.flush()
+
+        responses = []
+        commands = fillCommands(x1, y1, z1, x2, y2, z2, blockStr, searchBlock)
+        for start in range(0, len(commands), FILL_COMMANDS_PER_REQUEST):
+            response = runCommand(
+                "\n".join(commands[start:start + FILL_COMMANDS_PER_REQUEST]))
+            responses.extend(response.split("\n"))
+
+        # only the region as a whole is known to have changed
+        self.cache.forgetBox(x1, y1, z1, x2, y2, z2)
+        self.written.forgetBox(x1, y1, z1, x2, y2, z2)
+        decayBox(x1, y1, z1, x2, y2, z2)
+        chunkCache.invalidateBlocks(x1, z1, x2, z2)
+        return responses
 
     def setBlock(self, x, y, z, blockStr):
         """**Place a block in the world depending on buffer activation**.
         Takes local coordinates, works with local and global coordinates
         """
+        self.writeStats["writes"] += 1
+        position = tuple(self.local2global(x, y, z))
+        if self.caching and self.written.get(position) == blockStr:
+            self.writeStats["unchanged"] += 1
+            return None
+
         if self.__buffering:
             response = self.placeBlockBatched(x, y, z, blockStr,
                                               self.bufferlimit)
@@ -146,12 +667,14 @@ class Interface():
 
         # switch to global coordinates
         x, y, z = self.local2global(x, y, z)
-        if self.caching:
+        # buffered blocks are forgotten if the server rejects them,
+        #   see __reapBatches
+        if self.caching and (self.__buffering or str(response).isnumeric()):
             self.cache[(x, y, z)] = blockStr
+            self.written[(x, y, z)] = blockStr
         # mark block as decayed
         if globalDecay is not None:
-            x, y, z = global2buildlocal(x, y, z)
-            globalDecay[x][y][z] = True
+            globalDecay.mark(x, y, z)
 
         return response
 
@@ -161,6 +684,7 @@ class Interface():
         """
         x, y, z = self.local2global(x, y, z)
         result = di.setBlock(x, y, z, blockStr)
+        chunkCache.invalidateBlocks(x, z, x, z)
         if not result.isnumeric():
             print(f"{TCOLORS['orange']}Warning: Server returned error "
                   f"upon placing block:\n\t{TCOLORS['CLR']}{result}")
@@ -176,7 +700,8 @@ class Interface():
         """**Set self.__buffering**."""
         self.__buffering = value
         if not self.__buffering:
-            self.sendBlocks()
+            # blocks placed directly must not overtake buffered ones
+            self.flush()
             
 
     def getBufferLimit(self):
@@ -186,6 +711,8 @@ class Interface():
     def setBufferLimit(self, value):
         """**Set self.bufferlimit**."""
         self.bufferlimit = value
+        if self.batchSize is not None:
+            self.batchSize.size = value
 
     def isCaching(self):
         """**Get self.caching**."""
@@ -202,14 +729,29 @@ class Interface():
     def setCacheLimit(self, value=8192):
         """**Set maximum cache size**."""
         self.cache.maxsize = value
+        self.written.maxsize = value
+
+    def getWriteStats(self):
+        """**Return how many writes were requested and eliminated**.
+        coalesced writes were replaced in the buffer by a later write,
+            unchanged writes repeated the block already placed
+        """
+        stats = dict(self.writeStats)
+        stats["eliminated"] = stats["coalesced"] + stats["unchanged"]
+        return stats
 
-    def placeBlockBatched(self, x, y, z, blockStr, limit=50):
+    def placeBlockBatched(self, x, y, z, blockStr, limit=None):
         """**Place a block in the buffer and send once limit is exceeded**.
+        The limit defaults to self.bufferlimit
         Takes local coordinates and works with global coordinates
         """
+        if limit is None:
+            limit = self.bufferlimit
         x, y, z = self.local2global(x, y, z)
 
-        self.buffer.append((x, y, z, blockStr))
+        if (x, y, z) in self.buffer:
+            self.writeStats["coalesced"] += 1
+        self.buffer[(x, y, z)] = blockStr
         if len(self.buffer) >= limit:
             return self.sendBlocks()
         else:
@@ -220,14 +762,131 @@ class Interface():
         Since the buffer contains global coordinates
             no conversion takes place in this function
         """
-        if self.buffer == []:
+        if not self.buffer:
             return
-        response = di.sendBlocks(self.buffer, x, y, z, retries).split('\n')
-        if all(map(lambda val: val.isnumeric(), response)):  # no errors
-            self.buffer = []
+        # cached chunks no longer match the world, even on partial failure
+        xs = [position[0] + x for position in self.buffer]
+        zs = [position[2] + z for position in self.buffer]
+        chunkCache.invalidateBlocks(min(xs), min(zs), max(xs), max(zs))
+        if self.pipelining:
+            self.__sendBatch(x, y, z, retries)
+            return
+        blocks = [(bx, by, bz, blockStr)
+                  for (bx, by, bz), blockStr in self.buffer.items()]
+        sent = 0
+        while sent < len(blocks):
+            # a buffer kept after a failure may exceed a shrunken batch size
+            batch = blocks[sent:] if self.batchSize is None \
+                else blocks[sent:sent + self.bufferlimit]
+            response, seconds = timedSendBlocks(batch, x, y, z, retries)
+            response = response.split('\n')
+            self.__recordBatch(len(batch), seconds, response)
+            if not all(map(lambda val: val.isnumeric(), response)):
+                print(f"{TCOLORS['orange']}Warning: Server returned error "
+                      f"upon sending block buffer:\n\t{TCOLORS['CLR']}"
+                      f"{repr(response)}")
+                break
+            sent += len(batch)
+        # keep what was not sent
+        self.buffer = {(bx, by, bz): blockStr
+                       for bx, by, bz, blockStr in blocks[sent:]}
+
+    def flush(self):
+        """**Send the buffer and wait until all batches are placed**.
+        Use as a barrier between phases that depend on placed blocks
+        Batches that never reached the server are sent once more,
+            if that fails too they stay in the buffer like in sendBlocks
+        """
+        for _ in range(2):
+            self.sendBlocks()
+            while self.__inflight:
+                self.__reapBatches(block=True)
+            if not self.buffer:
+                break
+
+    def __sendBatch(self, x, y, z, retries):
+        """**Hand the buffer to a background thread as one batch**."""
+        # batches in flight at the same time may be applied in any order,
+        # so wait for those writing to the same positions first
+        # reaping may put failed batches back in the buffer, so the batch
+        #   is only taken from the buffer once nothing is waited for
+        while any(not self.__batchPositions(self.buffer, x, y, z)
+                  .isdisjoint(other) for _, other, _ in self.__inflight):
+            self.__reapBatches(block=True)
+        while len(self.__inflight) >= self.inflightlimit:
+            self.__reapBatches(block=True)
+        batch = self.buffer
+        self.buffer = {}
+        positions = self.__batchPositions(batch, x, y, z)
+
+        if self.__sender is None:
+            self.__sender = ThreadPoolExecutor(self.inflightlimit)
+        blocks = [(bx, by, bz, blockStr)
+                  for (bx, by, bz), blockStr in batch.items()]
+        future = self.__sender.submit(timedSendBlocks, blocks, x, y, z, retries)
+        self.__inflight.append((future, positions, batch))
+        self.__reapBatches()
+
+    @staticmethod
+    def __batchPositions(batch, x, y, z):
+        """**Return the global coordinates written by a batch**."""
+        return {(bx + x, by + y, bz + z) for bx, by, bz in batch}
+
+    def __recordBatch(self, blocks, seconds, response):
+        """**Let the adaptive batch size measure a sent batch**."""
+        if self.batchSize is None:
+            return
+        # the server answers each block on its own line,
+        #   anything else means the whole request failed
+        failed = len(response) != blocks
+        self.bufferlimit = self.batchSize.record(blocks, seconds, failed)
+
+    def __reapBatches(self, block=False):
+        """**Drop finished batches, warning about server errors**.
+        Batches that never reached the server go back in the buffer,
+            behind any later write to the same position
+        """
+        if block and self.__inflight:
+            wait([future for future, _, _ in self.__inflight],
+                 return_when=FIRST_COMPLETED)
+        running = []
+        for future, positions, batch in self.__inflight:
+            if not future.done():
+                running.append((future, positions, batch))
+                continue
+            response, seconds = future.result()
+            response = response.split('\n')
+            self.__recordBatch(len(positions), seconds, response)
+            if response[0].startswith(di.REQUEST_FAILED):
+                print(f"{TCOLORS['orange']}Warning: Could not send block "
+                      f"buffer, keeping it:\n\t{TCOLORS['CLR']}{response[0]}")
+                for position, blockStr in batch.items():
+                    self.buffer.setdefault(position, blockStr)
+            elif not all(map(lambda val: val.isnumeric(), response)):
+                # resending would not fix the rejected blocks
+                print(f"{TCOLORS['orange']}Warning: Server returned error "
+                      f"upon sending block buffer:\n\t{TCOLORS['CLR']}"
+                      f"{repr(response)}")
+                self.__forgetRejected(batch, response)
+        self.__inflight = running
+
+    def __forgetRejected(self, batch, response):
+        """**Forget the blocks of a batch the server did not place**.
+        The server answers each block on its own line, if it did not
+            the whole batch is forgotten
+        """
+        if len(response) == len(batch):
+            rejected = [position for position, line in zip(batch, response)
+                        if not line.isnumeric()]
         else:
-            print(f"{TCOLORS['orange']}Warning: Server returned error upon "
-                  f"sending block buffer:\n\t{TCOLORS['CLR']}{repr(response)}")
+            rejected = list(batch)
+        for position in rejected:
+            # a later write of the position is still to be sent
+            if position in self.buffer:
+                continue
+            for cache in (self.written, self.cache):
+                if position in cache:
+                    del cache[position]
 
     # ----------------------------------------------------- utility functions
 
@@ -302,6 +961,41 @@ def makeBookItem(text, title = "", author = "", desc = ""):
     bookdesc = "display:{Lore:[\""+desc+"\"]}"
     return "written_book{"+booktext+booktitle+bookauthor+bookdesc+"}"
 
+def loop3d(x1, y1, z1, x2, y2, z2):
+    """**Return all coordinates of an inclusive box**."""
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    z1, z2 = sorted((z1, z2))
+    return product(range(x1, x2 + 1), range(y1, y2 + 1), range(z1, z2 + 1))
+
+
+def splitBox(x1, y1, z1, x2, y2, z2, limit=FILL_VOLUME_LIMIT):
+    """**Split an inclusive box into boxes of at most limit blocks**."""
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    z1, z2 = sorted((z1, z2))
+    size = [x2 - x1 + 1, y2 - y1 + 1, z2 - z1 + 1]
+    while size[0] * size[1] * size[2] > limit:
+        axis = size.index(max(size))
+        size[axis] = (size[axis] + 1) // 2
+    for bx in range(x1, x2 + 1, size[0]):
+        for by in range(y1, y2 + 1, size[1]):
+            for bz in range(z1, z2 + 1, size[2]):
+                yield (bx, by, bz, min(bx + size[0] - 1, x2),
+                       min(by + size[1] - 1, y2), min(bz + size[2] - 1, z2))
+
+
+def fillCommands(x1, y1, z1, x2, y2, z2, blockStr, searchBlock=None,
+                 limit=FILL_VOLUME_LIMIT):
+    """**Return the /fill commands covering an inclusive box**.
+    With searchBlock only blocks matching it are replaced
+    """
+    suffix = "" if searchBlock is None else f" replace {searchBlock}"
+    return [f"fill {bx1} {by1} {bz1} {bx2} {by2} {bz2} {blockStr}{suffix}"
+            for bx1, by1, bz1, bx2, by2, bz2
+            in splitBox(x1, y1, z1, x2, y2, z2, limit)]
+
+
 def runCommand(command):
     """**Run a Minecraft command in the world**."""
     return di.runCommand(command)
@@ -334,11 +1028,22 @@ def requestPlayerArea(dx=128, dz=128):
     return requestBuildArea()
 
 
+def cacheArea():
+    """**Return the area cached densely by new interfaces**.
+    This is the inclusive build area with all heights, as an area
+        excluding x2, y2 and z2
+    """
+    x1, _, z1, x2, _, z2 = globalBuildArea
+    return x1, 0, z1, x2 + 1, 256, z2 + 1
+
+
 # ========================================================= global interface
 
 
 globalWorldSlice = None
 globalDecay = None
+# blocks found outside the build area by checkOutOfBounds
+outOfBoundsCount = 0
 globalBuildArea = requestBuildArea()
 
 globalinterface = Interface()
@@ -348,7 +1053,7 @@ def makeGlobalSlice():
     """**Instantiate a global WorldSlice and refresh building area**."""
     global globalWorldSlice
     x1, y1, z1, x2, y2, z2 = requestBuildArea()
-    globalWorldSlice = WorldSlice(x1, z1, x2, z2)
+    globalWorldSlice = WorldSlice(x1, z1, x2, z2, dense=True)
     resetGlobalDecay()
 
 
@@ -357,6 +1062,11 @@ def getBlock(x, y, z):
     return globalinterface.getBlock(x, y, z)
 
 
+def getBlocksAt(positions):
+    """**Global getBlocksAt**."""
+    return globalinterface.getBlocksAt(positions)
+
+
 def fill(x1, y1, z1, x2, y2, z2, replaceBlock):
     """**Global fill**."""
     return globalinterface.fill(x1, y1, z1, x2, y2, z2, replaceBlock)
@@ -392,7 +1102,7 @@ def getCacheLimit():
 
 def setCacheLimit(value=8192):
     """**Global setCacheLimit**."""
-    globalinterface.cache.maxsize = value
+    globalinterface.setCacheLimit(value)
 
 
 def isBuffering():
@@ -419,6 +1129,11 @@ def sendBlocks(x=0, y=0, z=0, retries=5):
     """**Global sendBlocks**."""
     return globalinterface.sendBlocks(x, y, z, retries)
 
+
+def flush():
+    """**Global flush**."""
+    globalinterface.flush()
+
 # ----------------------------------------------------- utility functions
 
 
@@ -429,18 +1144,38 @@ def global2buildlocal(x, y, z):
 
 
 def checkOutOfBounds(x, y, z, warn=True):
-    """**Check whether a given coordinate is outside the build area**."""
+    """**Check whether a given coordinate is outside the build area**.
+    Only the first block outside is reported, the rest are counted
+        in outOfBoundsCount
+    """
+    global outOfBoundsCount
     x1, y1, z1, x2, y2, z2 = globalBuildArea
     if not (x1 <= x <= x2 and y1 <= y <= y2 and z1 <= z <= z2):
         if warn:
-            # building outside the build area can be less efficient
-            print(f"{TCOLORS['orange']}WARNING: Block at {x, y, z} is outside "
-                  f"the build area!{TCOLORS['CLR']}")
+            if outOfBoundsCount == 0:
+                # building outside the build area can be less efficient
+                print(f"{TCOLORS['orange']}WARNING: Block at {x, y, z} is "
+                      f"outside the build area! Further blocks outside are "
+                      f"only counted.{TCOLORS['CLR']}")
+            outOfBoundsCount += 1
         return True
     return False
 
 
+def decayBox(x1, y1, z1, x2, y2, z2):
+    """**Mark an inclusive box of global coordinates as changed**."""
+    if globalDecay is not None:
+        globalDecay.markBox(x1, y1, z1, x2, y2, z2)
+
+
 def resetGlobalDecay():
+    """**Mark every block of the global slice as unchanged**."""
     global globalDecay
-    x1, _, z1, x2, _, z2 = globalBuildArea
-    globalDecay = np.zeros((x2 - x1, 256, z2 - z1), dtype=bool)
\ No newline at end of file
+    if globalWorldSlice is not None:
+        x1, z1, dx, dz = globalWorldSlice.rect
+        x2, z2 = x1 + dx, z1 + dz
+    else:
+        # the build area is inclusive
+        x1, _, z1, x2, _, z2 = globalBuildArea
+        x2, z2 = x2 + 1, z2 + 1
+    globalDecay = DecayMap(x1, 0, z1, x2, 256, z2)
\ No newline at end of file
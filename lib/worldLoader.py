@@ -7,22 +7,34 @@ This module contains functions to:
 __all__ = ['WorldSlice']
 __version__ = 'v4.2_dev'
 
+# bump when the layout of the snapshot files changes
+SNAPSHOT_VERSION = 1
+
+import json
+import os
 from io import BytesIO
 from math import ceil, log2
 
 import lib.direct_interface as di
-from lib.bitarray import BitArray
+from lib.bitarray import BitArray, unpackLongArray
 from lib.lookup import BIOMES
 import nbt
 import numpy as np
 
+# length of biome histograms, every known biome id fits
+BIOME_COUNT = max(BIOMES) + 1
+
 
 class CachedSection:
     """**Represents a cached chunk section (16x16x16)**."""
 
-    def __init__(self, palette, blockStatesBitArray):
+    def __init__(self, palette, blockStatesBitArray, blockStates=None):
         self.palette = palette
         self.blockStatesBitArray = blockStatesBitArray
+        # palette indices in y,z,x order, decoded in one pass
+        if blockStates is None:
+            blockStates = blockStatesBitArray.getAll()
+        self.blockStates = blockStates.reshape(16, 16, 16)
 
     # __repr__ displays the class well enough so __str__ is omitted
     def __repr__(self):
@@ -30,6 +42,31 @@ class CachedSection:
             f"{repr(self.blockStatesBitArray)})"
 
 
+def paletteBlockString(compound):
+    """**Return a palette entry as a block string with properties**."""
+    name = compound['Name'].value
+    if 'Properties' not in compound:
+        return name
+    properties = ",".join(f"{tag.name}={tag.value}"
+                          for tag in compound['Properties'].tags)
+    return f"{name}[{properties}]"
+
+
+def paletteCompound(blockString):
+    """**Rebuild a palette entry from a block string with properties**."""
+    compound = nbt.nbt.TAG_Compound()
+    name, _, properties = blockString.partition('[')
+    compound.tags.append(nbt.nbt.TAG_String(name='Name', value=name))
+    if properties:
+        propertyTags = nbt.nbt.TAG_Compound(name='Properties')
+        for pair in properties[:-1].split(','):
+            key, _, value = pair.partition('=')
+            propertyTags.tags.append(nbt.nbt.TAG_String(name=key,
+                                                        value=value))
+        compound.tags.append(propertyTags)
+    return compound
+
+
 class WorldSlice:
     """**Contains information on a slice of the world**."""
 
@@ -37,8 +74,15 @@ class WorldSlice:
                  heightmapTypes=["MOTION_BLOCKING",
                                  "MOTION_BLOCKING_NO_LEAVES",
                                  "OCEAN_FLOOR",
-                                 "WORLD_SURFACE"]):
-        """**Initialise WorldSlice with region and heightmaps**."""
+                                 "WORLD_SURFACE"],
+                 dense=False, cache=None):
+        """**Initialise WorldSlice with region and heightmaps**.
+
+        With dense=True the blocks of the rect are also materialised as one
+        (X, Y, Z) array of ids into a shared string table (see blockIds).
+        With a ChunkCache the decoded chunks are read from and written to
+        disk, so loading the same area again needs no request.
+        """
         self.rect = x1, z1, x2 - x1, z2 - z1
         self.chunkRect = (self.rect[0] >> 4, self.rect[1] >> 4,
                           ((self.rect[0] + self.rect[2] - 1) >> 4)
@@ -47,65 +91,195 @@ class WorldSlice:
                           - (self.rect[1] >> 4) + 1)
         self.heightmapTypes = heightmapTypes
 
-        bytes = di.getChunks(*self.chunkRect, rtype='bytes')
-        file_like = BytesIO(bytes)
+        data = None
+        palettes = None
+        if cache is not None:
+            data = cache.load(self.chunkRect, heightmapTypes)
+        if data is None:
+            bytes = di.getChunks(*self.chunkRect, rtype='bytes')
+            file_like = BytesIO(bytes)
 
-        self.nbtfile = nbt.nbt.NBTFile(buffer=file_like)
+            self.nbtfile = nbt.nbt.NBTFile(buffer=file_like)
+            data, palettes = self._decodeChunks(self.nbtfile['Chunks'])
+            if cache is not None:
+                cache.store(self.chunkRect, heightmapTypes, data)
+        else:
+            # only the decoded arrays are cached, not the raw nbt
+            self.nbtfile = None
+        self._loadChunkData(data, palettes)
 
-        rectOffset = [self.rect[0] % 16, self.rect[1] % 16]
+        # dense block volume, see buildBlockIds
+        self.blockNames = None
+        self.blockNameIds = None
+        self.blockIds = None
+        if dense:
+            self.buildBlockIds()
 
-        # heightmaps
-        self.heightmaps = {}
-        for hmName in self.heightmapTypes:
-            self.heightmaps[hmName] = np.zeros(
-                (self.rect[2] + 1, self.rect[3] + 1), dtype=int)
+    def _decodeChunks(self, chunks):
+        """**Decode the chunk nbt into the arrays kept by the cache**.
 
-        # Sections are in x,z,y order!!! (reverse minecraft order :p)
-        self.sections = [[[None for i in range(16)] for z in range(
-            self.chunkRect[3])] for x in range(self.chunkRect[2])]
+        Heightmaps are chunk-aligned (x, z) arrays, sections are stored as
+        palette indices with their palettes flattened into one string table.
+        Also returns the original palettes and bit arrays per section.
+        """
+        chunksX, chunksZ = self.chunkRect[2], self.chunkRect[3]
+        data = {}
 
         # heightmaps
-        for x in range(self.chunkRect[2]):
-            for z in range(self.chunkRect[3]):
-                chunkID = x + z * self.chunkRect[2]
-
-                hms = self.nbtfile['Chunks'][chunkID]['Level']['Heightmaps']
-                for hmName in self.heightmapTypes:
-                    # hmRaw = hms['MOTION_BLOCKING']
-                    hmRaw = hms[hmName]
-                    heightmapBitArray = BitArray(9, 16 * 16, hmRaw)
-                    heightmap = self.heightmaps[hmName]
-                    for cz in range(16):
-                        for cx in range(16):
-                            try:
-                                heightmap[-rectOffset[0] + x * 16 + cx,
-                                          -rectOffset[1] + z * 16 + cz] \
-                                    = heightmapBitArray.getAt(cz * 16 + cx)
-                            except IndexError:
-                                pass
+        # all chunks are decoded at once into one chunk-aligned array
+        for hmName in self.heightmapTypes:
+            hmRaw = np.array([chunk['Level']['Heightmaps'][hmName].value
+                              for chunk in chunks], dtype=np.int64)
+            decoded = unpackLongArray(hmRaw, 9, 16 * 16).reshape(
+                chunksZ, chunksX, 16, 16)
+            # (chunkZ, chunkX, cz, cx) -> (x, z)
+            data['heightmap_' + hmName] = decoded.transpose(1, 3, 0, 2) \
+                .reshape(chunksX * 16, chunksZ * 16)
 
         # sections
-        for x in range(self.chunkRect[2]):
-            for z in range(self.chunkRect[3]):
-                chunkID = x + z * self.chunkRect[2]
-                chunk = self.nbtfile['Chunks'][chunkID]
+        sectionStates = np.zeros((chunksX, chunksZ, 16, 16 * 16 * 16),
+                                 dtype=np.uint16)
+        paletteStart = np.zeros((chunksX, chunksZ, 16), dtype=np.int32)
+        paletteSize = np.zeros((chunksX, chunksZ, 16), dtype=np.int32)
+        paletteBlocks = []
+        palettes = {}
+        for x in range(chunksX):
+            for z in range(chunksZ):
+                chunkID = x + z * chunksX
+                chunk = chunks[chunkID]
                 chunkSections = chunk['Level']['Sections']
 
                 for section in chunkSections:
                     y = section['Y'].value
 
-                    if (not ('BlockStates' in section)
+                    if (not 0 <= y < 16 or not ('BlockStates' in section)
                             or len(section['BlockStates']) == 0):
                         continue
 
                     palette = section['Palette']
                     rawBlockStates = section['BlockStates']
                     bitsPerEntry = max(4, ceil(log2(len(palette))))
-                    blockStatesBitArray = BitArray(bitsPerEntry, 16 * 16 * 16,
-                                                   rawBlockStates)
+                    sectionStates[x, z, y] = unpackLongArray(
+                        rawBlockStates.value, bitsPerEntry, 16 * 16 * 16)
+                    paletteStart[x, z, y] = len(paletteBlocks)
+                    paletteSize[x, z, y] = len(palette)
+                    paletteBlocks.extend(paletteBlockString(block)
+                                         for block in palette)
+                    palettes[x, z, y] = (palette, BitArray(
+                        bitsPerEntry, 16 * 16 * 16, rawBlockStates))
+
+        data['sectionStates'] = sectionStates
+        data['paletteStart'] = paletteStart
+        data['paletteSize'] = paletteSize
+        data['paletteBlocks'] = np.array(paletteBlocks, dtype=str)
+
+        # biomes, in chunk order
+        data['biomes'] = np.array([chunk['Level']['Biomes'].value
+                                   for chunk in chunks], dtype=np.int32)
+        return data, palettes
+
+    def _loadChunkData(self, data, palettes=None):
+        """**Build heightmaps, sections and biomes from decoded arrays**."""
+        rectOffset = [self.rect[0] % 16, self.rect[1] % 16]
+
+        # heightmaps are cropped to the requested rect
+        self.heightmaps = {}
+        for hmName in self.heightmapTypes:
+            decoded = data['heightmap_' + hmName]
+            cropped = decoded[rectOffset[0]:rectOffset[0] + self.rect[2] + 1,
+                              rectOffset[1]:rectOffset[1] + self.rect[3] + 1]
+            heightmap = np.zeros((self.rect[2] + 1, self.rect[3] + 1),
+                                 dtype=int)
+            heightmap[:cropped.shape[0], :cropped.shape[1]] = cropped
+            self.heightmaps[hmName] = heightmap
+
+        # Sections are in x,z,y order!!! (reverse minecraft order :p)
+        self.sections = [[[None for i in range(16)] for z in range(
+            self.chunkRect[3])] for x in range(self.chunkRect[2])]
+
+        paletteBlocks = data['paletteBlocks']
+        for x, z, y in zip(*np.nonzero(data['paletteSize'])):
+            if palettes is not None:
+                palette, blockStatesBitArray = palettes[x, z, y]
+            else:
+                start = data['paletteStart'][x, z, y]
+                palette = [paletteCompound(str(block)) for block in
+                           paletteBlocks[start:start
+                                         + data['paletteSize'][x, z, y]]]
+                blockStatesBitArray = None
+            self.sections[x][z][y] = CachedSection(
+                palette, blockStatesBitArray, data['sectionStates'][x, z, y])
+
+        # biome ids of every chunk, indexed by chunk id
+        self.biomes = data['biomes']
+        self._buildBiomeGrid()
+
+    def _buildBiomeGrid(self):
+        """**Decode the biomes of all chunks into one (X/4, Y/4, Z/4) grid**.
+
+        Cells are 4x4x4 blocks, the grid starts at the first chunk corner.
+        """
+        chunksX, chunksZ = self.chunkRect[2], self.chunkRect[3]
+        # every chunk holds its cells in y,z,x order, chunks are in z,x order
+        self.biomeGrid = np.ascontiguousarray(
+            np.asarray(self.biomes).reshape(chunksZ, chunksX, 64, 4, 4)
+            .transpose(1, 4, 2, 0, 3).reshape(chunksX * 4, 64, chunksZ * 4))
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """**Load a WorldSlice saved with save_snapshot**.
+
+        Needs no server. The block id volume and biomes are memory-mapped
+        read-only, so processes loading the same snapshot share its pages.
+        Only the dense rect is available, blocks outside it are void air.
+        """
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        if meta["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {path} has version {meta['version']},"
+                             f" expected {SNAPSHOT_VERSION}")
 
-                    self.sections[x][z][y] = CachedSection(palette,
-                                                           blockStatesBitArray)
+        worldSlice = cls.__new__(cls)
+        worldSlice.rect = tuple(meta["rect"])
+        worldSlice.chunkRect = tuple(meta["chunkRect"])
+        worldSlice.heightmapTypes = meta["heightmapTypes"]
+        worldSlice.nbtfile = None
+        worldSlice.sections = None
+        # heightmaps are small and updated in place, e.g. by Map
+        worldSlice.heightmaps = {
+            hmName: np.load(os.path.join(path, f"heightmap_{hmName}.npy"))
+            for hmName in worldSlice.heightmapTypes}
+        worldSlice.blockNames = np.load(
+            os.path.join(path, "blockNames.npy")).tolist()
+        worldSlice.blockNameIds = {name: blockId for blockId, name
+                                   in enumerate(worldSlice.blockNames)}
+        worldSlice.blockIds = np.load(os.path.join(path, "blockIds.npy"),
+                                      mmap_mode='r')
+        worldSlice.biomes = np.load(os.path.join(path, "biomes.npy"),
+                                    mmap_mode='r')
+        worldSlice._buildBiomeGrid()
+        return worldSlice
+
+    def save_snapshot(self, path):
+        """**Save heightmaps, block ids, block names and biomes to a directory**.
+
+        Builds the dense volume first if needed. See from_snapshot.
+        """
+        if self.blockIds is None:
+            self.buildBlockIds()
+        os.makedirs(path, exist_ok=True)
+        for hmName, heightmap in self.heightmaps.items():
+            np.save(os.path.join(path, f"heightmap_{hmName}.npy"), heightmap)
+        np.save(os.path.join(path, "blockNames.npy"),
+                np.array(self.blockNames, dtype=str))
+        np.save(os.path.join(path, "blockIds.npy"), self.blockIds)
+        np.save(os.path.join(path, "biomes.npy"), self.biomes)
+        # written last, so an interrupted save is not mistaken for a snapshot
+        with open(os.path.join(path, "meta.json"), 'w') as file:
+            json.dump({"version": SNAPSHOT_VERSION,
+                       "rect": list(self.rect),
+                       "chunkRect": list(self.chunkRect),
+                       "heightmapTypes": list(self.heightmaps)}, file)
 
     # __repr__ displays the class well enough so __str__ is omitted
     def __repr__(self):
@@ -114,8 +288,60 @@ class WorldSlice:
         x2, z2 = self.rect[0] + self.rect[2], self.rect[1] + self.rect[3]
         return f"WorldSlice{(x1, z1, x2, z2)}"
 
+    def buildBlockIds(self):
+        """**Materialise the rect as a dense (X, Y, Z) array of block ids**.
+
+        self.blockNames is the string table the ids index into and
+        self.blockNameIds maps each name back to its id.
+        Missing sections are stored as minecraft:void_air (id 0).
+        """
+        self.blockNames = ["minecraft:void_air"]
+        self.blockNameIds = {"minecraft:void_air": 0}
+        volume = np.zeros((self.chunkRect[2] * 16, 256,
+                           self.chunkRect[3] * 16), dtype=np.uint16)
+
+        for x in range(self.chunkRect[2]):
+            for z in range(self.chunkRect[3]):
+                for y in range(16):
+                    cachedSection = self.sections[x][z][y]
+                    if cachedSection is None:
+                        continue
+                    lookup = np.empty(len(cachedSection.palette),
+                                      dtype=np.uint16)
+                    for i, blockCompound in enumerate(cachedSection.palette):
+                        lookup[i] = self._internBlockName(
+                            blockCompound["Name"].value)
+                    # palette indices are stored in y,z,x order
+                    volume[x * 16:x * 16 + 16, y * 16:y * 16 + 16,
+                           z * 16:z * 16 + 16] = \
+                        lookup[cachedSection.blockStates].transpose(2, 0, 1)
+
+        offsetX, offsetZ = self.rect[0] % 16, self.rect[1] % 16
+        self.blockIds = np.ascontiguousarray(
+            volume[offsetX:offsetX + self.rect[2], :,
+                   offsetZ:offsetZ + self.rect[3]])
+        return self.blockIds
+
+    def _internBlockName(self, name):
+        """**Return the id of a block name, adding it to the table**."""
+        blockId = self.blockNameIds.get(name)
+        if blockId is None:
+            blockId = len(self.blockNames)
+            self.blockNames.append(name)
+            self.blockNameIds[name] = blockId
+        return blockId
+
+    def _inDenseVolume(self, x, y, z):
+        """**Check whether a global position is covered by blockIds**."""
+        return (self.blockIds is not None
+                and 0 <= x - self.rect[0] < self.rect[2]
+                and 0 <= y < 256
+                and 0 <= z - self.rect[1] < self.rect[3])
+
     def getBlockCompoundAt(self, x, y, z):
         """**Return block data**."""
+        if self.sections is None:
+            return None  # snapshots only keep the block ids of the rect
         chunkX = (x >> 4) - self.chunkRect[0]
         chunkZ = (z >> 4) - self.chunkRect[1]
         chunkY = y >> 4
@@ -125,45 +351,146 @@ class WorldSlice:
         if cachedSection is None:
             return None  # TODO return air compound instead
 
-        bitarray = cachedSection.blockStatesBitArray
         palette = cachedSection.palette
-
-        blockIndex = (y % 16) * 16 * 16 + \
-            (z % 16) * 16 + x % 16
-        return palette[bitarray.getAt(blockIndex)]
+        return palette[cachedSection.blockStates[y % 16, z % 16, x % 16]]
 
     def getBlockAt(self, x, y, z):
         """**Return the block's namespaced id at blockPos**."""
+        if self._inDenseVolume(x, y, z):
+            return self.blockNames[
+                self.blockIds[x - self.rect[0], y, z - self.rect[1]]]
         blockCompound = self.getBlockCompoundAt(x, y, z)
         if blockCompound is None:
             return "minecraft:void_air"
         else:
             return blockCompound["Name"].value
 
+    def getBlockIdsAt(self, x, y, z):
+        """**Return the block ids at arrays of global positions**.
+
+        Builds the dense volume on first use.
+        The positions must lie within the rect.
+        """
+        if self.blockIds is None:
+            self.buildBlockIds()
+        return self.blockIds[np.asarray(x) - self.rect[0], np.asarray(y),
+                             np.asarray(z) - self.rect[1]]
+
+    def getBlocksInBox(self, x1, y1, z1, x2, y2, z2):
+        """**Return a view of the block ids inside an inclusive box**.
+
+        Coordinates are global and the box is clipped to the rect.
+        Builds the dense volume on first use.
+        """
+        if self.blockIds is None:
+            self.buildBlockIds()
+        x1, x2 = sorted((x1 - self.rect[0], x2 - self.rect[0]))
+        z1, z2 = sorted((z1 - self.rect[1], z2 - self.rect[1]))
+        y1, y2 = sorted((y1, y2))
+        return self.blockIds[max(x1, 0):max(x2 + 1, 0),
+                             max(y1, 0):max(y2 + 1, 0),
+                             max(z1, 0):max(z2 + 1, 0)]
+
+    def getBlockNameMask(self, match):
+        """**Return a boolean lookup over the block id table**.
+
+        match is either a collection of namespaced ids or a predicate
+            taking a namespaced id, e.g. lambda name: name.endswith("_log")
+        Index the result with block ids to get a mask.
+        """
+        if self.blockIds is None:
+            self.buildBlockIds()
+        if callable(match):
+            return np.fromiter((bool(match(name)) for name in self.blockNames),
+                               dtype=bool, count=len(self.blockNames))
+        match = set(match)
+        return np.fromiter((name in match for name in self.blockNames),
+                           dtype=bool, count=len(self.blockNames))
+
+    def getBlockMask(self, match, x1=None, y1=None, z1=None,
+                     x2=None, y2=None, z2=None):
+        """**Return a boolean volume marking the blocks that match**.
+
+        match is the same as in getBlockNameMask.
+        Without a box the whole rect is returned in (X, Y, Z) order.
+        """
+        nameMask = self.getBlockNameMask(match)
+        if x1 is None:
+            return nameMask[self.blockIds]
+        return nameMask[self.getBlocksInBox(x1, y1, z1, x2, y2, z2)]
+
     def getBiomeAt(self, x, y, z):
         """**Return biome at given coordinates**.
         Due to the noise around chunk borders,
             there is an inacurracy of +/-2 blocks.
         """
-        chunkID = x // 16 + z // 16 * self.chunkRect[2]
-        data = self.nbtfile['Chunks'][chunkID]['Level']['Biomes']
-        x = (x % 16) // 4
-        z = (z % 16) // 4
-        y = y // 4
-        index = x + 4 * z + 16 * y
-        return(BIOMES[data[index]])
+        return BIOMES[self.biomeGrid[(x - self.chunkRect[0] * 16) >> 2,
+                                     y >> 2,
+                                     (z - self.chunkRect[1] * 16) >> 2]]
+
+    def getBiomeCellsInBox(self, x1, y1, z1, x2, y2, z2):
+        """**Return a view of the biome cells overlapping an inclusive box**.
+
+        Coordinates are global blocks and the box is clipped to the grid.
+        """
+        x1, x2 = sorted((x1 - self.chunkRect[0] * 16,
+                         x2 - self.chunkRect[0] * 16))
+        z1, z2 = sorted((z1 - self.chunkRect[1] * 16,
+                         z2 - self.chunkRect[1] * 16))
+        y1, y2 = sorted((y1, y2))
+        return self.biomeGrid[max(x1 >> 2, 0):max((x2 >> 2) + 1, 0),
+                              max(y1 >> 2, 0):max((y2 >> 2) + 1, 0),
+                              max(z1 >> 2, 0):max((z2 >> 2) + 1, 0)]
+
+    def _biomeCount(self):
+        return max(BIOME_COUNT, int(self.biomeGrid.max()) + 1)
+
+    def getBiomeHistogram(self, x1=None, y1=None, z1=None,
+                          x2=None, y2=None, z2=None):
+        """**Return the number of cells of every biome id**.
+
+        Without a box the whole grid is counted, see getBiomeCellsInBox.
+        """
+        cells = self.biomeGrid if x1 is None else \
+            self.getBiomeCellsInBox(x1, y1, z1, x2, y2, z2)
+        return np.bincount(cells.ravel(), minlength=self._biomeCount())
+
+    def getBiomeMode(self, x1=None, y1=None, z1=None,
+                     x2=None, y2=None, z2=None):
+        """**Return the most common biome id, the lowest one on ties**.
+
+        Without a box the whole grid is counted, see getBiomeCellsInBox.
+        """
+        return int(np.argmax(self.getBiomeHistogram(x1, y1, z1, x2, y2, z2)))
+
+    def getRegionBiomes(self, regionSize=16, y1=0, y2=255):
+        """**Return the most common biome id of every region**.
+
+        Regions are columns of regionSize blocks (rounded to cells) aligned
+            to the first chunk corner, counted between y1 and y2 inclusive.
+        Returns an array of region x, region z, the lowest id on ties.
+        """
+        cellsPerRegion = max(regionSize >> 2, 1)
+        cells = self.biomeGrid[:, max(y1 >> 2, 0):max((y2 >> 2) + 1, 0), :]
+        regionX = np.arange(cells.shape[0]) // cellsPerRegion
+        regionZ = np.arange(cells.shape[2]) // cellsPerRegion
+        regionsX, regionsZ = regionX[-1] + 1, regionZ[-1] + 1
+
+        # one bincount over (region, biome) pairs counts every region at once
+        biomeCount = self._biomeCount()
+        regions = regionX[:, np.newaxis, np.newaxis] * regionsZ \
+            + regionZ[np.newaxis, np.newaxis, :]
+        counts = np.bincount((regions * biomeCount + cells).ravel(),
+                             minlength=regionsX * regionsZ * biomeCount)
+        return counts.reshape(regionsX, regionsZ, biomeCount).argmax(axis=2)
 
     def getBiomesNear(self, x, y, z):
         """**Return a list of biomes in the same chunk**."""
-        chunkID = x // 16 + z // 16 * self.chunkRect[2]
-        data = self.nbtfile['Chunks'][chunkID]['Level']['Biomes']
-        # "sorted(list(set(data)))" is used to remove duplicates from data
-        return [BIOMES[i] for i in sorted(list(set(data)))]
+        x1, z1 = x >> 4 << 4, z >> 4 << 4
+        cells = self.getBiomeCellsInBox(x1, 0, z1, x1 + 15, 255, z1 + 15)
+        return [BIOMES[i] for i in np.unique(cells).tolist()]
 
     def getPrimaryBiomeNear(self, x, y, z):
         """**Return the most prevelant biome in the same chunk**."""
-        chunkID = x // 16 + z // 16 * self.chunkRect[2]
-        data = self.nbtfile['Chunks'][chunkID]['Level']['Biomes']
-        # "max(set(data), key=data.count)" is used to find the most common item
-        data = max(set(data), key=data.count)
-        return [BIOMES[i] for i in sorted(list(set(data)))]
\ No newline at end of file
+        x1, z1 = x >> 4 << 4, z >> 4 << 4
+        return BIOMES[self.getBiomeMode(x1, 0, z1, x1 + 15, 255, z1 + 15)]
@@ -17,6 +17,7 @@ from gdpc import interface as INTF
 from gdpc import toolbox as TB
 from gdpc import worldLoader as WL
 from util.encyclopedia import BuildingType
+import lib.interfaceUtils as iu
 
 from helper_functions import convert_coords
 
@@ -40,7 +41,7 @@ def find_radius(x1, z1, radius, heightmap):
     return bottom_left_x, bottom_left_z, top_right_x, top_right_z
     
      
-def prep_single_building(WORLDSLICE, x1, z1, x2, z2, base_block, height):
+def prep_single_building(WORLDSLICE, x1, z1, x2, z2, base_block, height, interface=None):
     """
     This function simply receives a rectangle and a desired y level, and places a rectangle of blocks there, 
     while clearing a number of blocks above specified by the height input. 
@@ -53,7 +54,10 @@ def prep_single_building(WORLDSLICE, x1, z1, x2, z2, base_block, height):
         x2 (int): Ending z point of our base rectangle.
         base_block (string): The type of block we want as the base rectangle
         height (int): This value specifies how large the y value of our building is going to be.
+        interface (Interface): The interface placing the blocks, the unbuffered global one by default.
     """
+    if interface is None:
+        interface = iu.globalinterface
     heights = WORLDSLICE.heightmaps['MOTION_BLOCKING_NO_LEAVES']
     start_x, start_z, _, _ = WORLDSLICE.rect
 
@@ -76,27 +80,31 @@ def prep_single_building(WORLDSLICE, x1, z1, x2, z2, base_block, height):
             # Prints all heights for this chunk of land
             # print(f"({x}, {z}): {heights[(local_x, local_z)]}")
 
-            INTF.placeBlock(global_x, desired_y, global_z, base_block)
+            interface.setBlock(global_x, desired_y, global_z, base_block)
     
     # Clear blocks above the desired y in our land chunk
     global_start = convert_coords((x1, z1), (start_x, start_z))
     global_end = convert_coords((x2, z2), (start_x, start_z))
-    GEO.placeCuboid(global_start[0], desired_y+1, global_start[1], global_end[0], desired_y+height, global_end[1], 'air') 
+    for y in range(desired_y+1, desired_y+height+1):
+        for z in range(global_start[1], global_end[1]+1):
+            for x in range(global_start[0], global_end[0]+1):
+                interface.setBlock(x, y, z, 'air')
 
     # Return our desired Y height
     return desired_y
 
 
-def prep_land(buildings, planner):
+def prep_land(buildings, planner, interface=None):
     """
     This function will go throguh all buildings 
+    Blocks are placed through interface, the unbuffered global one by default
     """
     for building in buildings:
         this_x = building.x
         this_z = building.z
         x1, z1, x2, z2 = find_radius(this_x, this_z, 5, planner.build_area.worldslice.heightmaps["MOTION_BLOCKING"])
         print(f'This building is at {this_x} x {this_z}')
-        desired_y = prep_single_building(planner.build_area.worldslice, x1, z1, x2, z2, 'oak_planks', building.building_type.radius)
+        desired_y = prep_single_building(planner.build_area.worldslice, x1, z1, x2, z2, 'oak_planks', building.building_type.radius, interface)
         building.y = desired_y
 
 
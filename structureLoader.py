@@ -1,96 +1,306 @@
 # from generation.structures.generated.generatedWell import GeneratedWell
-# from generation.structures.generated.generatedQuarry import * 
+# from generation.structures.generated.generatedQuarry import *
+from concurrent.futures import ProcessPoolExecutor
 from nbt import nbt
+import hashlib
 import json
+import os
+import pickle
+import numpy as np
 from structures import *
 
 STRUCTURE_PATH = "data/structures/"
 
+# Parsed structures are pickled here, keyed by the contents of their files
+CACHE_PATH = os.path.join("cache", "structures")
+# bump when Structures changes what it keeps, to drop the cached ones
+CACHE_VERSION = 1
+INDEX_FILE = "index.json"
+
+# Every structure with its name, building type, .nbt and .json files
+MANIFEST_FILE = STRUCTURE_PATH + "manifest.json"
+# Sizes, building types and villager info of the manifest, see loadCatalog
+CATALOG_FILE = os.path.join(CACHE_PATH, "catalog.npz")
 
-def loadAllResources() : 
-    """
-    Loads all structures from .nbt files
 
-    :returns dictionary containing all structures organized by building type 
+class StructureCatalog:
     """
+    Index of the structures of the manifest, queried without loading their blocks
+    One row per structure in manifest order, names, buildingTypes, nbtFiles, infoFiles and professions are string arrays,
+    sizes are (N, 3), footprints (N, 2) sizes in x and z and villagers the number of villagers
+    """
+    def __init__(self, arrays):
+        self.names = arrays["names"]
+        self.buildingTypes = arrays["buildingTypes"]
+        self.nbtFiles = arrays["nbtFiles"]
+        self.infoFiles = arrays["infoFiles"]
+        self.sizes = arrays["sizes"]
+        self.footprints = arrays["footprints"]
+        self.villagers = arrays["villagers"]
+        self.professions = arrays["professions"]
+        self.rows = {name : i for i, name in enumerate(self.names.tolist())}
 
-    # Loads structures
+    def __len__(self):
+        return len(self.names)
 
-    def loadStructures(path, infoPath, name, buildingType):
+    def query(self, buildingType=None, maxSizeX=None, maxSizeZ=None):
         """
-        Loads a structure from an .nbt file and instanties structure object
+        Returns the names of the structures of a building type whose footprint fits
 
-        :param path: Path to .nbt file
-        :param infoPath: Path to .json file corresponding to the .nbt file
-        :param name: Name of the structure
-        :param buildingType: Building type of the structure
+        :param buildingType: Building type of the structures, any by default
+        :param maxSizeX: Largest size in x, unlimited by default
+        :param maxSizeZ: Largest size in z, unlimited by default
         """
-        nbtfile = nbt.NBTFile(STRUCTURE_PATH + path,'rb')
-        with open(STRUCTURE_PATH + infoPath) as json_file:
-           info = json.load(json_file)
+        selected = np.ones(len(self.names), dtype=bool)
+        if buildingType is not None:
+            selected &= self.buildingTypes == buildingType
+        if maxSizeX is not None:
+            selected &= self.footprints[:, 0] <= maxSizeX
+        if maxSizeZ is not None:
+            selected &= self.footprints[:, 1] <= maxSizeZ
+        return self.names[selected].tolist()
 
-        struct = Structures(nbtfile, info, name)
-        if buildingType not in structures:
-            structures[buildingType] = {}
-        
-        structures[buildingType][name] = (struct, [struct.file["size"][0].value, struct.file["size"][1].value, struct.file["size"][2].value])
+    def queryFitting(self, buildingType, maxSizeX, maxSizeZ):
+        """
+        Returns the names of the structures of a building type whose footprint fits, or all of the type if none fits
 
+        :param buildingType: Building type of the structures
+        :param maxSizeX: Largest size in x
+        :param maxSizeZ: Largest size in z
+        """
+        return self.query(buildingType, maxSizeX, maxSizeZ) or self.query(buildingType)
 
-    structures = {}
+    def getSize(self, name):
+        """
+        Returns the size of a structure
+        """
+        return self.sizes[self.rows[name]].tolist()
 
-    print("Begin load ressources")
-    
-    # Haybale
-    loadStructures("houses/haybale/haybalehouse1.nbt", "houses/haybale/haybalehouse1.json", "haybalehouse1", 'haybale')
-    loadStructures("houses/haybale/haybalehouse2.nbt", "houses/haybale/haybalehouse2.json", "haybalehouse2", 'haybale' )
-    loadStructures("houses/haybale/haybalehouse3.nbt", "houses/haybale/haybalehouse3.json", "haybalehouse3", 'haybale')
-    loadStructures("houses/haybale/haybalehouse4.nbt", "houses/haybale/haybalehouse4.json", "haybalehouse4", 'haybale')
+    def getVillagerInfo(self, name):
+        """
+        Returns the number of villagers of a structure and their profession or None
+        """
+        row = self.rows[name]
+        return int(self.villagers[row]), (str(self.professions[row]) or None)
+
+
+def readManifest():
+    """
+    Returns the enabled entries of the manifest
 
-    # small house
-    loadStructures("houses/basic/basichouse1.nbt", "houses/basic/basichouse1.json", "basichouse1", 'small_house')
-    loadStructures("houses/basic/basichouse2.nbt", "houses/basic/basichouse2.json", "basichouse2", 'small_house')
-    loadStructures("houses/basic/basichouse3.nbt", "houses/basic/basichouse3.json", "basichouse3", 'small_house')
+    :returns list of dictionaries with name, type, nbt and info of every structure
+    """
+    with open(MANIFEST_FILE) as manifest_file:
+        manifest = json.load(manifest_file)
+    return [entry for entry in manifest["structures"] if not entry.get("disabled", False)]
+
+
+def buildCatalog():
+    """
+    Builds the catalog of the manifest and writes it to CATALOG_FILE
+    Only the size is read from the .nbt files
+
+    :returns the catalog
+    """
+    entries = readManifest()
+    sizes = []
+    villagers = []
+    professions = []
+    for entry in entries:
+        nbtfile = nbt.NBTFile(STRUCTURE_PATH + entry["nbt"], 'rb')
+        sizes.append([nbtfile["size"][0].value, nbtfile["size"][1].value, nbtfile["size"][2].value])
+        with open(STRUCTURE_PATH + entry["info"]) as json_file:
+            villageInfo = json.load(json_file).get("villageInfo", {})
+        villagers.append(villageInfo.get("villager", 0))
+        professions.append(villageInfo.get("gameProfession", ""))
+
+    arrays = {
+        "names" : np.array([entry["name"] for entry in entries], dtype=str),
+        "buildingTypes" : np.array([entry["type"] for entry in entries], dtype=str),
+        "nbtFiles" : np.array([entry["nbt"] for entry in entries], dtype=str),
+        "infoFiles" : np.array([entry["info"] for entry in entries], dtype=str),
+        "sizes" : np.array(sizes, dtype=np.int16).reshape(-1, 3),
+        "villagers" : np.array(villagers, dtype=np.int16),
+        "professions" : np.array(professions, dtype=str)
+    }
+    arrays["footprints"] = arrays["sizes"][:, [0, 2]]
+
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    # An interrupted run must not leave a truncated file under the real name
+    with open(CATALOG_FILE + ".tmp", 'wb') as file:
+        np.savez(file, version=CACHE_VERSION, **arrays)
+    os.replace(CATALOG_FILE + ".tmp", CATALOG_FILE)
+    return StructureCatalog(arrays)
 
-    # Medium house
-    loadStructures("houses/medium/mediumhouse1.nbt", "houses/medium/mediumhouse1.json", "mediumhouse1", 'medium_house')
-    loadStructures("houses/medium/mediumhouse2.nbt", "houses/medium/mediumhouse1.json", "mediumhouse2", 'medium_house')
-    loadStructures("houses/medium/mediumhouse3.nbt", "houses/medium/mediumhouse3.json", "mediumhouse3", 'medium_house')
-    loadStructures("houses/advanced/advancedhouse1.nbt", "houses/advanced/advancedhouse1.json", "advancedhouse1", 'medium_house')
 
-    # Farms
-    loadStructures("functionals/farm/basicfarm.nbt", "functionals/farm/basicfarm.json", "basicfarm", 'farm')
-    loadStructures("functionals/farm/mediumfarm1.nbt", "functionals/farm/mediumfarm1.json", "mediumfarm1", 'farm')
+def loadCatalog():
+    """
+    Returns the catalog of the manifest, built again when the manifest or any of its files changed
+
+    :returns the catalog
+    """
+    if os.path.exists(CATALOG_FILE):
+        built = os.stat(CATALOG_FILE).st_mtime_ns
+        with np.load(CATALOG_FILE) as catalog:
+            arrays = {key : catalog[key] for key in catalog.files}
+        files = [MANIFEST_FILE] + [STRUCTURE_PATH + file for file in arrays["nbtFiles"].tolist() + arrays["infoFiles"].tolist()]
+        if arrays["version"] == CACHE_VERSION and all(os.stat(file).st_mtime_ns <= built for file in files):
+            return StructureCatalog(arrays)
+
+    return buildCatalog()
 
 
-    # Misc
-    loadStructures("functionals/lumberjachut/basiclumberjachut.nbt", "functionals/lumberjachut/basiclumberjachut.json", "basiclumberjachut", 'misc')
-    loadStructures("functionals/stonecutter/basicstonecutter.nbt", "functionals/stonecutter/basicstonecutter.json", "basicstonecutter", 'misc')
-    loadStructures("functionals/furnace/basicfurnace1.nbt", "functionals/furnace/basicfurnace1.json", "basicfurnace1", 'misc')
-    loadStructures("functionals/smeltery/basicsmeltery.nbt", "functionals/smeltery/basicsmeltery.json", "basicsmeltery", 'misc')
-    loadStructures("functionals/workshop/basicworkshop.nbt", "functionals/workshop/basicworkshop.json", "basicworkshop", 'misc')
-    loadStructures("functionals/weaverhouse/basicweaverhouse.nbt", "functionals/weaverhouse/basicweaverhouse.json", "basicweaverhouse", 'misc')   
+def loadStructure(path, infoPath, name):
+    """
+    Loads a structure from an .nbt file and instanties structure object
+    Only the block arrays are kept from the nbt data, so the structure is quick to pickle
 
+    :param path: Path to .nbt file
+    :param infoPath: Path to .json file corresponding to the .nbt file
+    :param name: Name of the structure
+    :returns the structure
+    """
+    nbtfile = nbt.NBTFile(STRUCTURE_PATH + path,'rb')
+    with open(STRUCTURE_PATH + infoPath) as json_file:
+        info = json.load(json_file)
 
-    # Windmill
-    loadStructures("functionals/windmill/basicwindmill.nbt", "functionals/windmill/basicwindmill.json", "basicwindmill", 'windmill')
-    loadStructures("functionals/windmill/mediumwindmill.nbt", "functionals/windmill/mediumwindmill.json", "mediumwindmill", 'windmill')
+    struct = Structures(nbtfile, info, name)
+    struct.loadBlockArrays()
+    struct.file = None
+    return struct
 
-    
-    # Townhall
-    loadStructures("representatives/townhall/basictownhall.nbt", "representatives/townhall/basictownhall.json", "basictownhall", 'townhall')
 
-    # Graveyard
-    loadStructures("representatives/graveyard/basicgraveyard.nbt", "representatives/graveyard/basicgraveyard.json", "basicgraveyard", 'graveyard')
+def cacheKey(path, infoPath, name, index):
+    """
+    Returns the cache file name of a structure
+    The files are only hashed again when their modification time changed since the last run
 
-    # Tavern
-    loadStructures("representatives/tavern/basictavern.nbt", "representatives/tavern/basictavern.json", "basictavern", 'tavern')
+    :param path: Path to .nbt file
+    :param infoPath: Path to .json file corresponding to the .nbt file
+    :param name: Name of the structure
+    :param index: Cache index, updated with the key
+    :returns the name of the cache file
+    """
+    files = [path, infoPath]
+    mtimes = [os.stat(STRUCTURE_PATH + file).st_mtime_ns for file in files]
+    entry = index.get(name)
+    if entry is not None and entry["version"] == CACHE_VERSION and entry["files"] == files and entry["mtimes"] == mtimes:
+        return entry["key"]
 
+    digest = hashlib.sha1(f"{CACHE_VERSION}|{name}".encode())
+    for file in files:
+        with open(STRUCTURE_PATH + file, 'rb') as content:
+            digest.update(content.read())
+    key = digest.hexdigest() + ".pickle"
+    index[name] = {"version": CACHE_VERSION, "files": files, "mtimes": mtimes, "key": key}
+    return key
 
-    # Enforcement
-    # loadStructures("representatives/adventurerhouse/adventurerhouse.nbt", "representatives/adventurerhouse/adventurerhouse.json", "adventurerhouse", 'adventure')
-    loadStructures("representatives/jail/basicjail.nbt", "representatives/jail/basicjail.json", "basicjail", 'enforcement')
-    loadStructures("representatives/barrack/basicbarrack.nbt", "representatives/barrack/basicbarrack.json", "basicbarrack", 'enforcement')
 
+def readCachedStructure(key):
+    """
+    Returns a cached structure or None if it is not cached
+
+    :param key: Name of the cache file
+    """
+    try:
+        with open(os.path.join(CACHE_PATH, key), 'rb') as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        print(f"Dropping unreadable structure cache entry {key}: {e}")
+        return None
+
+
+def writeCachedStructure(key, struct):
+    """
+    Writes a structure to the cache
+
+    :param key: Name of the cache file
+    :param struct: Structure to cache
+    """
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    path = os.path.join(CACHE_PATH, key)
+    # An interrupted run must not leave a truncated file under the real name
+    with open(path + ".tmp", 'wb') as file:
+        pickle.dump(struct, file)
+    os.replace(path + ".tmp", path)
+
+
+def loadStructures(names, catalog=None, cache=True, max_workers=None):
+    """
+    Loads structures by name
+    Structures missing from the cache are parsed in parallel by a process pool, then cached
+
+    :param names: Names of the structures to load
+    :param catalog: Catalog of the structures, loaded by default
+    :param cache: Whether to read and write the structure cache
+    :param max_workers: Most processes parsing structures at once, the number of cpus by default
+    :returns dictionary of the structures by name
+    """
+    if catalog is None:
+        catalog = loadCatalog()
+
+    index = {}
+    indexPath = os.path.join(CACHE_PATH, INDEX_FILE)
+    if cache and os.path.exists(indexPath):
+        with open(indexPath) as index_file:
+            index = json.load(index_file)
+
+    loaded = {}
+    missing = []
+    for name in dict.fromkeys(names):
+        row = catalog.rows[name]
+        path, infoPath = str(catalog.nbtFiles[row]), str(catalog.infoFiles[row])
+        key = cacheKey(path, infoPath, name, index) if cache else None
+        struct = readCachedStructure(key) if cache else None
+        if struct is None:
+            missing.append((path, infoPath, name, key))
+        else:
+            loaded[name] = struct
+
+    if len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(missing), max_workers or os.cpu_count() or 1)) as executor:
+            parsed = list(executor.map(loadStructure, *list(zip(*missing))[:3]))
+    else:
+        parsed = [loadStructure(path, infoPath, name) for path, infoPath, name, _ in missing]
+
+    for (path, infoPath, name, key), struct in zip(missing, parsed):
+        loaded[name] = struct
+        if cache:
+            writeCachedStructure(key, struct)
+
+    if cache:
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        with open(indexPath, 'w') as index_file:
+            json.dump(index, index_file)
+
+    return loaded
+
+
+def loadAllResources(buildingTypes=None, cache=True, max_workers=None) :
+    """
+    Loads all structures of the manifest from .nbt files, see loadStructures
+
+    :param buildingTypes: Building types to load, all of them by default
+    :param cache: Whether to read and write the structure cache
+    :param max_workers: Most processes parsing structures at once, the number of cpus by default
+    :returns dictionary containing all structures organized by building type
+    """
+    print("Begin load ressources")
+
+    catalog = loadCatalog()
+    names = [name for name, buildingType in zip(catalog.names.tolist(), catalog.buildingTypes.tolist())
+             if buildingTypes is None or buildingType in buildingTypes]
+    loaded = loadStructures(names, catalog, cache, max_workers)
+
+    structures = {}
+    for name in names:
+        buildingType = str(catalog.buildingTypes[catalog.rows[name]])
+        if buildingType not in structures:
+            structures[buildingType] = {}
+
+        structures[buildingType][name] = (loaded[name], catalog.getSize(name))
 
     print("End load ressources")
 
@@ -98,3 +308,5 @@ def loadAllResources() :
     return structures
 
 
+if __name__ == '__main__':
+    print(f"Built the catalog of {len(buildCatalog())} structures in {CATALOG_FILE}")
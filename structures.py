@@ -2,7 +2,8 @@ import util.projectMath as projectMath
 import util.util as util
 from baseStructure import *
 
-from nbt import nbt
+import json
+import numpy as np
 
 """
 Structure using nbt
@@ -22,7 +23,8 @@ class Structures(BaseStructure):
 
     """
     Constructor of the class
-    It will use the nbt file and mark it to indicate if the block in palette should change with replacements in building condition
+    It will read the palette of the nbt file and mark for each block if it should change with replacements in building condition
+    The nbt file itself is left untouched, see resolvePalette
     """
     def __init__(self, nbtfile, info, name):
         super(BaseStructure, self).__init__()
@@ -35,56 +37,105 @@ class Structures(BaseStructure):
         # Variable used on building
         self.placeImmediately = False
 
+        # Compiled blocks by rotation, flip and biome blocks, see compile
+        self.compiled = {}
+        self.blockPositions = None
+        self.blockStates = None
+
         self.computedOrientation = {}
-        # Indicate for each block in palette if it should change or not and to change to what
-        for block in self.file["palette"]:
-            if Structures.REPLACEMENTS in self.info.keys():
-                blockName = block["Name"].value.split("[")[0]
-
-                for replacementWord in self.info[Structures.REPLACEMENTS].keys():
-                    # Checking for block replacement
-                    if replacementWord == blockName:
-                        block.tags.append(nbt.TAG_Int(name=Structures.CHANGE_STATE, value=self.info[Structures.REPLACEMENTS][blockName]["state"]))
-                                                                        #  """AND states equals"""
-                        if block[Structures.CHANGE_STATE].value == 1 or (block[Structures.CHANGE_STATE].value == 0):
-                            block.tags.append(nbt.TAG_Byte(name=Structures.CHANGE, value=True))
-                            block.tags.append(nbt.TAG_String(name=Structures.CHANGE_TO, value=self.info[Structures.REPLACEMENTS][block["Name"].value]["type"]))   
-                            block.tags.append(nbt.TAG_String(name=Structures.CHANGE_ORIGINAL_BLOCK, value=block["Name"].value))
-                            block.tags.append(nbt.TAG_String(name=Structures.CHANGE_REPLACEMENT_WORD, value=replacementWord))
-                            block.tags.append(nbt.TAG_Byte(name=Structures.CHANGE_EXCLUDED_ZONES, 
-                                value=("excluded" in self.info[Structures.REPLACEMENTS][replacementWord].keys())))
-                            break
-                        
-                    # Checking for substr replacement 
-                    elif replacementWord in blockName:
-                        # The replacementWord can be in unexpected blocks
-                        # "oak" is on every "...dark_oak..." block
-                        if replacementWord in Structures.REPLACEMENTS_EXCLUSIF:
-                            if Structures.REPLACEMENTS_EXCLUSIF[replacementWord] in blockName:
-                                continue
-
-                        if replacementWord in self.info[Structures.REPLACEMENTS].keys():
-                            if self.info[Structures.REPLACEMENTS][replacementWord]["state"] == 2:
-
-                                block.tags.append(nbt.TAG_Byte(name=Structures.CHANGE, value=True))
-                                block.tags.append(nbt.TAG_String(name=Structures.CHANGE_TO, value=self.info[Structures.REPLACEMENTS][replacementWord]["type"]))  
-                                block.tags.append(nbt.TAG_Int(name=Structures.CHANGE_STATE, value=2))
-                                block.tags.append(nbt.TAG_String(name=Structures.CHANGE_ORIGINAL_BLOCK, value=(block["Name"].value) ))
-                                block.tags.append(nbt.TAG_String(name=Structures.CHANGE_REPLACEMENT_WORD, value=replacementWord))
-
-                                # True or False
-                                block.tags.append(nbt.TAG_Byte(name=Structures.CHANGE_EXCLUDED_ZONES, 
-                                    value=("excluded" in self.info[Structures.REPLACEMENTS][replacementWord].keys())))
-                                break
-                                
-            
-            block.tags.append(nbt.TAG_Byte(name=Structures.CHANGE, value=False))
+        # Original palette, for each block its name, properties and if it should change or not and to change to what
+        self.palette = [self.markPaletteBlock(block) for block in self.file["palette"]]
+        # Block names of the palette by biome blocks, see resolvePalette
+        self.resolvedPalettes = {}
         
         # Looting table
         self.lootTable = False
         if "lootTables" in self.info.keys():
             self.lootTable = len(self.info["lootTables"]) > 0
 
+    """
+    Return a hashable key of the biome blocks, used to cache palettes and compiled blocks
+    biomesBlocks : replacement blocks of the biome
+    """
+    @staticmethod
+    def biomesBlocksKey(biomesBlocks):
+        return json.dumps(biomesBlocks, sort_keys=True)
+
+
+    """
+    Return the palette entry of a nbt palette block
+    Name and Properties are copied, Change tells if the block should change with the replacements in info
+    block : block of the nbt palette
+    """
+    def markPaletteBlock(self, block):
+        entry = {
+            "Name" : block["Name"].value,
+            "Properties" : {key : block["Properties"][key].value for key in block["Properties"].keys()} if "Properties" in block.keys() else None,
+            Structures.CHANGE : False
+        }
+
+        if not Structures.REPLACEMENTS in self.info.keys():
+            return entry
+
+        replacements = self.info[Structures.REPLACEMENTS]
+        blockName = entry["Name"].split("[")[0]
+        for replacementWord in replacements.keys():
+            # Checking for block replacement
+            if replacementWord == blockName:
+                if replacements[blockName]["state"] == 1 or replacements[blockName]["state"] == 0:
+                    entry[Structures.CHANGE_STATE] = replacements[blockName]["state"]
+                    break
+                    
+            # Checking for substr replacement 
+            elif replacementWord in blockName:
+                # The replacementWord can be in unexpected blocks
+                # "oak" is on every "...dark_oak..." block
+                if replacementWord in Structures.REPLACEMENTS_EXCLUSIF:
+                    if Structures.REPLACEMENTS_EXCLUSIF[replacementWord] in blockName:
+                        continue
+
+                if replacements[replacementWord]["state"] == 2:
+                    entry[Structures.CHANGE_STATE] = 2
+                    break
+        else:
+            return entry
+
+        entry[Structures.CHANGE] = True
+        entry[Structures.CHANGE_TO] = replacements[replacementWord]["type"]
+        entry[Structures.CHANGE_ORIGINAL_BLOCK] = entry["Name"]
+        entry[Structures.CHANGE_REPLACEMENT_WORD] = replacementWord
+        # True or False
+        entry[Structures.CHANGE_EXCLUDED_ZONES] = "excluded" in replacements[replacementWord].keys()
+        return entry
+
+
+    """
+    Return the block names of the palette with the blocks of the biome, cached by biome blocks
+    Blocks without a replacement in the biome keep their original name
+    biomesBlocks : replacement blocks of the biome
+    """
+    def resolvePalette(self, biomesBlocks):
+        key = Structures.biomesBlocksKey(biomesBlocks)
+        if key in self.resolvedPalettes:
+            return self.resolvedPalettes[key]
+
+        names = []
+        for blockPalette in self.palette:
+            name = blockPalette["Name"]
+            if blockPalette[Structures.CHANGE] and blockPalette[Structures.CHANGE_TO] in biomesBlocks:
+                replacement = biomesBlocks[blockPalette[Structures.CHANGE_TO]].split("[")[0]
+                changeState = blockPalette[Structures.CHANGE_STATE]
+                if changeState == 0 or changeState == 1:
+                    name = replacement
+                elif changeState == 2:
+                    name = blockPalette[Structures.CHANGE_ORIGINAL_BLOCK].replace(
+                        blockPalette[Structures.CHANGE_REPLACEMENT_WORD], replacement)
+            names.append(name)
+
+        self.resolvedPalettes[key] = tuple(names)
+        return self.resolvedPalettes[key]
+
+
     """
     Just return corners
     """
@@ -110,59 +161,29 @@ class Structures(BaseStructure):
 
 
 
-    def build(self, strucCoords, buildingCoords, rotation, worldModif, biomesBlocks):
-
-        # Replace bloc by these given
-        for blockPalette in self.file["palette"]:
-            if blockPalette[Structures.CHANGE].value:
-                changeState = blockPalette[Structures.CHANGE_STATE].value
-
-                if blockPalette[Structures.CHANGE_TO].value in biomesBlocks:
-                    if changeState == 0 or changeState == 1:
-                        blockPalette["Name"].value = biomesBlocks[blockPalette[Structures.CHANGE_TO].value].split("[")[0]
-                    elif changeState == 2:
-                        blockPalette["Name"].value = blockPalette[Structures.CHANGE_ORIGINAL_BLOCK].value.replace(
-                            blockPalette[Structures.CHANGE_REPLACEMENT_WORD].value, 
-                            biomesBlocks[blockPalette[Structures.CHANGE_TO].value].split("[")[0] )
-
-        
-        
-        ## Computing : Modify from blocks
-        for block in self.file["blocks"]:
-            blockPalette = self.file["palette"][block["state"].value] 
-            self.placeImmediately = False
-
-            # Check if the current block is in excluded zone
-            takeOriginalBlock = False
-            blockName = blockPalette["Name"].value
-            if (blockPalette[Structures.CHANGE].value):
-                if (blockPalette[Structures.CHANGE_EXCLUDED_ZONES].value):
-                    for zone in self.info["replacements"][blockPalette[Structures.CHANGE_REPLACEMENT_WORD].value]["excluded"] :
-                        if projectMath.isPointInSquare([ block["pos"][0].value, block["pos"][1].value, block["pos"][2].value], zone) :
-                            takeOriginalBlock = True
-                            blockName = blockPalette[Structures.CHANGE_ORIGINAL_BLOCK].value
-                            break
-
-
-
-            blockPosition = self.returnWorldPosition(
-                [ block["pos"][0].value, block["pos"][1].value + 1, block["pos"][2].value ], 
-                0, rotation,
-                strucCoords,
-                buildingCoords
-            )
+    """
+    Build the structure
+    strucCoords : the origin of the local space, negated
+    buildingCoords : position of the structure in the real world
+    rotation : rotation applied to localspace, [0|1|2|3]
+    worldModif : class used to place blocks
+    biomesBlocks : replacement blocks of the biome
+    flip : flip applied to localspace, [0|1|2|3]
+    """
+    def build(self, strucCoords, buildingCoords, rotation, worldModif, biomesBlocks, flip=0):
+        compiled = self.compile(rotation, flip, biomesBlocks)
 
-        
-            self.checkBeforePlacing(blockName)
-            theBlock = self.convertNbtBlockToStr(
-                    self.file["palette"][block["state"].value],
-                    takeOriginalBlock
-                    )      
+        # Every block moves by the same offset, the rotated reference point
+        reference = self.returnWorldPosition(strucCoords, 0, rotation, [0, 0, 0], [0, 0, 0])
+        positions = compiled["positions"] + np.array([
+            buildingCoords[0] - reference[0],
+            buildingCoords[1] - reference[1],
+            buildingCoords[2] - reference[2]])
 
-            worldModif.setBlock( 
-                blockPosition[0], blockPosition[1], blockPosition[2],
-                theBlock , placeImmediately=self.placeImmediately
-            )
+        blocks = compiled["blocks"][compiled["states"]]
+        placeImmediately = compiled["placeImmediately"][compiled["states"]]
+        for (x, y, z), theBlock, immediately in zip(positions.tolist(), blocks.tolist(), placeImmediately.tolist()):
+            worldModif.setBlock(x, y, z, theBlock, placeImmediately=immediately)
 
 
         # Place sign
@@ -177,7 +198,73 @@ class Structures(BaseStructure):
         #     self.generateSignatureSign(signPosition, worldModif, buildingCondition["replacements"]["woodType"], buildingCondition["villager"])
 
         # self.parseSpecialRule(buildingCondition, worldModif)
-            
+
+
+    """
+    Return the blocks of the structure ready to be placed, cached by rotation, flip and biome blocks
+    positions : int16 array (N, 3) of the flipped and rotated local positions, one block up
+    states : palette index of every block, plus the palette length where the original block is kept
+    blocks : block string of every state, rendered for the flip and rotation
+    placeImmediately : whether the blocks of every state are placed immediately
+    rotation : rotation applied to localspace, [0|1|2|3]
+    flip : flip applied to localspace, [0|1|2|3]
+    biomesBlocks : replacement blocks of the biome
+    """
+    def compile(self, rotation, flip, biomesBlocks):
+        key = (rotation, flip, Structures.biomesBlocksKey(biomesBlocks))
+        if key in self.compiled:
+            return self.compiled[key]
+
+        names = self.resolvePalette(biomesBlocks)
+        self.loadBlockArrays()
+
+        positions = self.transformPositions(self.blockPositions + np.array([0, 1, 0], dtype=np.int16), flip, rotation)
+
+        # Blocks in excluded zones keep their original block
+        paletteLength = len(self.palette)
+        states = self.blockStates.copy()
+        for i, (position, state) in enumerate(zip(self.blockPositions.tolist(), self.blockStates.tolist())):
+            blockPalette = self.palette[state]
+            if blockPalette[Structures.CHANGE] and blockPalette[Structures.CHANGE_EXCLUDED_ZONES]:
+                for zone in self.info["replacements"][blockPalette[Structures.CHANGE_REPLACEMENT_WORD]]["excluded"] :
+                    if projectMath.isPointInSquare(position, zone) :
+                        states[i] += paletteLength
+                        break
+
+        # Render every palette entry once, with and without its original block
+        self.computeOrientation(rotation, flip)
+        blocks = []
+        placeImmediately = []
+        for original in [False, True]:
+            for blockPalette, name in zip(self.palette, names):
+                blockName = blockPalette["Name"] if original else name
+                self.checkBeforePlacing(blockName)
+                blocks.append(self.convertBlockToStr(blockName, blockPalette["Properties"]))
+                placeImmediately.append(self.placeImmediately)
+                self.placeImmediately = False
+
+        compiled = {
+            "positions" : positions,
+            "states" : states,
+            "blocks" : np.array(blocks, dtype=object),
+            "placeImmediately" : np.array(placeImmediately, dtype=bool)
+        }
+        self.compiled[key] = compiled
+        return compiled
+
+
+    """
+    Read positions and palette indices of all blocks from the nbt file once
+    The nbt file is not needed anymore afterwards, see structureLoader.loadStructure
+    """
+    def loadBlockArrays(self):
+        if self.blockPositions is not None:
+            return
+        blocks = self.file["blocks"]
+        self.blockPositions = np.array([[block["pos"][0].value, block["pos"][1].value, block["pos"][2].value]
+            for block in blocks], dtype=np.int16).reshape(-1, 3)
+        self.blockStates = np.array([block["state"].value for block in blocks], dtype=np.int32)
+
 
 
     def checkBeforePlacing(self, blockName):
@@ -185,18 +272,17 @@ class Structures(BaseStructure):
             self.placeImmediately = True
 
 
-    def convertNbtBlockToStr(self, blockPalette, takeOriginalBlockName=False):
-        if takeOriginalBlockName:
-            block = blockPalette[Structures.CHANGE_ORIGINAL_BLOCK].value
-        else:
-            block = blockPalette["Name"].value
-
+    """
+    Return the block string of a block with its properties, converted to the computed orientation
+    blockName : name of the block
+    properties : dictionnary of the block properties or None
+    """
+    def convertBlockToStr(self, blockName, properties):
         property = "["
-        if "Properties" in blockPalette.keys():
-            for key in blockPalette["Properties"].keys():
-                if self.propertyCompatible(block, key):
-                    property += self.convertProperty(key, blockPalette["Properties"][key].value) + ","
+        if properties is not None:
+            for key, value in properties.items():
+                if self.propertyCompatible(blockName, key):
+                    property += self.convertProperty(key, value) + ","
   
             property = property[:-1] 
-        block = block + property + "]"
-        return block
+        return blockName + property + "]"
@@ -0,0 +1,209 @@
+"""
+Shared setup of the tests, which run without a Minecraft server.
+
+Modules importing lib.interfaceUtils ask the server for the build area at import, so a fixed area is answered instead.
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+from nbt import nbt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lib.direct_interface as di
+
+di.requestBuildArea = lambda: (0, 0, 0, 127, 255, 127)
+
+from lib.worldLoader import WorldSlice
+
+FAKE_BLOCKS = ["minecraft:air", "minecraft:stone", "minecraft:grass_block"]
+
+
+@pytest.fixture
+def repo_root(monkeypatch):
+    """Run the test from the repository root, where the data files are found"""
+    monkeypatch.chdir(ROOT)
+    return ROOT
+
+
+def make_world_slice(x1, z1, x2, z2, seed=0):
+    """
+    Build a WorldSlice of random terrain without a server, like one loaded with dense=True
+
+    Columns are stone up to a random height, some with a tree trunk of logs and leaves on top, some under water.
+    The heightmaps are computed from the blocks like Minecraft does.
+    """
+    rng = np.random.default_rng(seed)
+    world_slice = WorldSlice.__new__(WorldSlice)
+    world_slice.rect = x1, z1, x2 - x1, z2 - z1
+    world_slice.chunkRect = (x1 >> 4, z1 >> 4, ((x2 - 1) >> 4) - (x1 >> 4) + 1, ((z2 - 1) >> 4) - (z1 >> 4) + 1)
+    world_slice.heightmapTypes = ["MOTION_BLOCKING", "MOTION_BLOCKING_NO_LEAVES", "OCEAN_FLOOR", "WORLD_SURFACE"]
+    world_slice.nbtfile = None
+    world_slice.sections = None
+
+    names = ["minecraft:void_air", "minecraft:air", "minecraft:stone", "minecraft:oak_log", "minecraft:oak_leaves",
+             "minecraft:water"]
+    air, stone, log, leaves, water = range(1, 6)
+    world_slice.blockNames = names
+    world_slice.blockNameIds = {name: block_id for block_id, name in enumerate(names)}
+
+    dx, dz = world_slice.rect[2], world_slice.rect[3]
+    ground = rng.integers(55, 75, (dx, dz))
+    trunks = np.where(rng.random((dx, dz)) < 0.2, rng.integers(1, 7, (dx, dz)), 0)
+    sea = np.where(rng.random((dx, dz)) < 0.15, 64, 0)
+    ys = np.arange(256)[np.newaxis, :, np.newaxis]
+    g, t, s = ground[:, np.newaxis, :], trunks[:, np.newaxis, :], sea[:, np.newaxis, :]
+    block_ids = np.full((dx, 256, dz), air, dtype=np.uint16)
+    block_ids[ys < g] = stone
+    block_ids[(ys >= g) & (ys < s)] = water
+    block_ids[(t > 0) & (ys >= g) & (ys < g + t)] = log
+    block_ids[(t > 0) & (ys == g + t)] = leaves
+    world_slice.blockIds = block_ids
+
+    def heightmap(solid):
+        # one above the highest matching block, 0 for none, with the padding row and column of a loaded slice
+        found = solid[block_ids]
+        top = np.where(found.any(axis=1), 256 - np.argmax(found[:, ::-1, :], axis=1), 0)
+        padded = np.zeros((dx + 1, dz + 1), dtype=int)
+        padded[:dx, :dz] = top
+        return padded
+
+    is_solid = np.array([False, False, True, True, True, True])
+    world_slice.heightmaps = {
+        "MOTION_BLOCKING": heightmap(is_solid),
+        "MOTION_BLOCKING_NO_LEAVES": heightmap(is_solid & (np.arange(6) != leaves)),
+        "OCEAN_FLOOR": heightmap(is_solid & (np.arange(6) != water)),
+        "WORLD_SURFACE": heightmap(is_solid),
+    }
+
+    chunks = world_slice.chunkRect[2] * world_slice.chunkRect[3]
+    world_slice.biomes = rng.choice([1, 4, 6, 7, 24], (chunks, 1024)).astype(np.int32)
+    world_slice._buildBiomeGrid()
+    return world_slice
+
+
+def fake_block_ids(x, y, z):
+    """Block ids into FAKE_BLOCKS of the terrain answered by fake_server, stone below a bumpy grass surface"""
+    ground = 60 + (3 * np.asarray(x) + 5 * np.asarray(z)) % 7
+    return np.where(y < ground, 1, np.where(y == ground, 2, 0))
+
+
+def fake_chunks(cx, cz, dx, dz):
+    """Chunk nbt of the fake terrain, as answered by GET /chunks"""
+    root = nbt.NBTFile()
+    chunks = nbt.TAG_List(name="Chunks", type=nbt.TAG_Compound)
+    # palette indices of a section in y,z,x order, 16 entries of 4 bits per long
+    y, z, x = np.mgrid[0:16, 0:16, 0:16]
+    shifts = np.arange(16, dtype=np.uint64) * np.uint64(4)
+    for chunk_z in range(cz, cz + dz):
+        for chunk_x in range(cx, cx + dx):
+            level = nbt.TAG_Compound(name="Level")
+            sections = nbt.TAG_List(name="Sections", type=nbt.TAG_Compound)
+            for section_y in range(16):
+                states = fake_block_ids(chunk_x * 16 + x, section_y * 16 + y, chunk_z * 16 + z).astype(np.uint64)
+                section = nbt.TAG_Compound()
+                section.tags.append(nbt.TAG_Byte(name="Y", value=section_y))
+                palette = nbt.TAG_List(name="Palette", type=nbt.TAG_Compound)
+                for name in FAKE_BLOCKS:
+                    entry = nbt.TAG_Compound()
+                    entry.tags.append(nbt.TAG_String(name="Name", value=name))
+                    palette.tags.append(entry)
+                section.tags.append(palette)
+                block_states = nbt.TAG_Long_Array(name="BlockStates")
+                packed = (states.reshape(-1, 16) << shifts).sum(axis=1, dtype=np.uint64)
+                block_states.value = packed.view(np.int64).tolist()
+                section.tags.append(block_states)
+                sections.tags.append(section)
+            level.tags.append(sections)
+            biomes = nbt.TAG_Int_Array(name="Biomes")
+            biomes.value = [1] * 1024
+            level.tags.append(biomes)
+            chunk = nbt.TAG_Compound()
+            chunk.tags.append(level)
+            chunks.tags.append(chunk)
+    root.tags.append(chunks)
+    buffer = BytesIO()
+    root.write_file(buffer=buffer)
+    return buffer.getvalue()
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    Stand-in for the GDMC HTTP interface, answering from fake_block_ids
+
+    Every request is recorded as (method, path, query), placed blocks are acknowledged with "1" per line.
+    """
+
+    def __init__(self):
+        super().__init__(("localhost", 0), FakeHandler)
+        self.requests = []
+
+    def count(self, method, path):
+        return sum(1 for request in self.requests if request[:2] == (method, path))
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def answer(self, body, content_type="text/plain"):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def record(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((self.command, url.path, query))
+        length = int(self.headers.get("Content-Length", 0))
+        return url.path, query, self.rfile.read(length).decode()
+
+    def do_GET(self):
+        path, query, _ = self.record()
+        if path == "/chunks":
+            self.answer(fake_chunks(*(int(query[key]) for key in ("x", "z", "dx", "dz"))),
+                        "application/octet-stream")
+        elif path == "/blocks":
+            block_id = fake_block_ids(int(query["x"]), int(query["y"]), int(query["z"]))
+            self.answer(FAKE_BLOCKS[int(block_id)])
+        elif path == "/buildarea":
+            self.answer(json.dumps({"xFrom": 0, "yFrom": 0, "zFrom": 0, "xTo": 127, "yTo": 255, "zTo": 127}))
+        else:
+            self.send_error(404)
+
+    def do_PUT(self):
+        _, _, body = self.record()
+        self.answer("\n".join("1" for _ in body.splitlines()))
+
+    def do_POST(self):
+        self.record()
+        self.answer("0")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    """Point the HTTP interface at a FakeServer for the duration of the test"""
+    server = FakeServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = di.HOST, di.PORT
+    di.setHost("localhost", server.server_address[1])
+    yield server
+    di.setHost(host, port)
+    server.shutdown()
+    server.server_close()
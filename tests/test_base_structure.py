@@ -0,0 +1,77 @@
+import math
+import random
+
+import pytest
+
+import util.projectMath as projectMath
+from baseStructure import BaseStructure
+
+
+def return_world_position_reference(size, localPoint, flip, rotation, referencePoint, worldStructurePosition):
+    """BaseStructure.returnWorldPosition before the rotation matrices, rotating with trigonometry"""
+    worldPosition = [0, 0, 0]
+    worldPosition[0] = size[0] - 1 - localPoint[0] if flip in (1, 3) else localPoint[0]
+    worldPosition[2] = size[2] - 1 - localPoint[2] if flip in (2, 3) else localPoint[2]
+    worldPosition[1] = localPoint[1]
+
+    worldPosition[0], worldPosition[2] = projectMath.rotatePointAround(
+        [worldStructurePosition[0] + referencePoint[0], worldStructurePosition[2] + referencePoint[2]],
+        [worldStructurePosition[0] + worldPosition[0], worldStructurePosition[2] + worldPosition[2]],
+        rotation * math.pi / 2)
+
+    worldPosition[0] = int(worldPosition[0]) - referencePoint[0]
+    worldPosition[1] = worldStructurePosition[1] + worldPosition[1] - referencePoint[1]
+    worldPosition[2] = int(worldPosition[2]) - referencePoint[2]
+    return worldPosition
+
+
+def get_corners_local_positions_reference(size, referencePosition, flip, rotation):
+    """BaseStructure.getCornersLocalPositions before the rotation matrices, rotating with trigonometry"""
+    refPos = list(referencePosition)
+    if flip in (1, 3):
+        refPos[0] = size[0] - 1 - refPos[0]
+    if flip in (2, 3):
+        refPos[2] = size[2] - 1 - refPos[2]
+
+    temp = projectMath.rotatePointAround([0, 0], [-refPos[0], -refPos[2]], math.pi / 2 * rotation)
+    temp1 = projectMath.rotatePointAround([0, 0], [size[0] - 1 - refPos[0], size[2] - 1 - refPos[2]],
+                                          math.pi / 2 * rotation)
+    return [int(min(temp[0], temp1[0])), int(min(temp[1], temp1[1])),
+            int(max(temp[0], temp1[0])), int(max(temp[1], temp1[1]))]
+
+
+def make_structure(size):
+    structure = BaseStructure()
+    structure.setInfo({})
+    structure.setSize(size)
+    return structure
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_transforms_match_trigonometry(seed):
+    rng = random.Random(seed)
+    size = [rng.randint(1, 20), rng.randint(1, 10), rng.randint(1, 20)]
+    structure = make_structure(size)
+    reference = [rng.randint(-5, 25), rng.randint(0, 5), rng.randint(-5, 25)]
+
+    for flip in range(4):
+        for rotation in range(4):
+            point = [rng.randint(0, 20), rng.randint(0, 9), rng.randint(0, 20)]
+            referencePoint = [rng.randint(-50, 50) for _ in range(3)]
+            worldPosition = [rng.randint(-500, 500) for _ in range(3)]
+            assert structure.returnWorldPosition(point, flip, rotation, referencePoint, worldPosition) == \
+                return_world_position_reference(size, point, flip, rotation, referencePoint, worldPosition)
+            assert structure.getCornersLocalPositions(reference, flip, rotation) == \
+                get_corners_local_positions_reference(size, reference, flip, rotation)
+
+
+def test_all_flip_rotation_corners_in_flip_then_rotation_order():
+    size = [7, 3, 12]
+    structure = make_structure(size)
+    reference = [2, 0, 9]
+
+    corners = structure.getCornersLocalPositionsAllFlipRotation(reference)
+
+    assert corners == [get_corners_local_positions_reference(size, reference, flip, rotation)
+                       for flip in range(4) for rotation in range(4)]
+    assert structure.getCornersLocalPositionsAllFlipRotation(reference, (3,), (1, 2)) == corners[13:15]
@@ -0,0 +1,185 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from conftest import make_world_slice
+from lib.lookup import BIOMES
+from util.biomes import BiomeMap
+
+# slices whose first chunk is not at the origin, in negative and positive coordinates
+RECTS = [(-20, 37, 45, 80), (37, -45, 90, 3)]
+
+
+def chunk_biome(world_slice, cell_x, cell_y, cell_z):
+    """Biome of a cell read from the chunk arrays, cells counted from the first chunk corner"""
+    chunk = cell_x // 4 + cell_z // 4 * world_slice.chunkRect[2]
+    return int(world_slice.biomes[chunk][cell_x % 4 + 4 * (cell_z % 4) + 16 * cell_y])
+
+
+def cells_in_box(world_slice, x1, y1, z1, x2, y2, z2):
+    """Biomes of all cells overlapping a box of global blocks, one cell at a time"""
+    origin_x, origin_z = world_slice.chunkRect[0] * 16, world_slice.chunkRect[1] * 16
+    biomes = []
+    for cell_x in range(world_slice.chunkRect[2] * 4):
+        for cell_y in range(64):
+            for cell_z in range(world_slice.chunkRect[3] * 4):
+                x, z = origin_x + 4 * cell_x, origin_z + 4 * cell_z
+                if x <= x2 and x + 3 >= x1 and 4 * cell_y <= y2 and 4 * cell_y + 3 >= y1 and z <= z2 and z + 3 >= z1:
+                    biomes.append(chunk_biome(world_slice, cell_x, cell_y, cell_z))
+    return biomes
+
+
+def mode(biomes):
+    counts = Counter(biomes)
+    return min(counts, key=lambda biome: (-counts[biome], biome))
+
+
+@pytest.mark.parametrize("rect", RECTS)
+def test_biome_at(rect):
+    world_slice = make_world_slice(*rect)
+    rng = np.random.default_rng(0)
+    xs = rng.integers(world_slice.rect[0], world_slice.rect[0] + world_slice.rect[2], 200)
+    zs = rng.integers(world_slice.rect[1], world_slice.rect[1] + world_slice.rect[3], 200)
+    for x, y, z in zip(xs.tolist(), rng.integers(0, 256, 200).tolist(), zs.tolist()):
+        cell_x = ((x >> 4) - world_slice.chunkRect[0]) * 4 + ((x & 15) >> 2)
+        cell_z = ((z >> 4) - world_slice.chunkRect[1]) * 4 + ((z & 15) >> 2)
+        assert world_slice.getBiomeAt(x, y, z) == BIOMES[chunk_biome(world_slice, cell_x, y >> 2, cell_z)]
+
+
+@pytest.mark.parametrize("rect", RECTS)
+@pytest.mark.parametrize("box", [
+    (-20, 0, 37, 44, 255, 79),
+    (-3, 60, 50, 9, 70, 51),
+    (50, 30, 5, 40, 10, -7),
+    # partly and wholly outside the grid
+    (-100, -10, -100, 0, 20, 40),
+    (1000, 0, 1000, 1010, 10, 1010),
+])
+def test_biome_histogram_and_mode(rect, box):
+    world_slice = make_world_slice(*rect)
+    x1, y1, z1, x2, y2, z2 = box
+    box = min(x1, x2), min(y1, y2), min(z1, z2), max(x1, x2), max(y1, y2), max(z1, z2)
+    biomes = cells_in_box(world_slice, *box)
+
+    histogram = world_slice.getBiomeHistogram(x1, y1, z1, x2, y2, z2)
+    assert histogram.sum() == len(biomes)
+    assert {biome: count for biome, count in enumerate(histogram.tolist()) if count} == Counter(biomes)
+    if biomes:
+        assert world_slice.getBiomeMode(x1, y1, z1, x2, y2, z2) == mode(biomes)
+
+
+@pytest.mark.parametrize("rect", RECTS)
+def test_biome_mode_of_the_whole_slice(rect):
+    world_slice = make_world_slice(*rect)
+    biomes = world_slice.biomes.ravel().tolist()
+
+    assert world_slice.getBiomeHistogram().tolist()[:max(biomes) + 1] == \
+        [Counter(biomes)[biome] for biome in range(max(biomes) + 1)]
+    assert world_slice.getBiomeMode() == mode(biomes)
+
+
+def test_biome_mode_ties_to_the_lowest_id():
+    world_slice = make_world_slice(0, 0, 16, 16)
+    world_slice.biomes[:] = np.tile([7, 4], 512)
+    world_slice._buildBiomeGrid()
+
+    assert world_slice.getBiomeMode() == 4
+    assert world_slice.getBiomeMode(0, 0, 0, 7, 255, 3) == 4
+    assert world_slice.getPrimaryBiomeNear(5, 64, 5) == BIOMES[4]
+    assert world_slice.getBiomesNear(5, 64, 5) == [BIOMES[4], BIOMES[7]]
+
+
+@pytest.mark.parametrize("rect", RECTS)
+@pytest.mark.parametrize("region_size, y1, y2", [(16, 0, 255), (8, 60, 70), (20, 0, 3), (4, 100, 300)])
+def test_region_biomes(rect, region_size, y1, y2):
+    world_slice = make_world_slice(*rect)
+    # two biomes in about equal numbers, so the majorities are close
+    world_slice.biomes = np.where(world_slice.biomes < 5, 1, 24).astype(np.int32)
+    world_slice._buildBiomeGrid()
+    cells = max(region_size >> 2, 1)
+    regions = {}
+    for cell_x in range(world_slice.chunkRect[2] * 4):
+        for cell_y in range(max(y1 >> 2, 0), min((y2 >> 2) + 1, 64)):
+            for cell_z in range(world_slice.chunkRect[3] * 4):
+                regions.setdefault((cell_x // cells, cell_z // cells), []).append(
+                    chunk_biome(world_slice, cell_x, cell_y, cell_z))
+
+    result = world_slice.getRegionBiomes(region_size, y1, y2)
+
+    assert result.shape == (max(regions)[0] + 1, max(key[1] for key in regions) + 1)
+    for (region_x, region_z), biomes in regions.items():
+        assert result[region_x, region_z] == mode(biomes)
+
+
+def test_region_biomes_tie_to_the_lowest_id():
+    world_slice = make_world_slice(0, 0, 32, 16)
+    # the first chunk is half 24 and half 1, the second all 24
+    world_slice.biomes[0] = np.tile([24, 1], 512)
+    world_slice.biomes[1] = 24
+    world_slice._buildBiomeGrid()
+
+    assert world_slice.getRegionBiomes(16).tolist() == [[1], [24]]
+
+
+def column_cell(world_slice, x, z):
+    return ((x >> 4) - world_slice.chunkRect[0]) * 4 + ((x & 15) >> 2), \
+           ((z >> 4) - world_slice.chunkRect[1]) * 4 + ((z & 15) >> 2)
+
+
+@pytest.mark.parametrize("rect", RECTS)
+def test_column_biomes_use_the_surface_cell(repo_root, rect):
+    world_slice = make_world_slice(*rect)
+    heightmap = world_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"]
+    # columns without blocks and with blocks up to the build limit
+    heightmap[0, :5] = 0
+    heightmap[1, :5] = 256
+    biome_map = BiomeMap(world_slice)
+
+    x0, z0, dx, dz = world_slice.rect
+    assert biome_map.biomes.shape == (dx, dz)
+    for x in range(x0, x0 + dx):
+        for z in range(z0, z0 + dz):
+            cell_x, cell_z = column_cell(world_slice, x, z)
+            cell_y = min(max((int(heightmap[x - x0, z - z0]) - 1) // 4, 0), 63)
+            assert biome_map.get_biome(x, z) == chunk_biome(world_slice, cell_x, cell_y, cell_z)
+
+
+def test_column_biomes_without_heightmap(repo_root):
+    world_slice = make_world_slice(-20, 37, 45, 80)
+    del world_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"]
+
+    biomes = BiomeMap.calc_column_biomes(world_slice)
+    for x, z in [(-20, 37), (0, 50), (44, 79)]:
+        cell_x, cell_z = column_cell(world_slice, x, z)
+        assert biomes[x + 20, z - 37] == chunk_biome(world_slice, cell_x, 16, cell_z)
+
+
+def test_biome_lookups_are_clipped_to_the_slice(repo_root):
+    world_slice = make_world_slice(-20, 37, 45, 80)
+    biome_map = BiomeMap(world_slice)
+
+    assert biome_map.get_biome(-1000, 50) == biome_map.get_biome(-20, 50)
+    assert biome_map.get_biome(10, 1000) == biome_map.get_biome(10, 79)
+    assert biome_map.get_biome(45, 36) == biome_map.get_biome(44, 37)
+    assert biome_map.get_biome([-21, 0, 100], [40, 40, 40]).tolist() == \
+        [biome_map.get_biome(x, 40) for x in (-20, 0, 44)]
+
+
+def test_biome_blocks_by_category(repo_root):
+    world_slice = make_world_slice(-20, 37, 45, 80)
+    biome_map = BiomeMap(world_slice)
+    with open("data/biome.txt") as biome_file:
+        # ids without a line of their own have no category
+        categories = [line.partition(":")[2] or "-1" for line in biome_file.read().splitlines()]
+
+    seen = set()
+    for x in range(-20, 45):
+        for z in range(37, 80):
+            biome = int(biome_map.get_biome(x, z))
+            assert biome_map.get_category(x, z) == int(categories[biome])
+            # swamps have blocks of their own, rivers and oceans use the ones of category 0
+            category = categories[biome] if categories[biome] in biome_map.biome_blocks else "0"
+            assert biome_map.get_biome_blocks(x, z) == biome_map.biome_blocks[category]
+            seen.add(category == categories[biome])
+    assert seen == {True, False}
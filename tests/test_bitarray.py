@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from lib.bitarray import BitArray, unpackLongArray
+
+
+@pytest.mark.parametrize("bits_per_entry", [1, 4, 5, 9, 13, 16, 17, 32])
+def test_unpack_long_array_matches_bit_array(bits_per_entry):
+    rng = np.random.default_rng(bits_per_entry)
+    array_size = 4096 if bits_per_entry <= 16 else 300
+    entries_per_long = 64 // bits_per_entry
+    longs = rng.integers(np.iinfo(np.int64).min, np.iinfo(np.int64).max, -(-array_size // entries_per_long),
+                         dtype=np.int64, endpoint=True)
+    bit_array = BitArray(bits_per_entry, array_size, [int(value) for value in longs])
+
+    unpacked = unpackLongArray(longs, bits_per_entry, array_size)
+
+    assert unpacked.shape == (array_size,)
+    assert unpacked.tolist() == [bit_array.getAt(i) for i in range(array_size)]
+    assert np.array_equal(bit_array.getAll(), unpacked)
+
+
+def test_unpack_long_array_decodes_rows_at_once():
+    rng = np.random.default_rng(0)
+    longs = rng.integers(np.iinfo(np.int64).min, np.iinfo(np.int64).max, (6, 37), dtype=np.int64)
+
+    unpacked = unpackLongArray(longs, 9, 256)
+
+    assert unpacked.shape == (6, 256)
+    for row, packed in zip(unpacked, longs):
+        assert np.array_equal(row, unpackLongArray(packed, 9, 256))
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from lib.interfaceUtils import BlockCache, Interface, WrittenBlocks
+
+AREA = (10, 0, -5, 20, 256, 5)
+
+
+def test_inside_the_area_blocks_are_kept_densely():
+    cache = BlockCache(2, AREA)
+    assert cache.blockIds is None
+    assert (12, 60, 0) not in cache
+    assert cache.get((12, 60, 0), "default") == "default"
+
+    cache[(12, 60, 0)] = "minecraft:stone"
+    cache[(19, 255, 4)] = "minecraft:oak_log[axis=x]"
+    cache[(10, 0, -5)] = "minecraft:stone"
+
+    assert cache.blockIds.shape == (10, 256, 10)
+    assert cache.blockIds.dtype == np.uint16
+    assert cache[(12, 60, 0)] == cache[(10, 0, -5)] == "minecraft:stone"
+    assert cache.get((19, 255, 4)) == "minecraft:oak_log[axis=x]"
+    assert len(cache) == 3 and len(cache.outside) == 0
+
+    del cache[(12, 60, 0)]
+    assert (12, 60, 0) not in cache
+    with pytest.raises(KeyError):
+        cache[(12, 60, 0)]
+    with pytest.raises(KeyError):
+        del cache[(12, 60, 0)]
+
+
+def test_outside_the_area_the_least_recently_used_block_is_evicted():
+    cache = BlockCache(2, AREA)
+    cache[(20, 60, 0)] = "a"
+    cache[(9, 60, 0)] = "b"
+    assert cache[(20, 60, 0)] == "a"
+    cache[(10, 60, 5)] = "c"
+
+    assert (20, 60, 0) in cache and (10, 60, 5) in cache
+    assert (9, 60, 0) not in cache
+    assert cache.blockIds is None
+
+
+def test_forget_box_drops_an_inclusive_box_inside_and_outside():
+    cache = BlockCache(1000, AREA)
+    positions = [(x, 60, z) for x in range(8, 23) for z in range(-7, 8)]
+    for position in positions:
+        cache[position] = "minecraft:stone"
+
+    cache.forgetBox(21, 61, 3, 11, 59, -6)
+
+    for x, y, z in positions:
+        assert ((x, y, z) in cache) == (not (11 <= x <= 21 and -6 <= z <= 3))
+
+
+def test_ids_are_promoted_to_32_bits_keeping_blocks_and_marks():
+    cache = BlockCache(8, AREA)
+    written = WrittenBlocks(cache)
+    written[(11, 1, 1)] = "minecraft:glass"
+    cache[(12, 1, 1)] = "minecraft:sand"
+
+    for i in range(1 << 15):
+        cache[(13, 1 + i % 200, 1)] = f"minecraft:block_{i}"
+
+    assert cache.blockIds.dtype == np.uint32
+    assert cache[(13, 1 + (32767 % 200), 1)] == "minecraft:block_32767"
+    assert cache[(11, 1, 1)] == written[(11, 1, 1)] == "minecraft:glass"
+    assert cache[(12, 1, 1)] == "minecraft:sand"
+    assert (11, 1, 1) in written and (12, 1, 1) not in written
+    written[(14, 1, 1)] = "minecraft:block_40000"
+    assert written[(14, 1, 1)] == "minecraft:block_40000"
+
+
+def test_written_blocks_are_marks_in_the_cache():
+    cache = BlockCache(8, AREA)
+    written = WrittenBlocks(cache, 8)
+    cache[(12, 60, 0)] = "minecraft:stone"
+    assert (12, 60, 0) not in written
+    assert written.get((12, 60, 0)) is None
+
+    written[(12, 60, 0)] = "minecraft:glass"
+    assert written[(12, 60, 0)] == cache[(12, 60, 0)] == "minecraft:glass"
+    assert len(written) == 1
+
+    # a block read from the world replaces what was written
+    cache[(12, 60, 0)] = "minecraft:dirt"
+    assert (12, 60, 0) not in written
+
+    written[(12, 60, 0)] = "minecraft:glass"
+    del written[(12, 60, 0)]
+    assert (12, 60, 0) not in written and cache[(12, 60, 0)] == "minecraft:glass"
+
+    # outside the area the written blocks are not evicted with the cache
+    written[(50, 60, 0)] = "minecraft:glass"
+    assert (50, 60, 0) in written and (50, 60, 0) not in cache
+
+    written[(13, 60, 0)] = "minecraft:glass"
+    cache.forgetBox(13, 60, 0, 13, 60, 0)
+    written.forgetBox(50, 60, 0, 50, 60, 0)
+    assert len(written) == 0
+
+
+def test_an_interface_keeps_one_dense_array():
+    interface = Interface(caching=True)
+    interface.cache.clear()
+    interface.setBlock(5, 60, 5, "minecraft:stone")
+
+    assert interface.written.cache is interface.cache
+    assert interface.written[(5, 60, 5)] == "minecraft:stone"
+    assert interface.cache.blockIds.nbytes == 2 * np.prod(interface.cache.shape)
@@ -0,0 +1,110 @@
+import pytest
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+import lib.direct_interface as di
+
+
+class FailingSession:
+    """Stand-in for di.session raising the given errors in turn, then answering"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url))
+        if self.errors:
+            raise self.errors.pop(0)
+        response = di.requests.Response()
+        response.status_code = 200
+        response._content = b"1"
+        return response
+
+
+def refused():
+    """The error requests raises when nothing listens on the port"""
+    reason = NewConnectionError(None, "Failed to establish a new connection: [Errno 111] Connection refused")
+    return ConnectionError(MaxRetryError(None, "/command", reason=reason))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waited = []
+    monkeypatch.setattr(di.time, "sleep", waited.append)
+    di.resetLatencyStats()
+    yield waited
+    di.resetLatencyStats()
+
+
+def use_session(monkeypatch, *errors):
+    session = FailingSession(*errors)
+    monkeypatch.setattr(di, "session", session)
+    return session
+
+
+def test_never_sent():
+    assert di._neverSent(ConnectTimeout())
+    assert di._neverSent(refused())
+    assert not di._neverSent(ReadTimeout())
+    assert not di._neverSent(ConnectionError("Connection aborted."))
+
+
+@pytest.mark.parametrize("method", ["get", "put"])
+def test_idempotent_requests_are_retried_with_backoff(monkeypatch, sleeps, method):
+    session = use_session(monkeypatch, ReadTimeout(), refused(), ConnectTimeout())
+
+    assert di.request(method, "/blocks").text == "1"
+    assert len(session.calls) == 4
+    assert sleeps == [di.BACKOFF, 2 * di.BACKOFF, 4 * di.BACKOFF]
+
+
+def test_retries_run_out(monkeypatch, sleeps):
+    session = use_session(monkeypatch, *[ReadTimeout()] * 3)
+
+    with pytest.raises(ReadTimeout):
+        di.request("get", "/blocks", retries=2)
+    assert len(session.calls) == 3
+
+
+def test_command_is_not_sent_again_after_read_timeout(monkeypatch, sleeps):
+    session = use_session(monkeypatch, ReadTimeout())
+
+    with pytest.raises(ReadTimeout):
+        di.request("post", "/command", data=b"summon minecraft:villager 0 64 0")
+    assert len(session.calls) == 1
+    assert sleeps == []
+    assert di.runCommand("summon minecraft:villager 0 64 0") == "1"
+
+
+def test_command_is_retried_if_never_sent(monkeypatch, sleeps):
+    session = use_session(monkeypatch, ConnectTimeout(), refused())
+
+    assert di.runCommand("summon minecraft:villager 0 64 0") == "1"
+    assert len(session.calls) == 3
+
+
+def test_send_blocks_reports_failed_request(monkeypatch, sleeps):
+    use_session(monkeypatch, *[refused()] * 3)
+
+    assert di.sendBlocks([(0, 0, 0, "minecraft:stone")], retries=2).startswith(di.REQUEST_FAILED)
+
+
+def test_latency_stats(monkeypatch, sleeps):
+    session = use_session(monkeypatch, ReadTimeout())
+    di.request("get", "/blocks")
+    di.request("get", "/blocks")
+    session.errors.append(ReadTimeout())
+    with pytest.raises(ReadTimeout):
+        di.request("post", "/command")
+
+    stats = di.getLatencyStats()
+    assert stats.keys() == {"GET /blocks", "POST /command"}
+    assert (stats["GET /blocks"]["requests"], stats["GET /blocks"]["failures"]) == (3, 1)
+    assert (stats["POST /command"]["requests"], stats["POST /command"]["failures"]) == (1, 1)
+    for endpoint in stats.values():
+        assert endpoint["mean"] == pytest.approx(endpoint["total"] / endpoint["requests"])
+        assert 0 <= endpoint["max"] <= endpoint["total"]
+
+    di.resetLatencyStats()
+    assert di.getLatencyStats() == {}
@@ -0,0 +1,395 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from conftest import FAKE_BLOCKS, fake_block_ids
+import lib.direct_interface as di
+from lib.interfaceUtils import FILL_VOLUME_LIMIT, AdaptiveBatchSize, Interface, fillCommands, splitBox
+
+
+def expected_names(positions):
+    return [FAKE_BLOCKS[int(fake_block_ids(x, y, z))] for x, y, z in positions]
+
+
+def test_get_blocks_at_reads_a_compact_box_at_once(fake_server):
+    interface = Interface()
+    positions = [(x, y, z) for x in range(3, 40, 5) for y in (55, 62, 70) for z in range(-20, 10, 7)]
+
+    assert interface.getBlocksAt(positions) == expected_names(positions)
+    assert fake_server.count("GET", "/chunks") == 1
+    assert fake_server.count("GET", "/blocks") == 0
+
+
+def test_get_blocks_at_reads_scattered_blocks_by_chunk(fake_server):
+    interface = Interface()
+    positions = [(1, 60, 1), (2, 61, 3), (1000, 62, 1000), (-1000, 63, 500)]
+
+    assert interface.getBlocksAt(positions) == expected_names(positions)
+    chunks = [request[2] for request in fake_server.requests if request[1] == "/chunks"]
+    assert len(chunks) == 3
+    assert all(chunk["dx"] == chunk["dz"] == "1" for chunk in chunks)
+
+
+def test_get_blocks_at_caches_reads(fake_server):
+    interface = Interface(caching=True)
+    positions = [(x, 60, 0) for x in range(16)]
+
+    interface.getBlocksAt(positions)
+    interface.setBlock(0, 60, 0, "minecraft:gold_block")
+    names = interface.getBlocksAt(positions + [(0, 300, 0)])
+
+    assert fake_server.count("GET", "/chunks") == 1
+    assert names[0] == "minecraft:gold_block"
+    assert names[1:16] == expected_names(positions[1:])
+    # heights outside the world are asked block by block
+    assert fake_server.count("GET", "/blocks") == 1
+    interface.buffer.clear()
+
+
+class HeldSends:
+    """
+    Stand-in for di.sendBlocks whose requests are answered when the test releases them, in any order
+
+    Requests are kept as [blocks, answer, released] in the order they were sent, unanswered ones place every block.
+    """
+
+    def __init__(self):
+        self.hold = True
+        self.sends = []
+        self.condition = threading.Condition()
+
+    def __call__(self, blocks, x=0, y=0, z=0, retries=5, flags='0100011'):
+        send = [list(blocks), None, not self.hold]
+        with self.condition:
+            self.sends.append(send)
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: send[2], timeout=10)
+        return send[1] if send[1] is not None else "\n".join("1" for _ in blocks)
+
+    def release(self, index, answer=None):
+        with self.condition:
+            self.sends[index][1:] = answer, True
+            self.condition.notify_all()
+
+    def wait_for_sends(self, count):
+        with self.condition:
+            assert self.condition.wait_for(lambda: len(self.sends) >= count, timeout=10)
+
+    def finish(self):
+        with self.condition:
+            self.hold = False
+            for send in self.sends:
+                send[2] = True
+            self.condition.notify_all()
+
+
+@pytest.fixture
+def held_sends(monkeypatch):
+    sends = HeldSends()
+    monkeypatch.setattr(di, "sendBlocks", sends)
+    yield sends
+    sends.finish()
+
+
+def pipelined_interface(**kwargs):
+    return Interface(buffering=True, bufferlimit=1000, pipelining=True, **kwargs)
+
+
+def in_thread(function):
+    thread = threading.Thread(target=function, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_disjoint_batches_are_in_flight_together(held_sends):
+    interface = pipelined_interface()
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.sendBlocks()
+    interface.setBlock(1, 10, 0, "minecraft:stone")
+    interface.sendBlocks()
+
+    held_sends.wait_for_sends(2)
+    held_sends.release(1)
+    held_sends.release(0)
+    interface.flush()
+    assert len(held_sends.sends) == 2
+
+
+def test_batch_waits_for_batches_writing_the_same_positions(held_sends):
+    interface = pipelined_interface()
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.sendBlocks()
+    interface.setBlock(0, 10, 0, "minecraft:dirt")
+    sender = in_thread(interface.sendBlocks)
+
+    held_sends.wait_for_sends(1)
+    time.sleep(0.2)
+    assert sender.is_alive()
+    assert len(held_sends.sends) == 1
+
+    held_sends.release(0)
+    sender.join(10)
+    held_sends.wait_for_sends(2)
+    assert held_sends.sends[1][0] == [(0, 10, 0, "minecraft:dirt")]
+    held_sends.finish()
+    interface.flush()
+
+
+def test_failed_batch_is_requeued_behind_later_writes(held_sends):
+    interface = pipelined_interface()
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.setBlock(1, 10, 0, "minecraft:stone")
+    interface.sendBlocks()
+    interface.setBlock(0, 10, 0, "minecraft:dirt")
+
+    held_sends.wait_for_sends(1)
+    held_sends.hold = False
+    held_sends.release(0, di.REQUEST_FAILED + ": connection refused")
+    interface.flush()
+
+    assert len(held_sends.sends) == 2
+    assert sorted(held_sends.sends[1][0]) == [(0, 10, 0, "minecraft:dirt"), (1, 10, 0, "minecraft:stone")]
+    assert interface.buffer == {}
+
+
+def test_batch_failing_twice_stays_in_buffer(held_sends):
+    interface = pipelined_interface()
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    failed = in_thread(interface.flush)
+
+    for index in range(2):
+        held_sends.wait_for_sends(index + 1)
+        held_sends.release(index, di.REQUEST_FAILED + ": connection refused")
+    failed.join(10)
+
+    assert interface.buffer == {(0, 10, 0): "minecraft:stone"}
+    interface.buffer.clear()
+
+
+def test_rejected_blocks_are_forgotten(held_sends):
+    interface = pipelined_interface(caching=True)
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.setBlock(1, 10, 0, "minecraft:stone")
+    interface.setBlock(2, 10, 0, "minecraft:stone")
+    interface.sendBlocks()
+    interface.setBlock(2, 10, 0, "minecraft:dirt")
+
+    held_sends.wait_for_sends(1)
+    held_sends.hold = False
+    held_sends.release(0, "1\nUnknown block\nUnknown block")
+    interface.flush()
+
+    assert interface.written.get((0, 10, 0)) == "minecraft:stone"
+    assert (1, 10, 0) not in interface.written
+    assert (1, 10, 0) not in interface.cache
+    # the later write of the position was placed
+    assert interface.written.get((2, 10, 0)) == "minecraft:dirt"
+    assert interface.cache[(2, 10, 0)] == "minecraft:dirt"
+
+
+def test_flush_waits_for_all_batches(held_sends):
+    interface = pipelined_interface()
+    for x in range(3):
+        interface.setBlock(x, 10, 0, "minecraft:stone")
+        interface.sendBlocks()
+    interface.setBlock(5, 10, 0, "minecraft:stone")
+    barrier = in_thread(interface.flush)
+
+    held_sends.wait_for_sends(4)
+    for index in (3, 1, 0):
+        held_sends.release(index)
+    time.sleep(0.2)
+    assert barrier.is_alive()
+
+    held_sends.release(2)
+    barrier.join(10)
+    assert not barrier.is_alive()
+    assert interface.buffer == {}
+
+
+class RecordedSends:
+    """Stand-in for di.sendBlocks answering with the given responses in turn, then placing every block"""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.sends = []
+
+    def __call__(self, blocks, x=0, y=0, z=0, retries=5, flags='0100011'):
+        self.sends.append(list(blocks))
+        if self.answers:
+            return self.answers.pop(0)
+        return "\n".join("1" for _ in blocks)
+
+
+def test_buffer_keeps_the_last_write_per_position(monkeypatch):
+    sends = RecordedSends()
+    monkeypatch.setattr(di, "sendBlocks", sends)
+    interface = Interface(5, 0, 5, buffering=True)
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.setBlock(1, 10, 0, "minecraft:stone")
+    interface.setBlock(0, 10, 0, "minecraft:dirt")
+
+    assert interface.buffer == {(5, 10, 5): "minecraft:dirt", (6, 10, 5): "minecraft:stone"}
+    interface.sendBlocks()
+    assert sends.sends == [[(5, 10, 5, "minecraft:dirt"), (6, 10, 5, "minecraft:stone")]]
+    assert interface.getWriteStats() == {"writes": 3, "coalesced": 1, "unchanged": 0, "eliminated": 1}
+
+
+def test_repeated_writes_are_unchanged(monkeypatch):
+    sends = RecordedSends()
+    monkeypatch.setattr(di, "sendBlocks", sends)
+    interface = Interface(buffering=True, caching=True)
+    for block in ("minecraft:stone", "minecraft:stone", "minecraft:dirt", "minecraft:dirt"):
+        interface.setBlock(0, 10, 0, block)
+    interface.sendBlocks()
+    interface.setBlock(0, 10, 0, "minecraft:dirt")
+    interface.setBlock(1, 10, 0, "minecraft:dirt")
+    interface.sendBlocks()
+
+    assert sends.sends == [[(0, 10, 0, "minecraft:dirt")], [(1, 10, 0, "minecraft:dirt")]]
+    assert interface.getWriteStats() == {"writes": 6, "coalesced": 1, "unchanged": 3, "eliminated": 4}
+
+
+def test_rejected_block_is_written_again(monkeypatch):
+    answers = iter(["Unknown block", "1"])
+    monkeypatch.setattr(di, "setBlock", lambda *args, **kwargs: next(answers))
+    interface = Interface(caching=True)
+
+    assert interface.setBlock(0, 10, 0, "minecraft:stone") == "Unknown block"
+    assert (0, 10, 0) not in interface.written
+    assert interface.setBlock(0, 10, 0, "minecraft:stone") == "1"
+    assert interface.written[(0, 10, 0)] == "minecraft:stone"
+    assert interface.getWriteStats()["unchanged"] == 0
+
+
+def test_failed_buffer_is_kept_until_placed(monkeypatch):
+    sends = RecordedSends(di.REQUEST_FAILED + ": connection refused")
+    monkeypatch.setattr(di, "sendBlocks", sends)
+    interface = Interface(buffering=True, caching=True)
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.sendBlocks()
+
+    assert interface.buffer == {(0, 10, 0): "minecraft:stone"}
+    # the block is still to be placed, so repeating it changes nothing
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.sendBlocks()
+    assert sends.sends == [[(0, 10, 0, "minecraft:stone")]] * 2
+    assert interface.buffer == {}
+    assert interface.written[(0, 10, 0)] == "minecraft:stone"
+
+
+def test_rejected_batch_block_is_written_again(monkeypatch):
+    sends = RecordedSends("1\nUnknown block")
+    monkeypatch.setattr(di, "sendBlocks", sends)
+    interface = Interface(buffering=True, bufferlimit=1000, pipelining=True, caching=True)
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.setBlock(1, 10, 0, "minecraft:stone")
+    interface.flush()
+    interface.setBlock(0, 10, 0, "minecraft:stone")
+    interface.setBlock(1, 10, 0, "minecraft:stone")
+    interface.flush()
+
+    assert sends.sends[1] == [(1, 10, 0, "minecraft:stone")]
+    assert interface.getWriteStats()["unchanged"] == 1
+
+
+@pytest.mark.parametrize("box, limit", [
+    ((0, 0, 0, 9, 9, 9), 1000),
+    ((-5, 3, 7, 300, 90, 12), FILL_VOLUME_LIMIT),
+    ((10, 255, 10, -40, 0, -3), FILL_VOLUME_LIMIT),
+    ((0, 0, 0, 31, 31, 32), 32768),
+    ((0, 0, 0, 6, 0, 0), 2),
+])
+def test_split_box_covers_the_box_within_the_limit(box, limit):
+    x1, y1, z1, x2, y2, z2 = box
+    covered = np.zeros((abs(x2 - x1) + 1, abs(y2 - y1) + 1, abs(z2 - z1) + 1), dtype=int)
+    low = min(x1, x2), min(y1, y2), min(z1, z2)
+    for bx1, by1, bz1, bx2, by2, bz2 in splitBox(*box, limit=limit):
+        assert bx1 <= bx2 and by1 <= by2 and bz1 <= bz2
+        assert (bx2 - bx1 + 1) * (by2 - by1 + 1) * (bz2 - bz1 + 1) <= limit
+        covered[bx1 - low[0]:bx2 - low[0] + 1, by1 - low[1]:by2 - low[1] + 1, bz1 - low[2]:bz2 - low[2] + 1] += 1
+    assert (covered == 1).all()
+
+
+def test_fill_commands():
+    assert fillCommands(0, 0, 0, 3, 1, 0, "minecraft:stone", limit=4) == [
+        "fill 0 0 0 1 1 0 minecraft:stone",
+        "fill 2 0 0 3 1 0 minecraft:stone",
+    ]
+    assert fillCommands(5, 6, 7, 1, 2, 3, "minecraft:air", "minecraft:water") == [
+        "fill 1 2 3 5 6 7 minecraft:air replace minecraft:water"]
+
+
+def test_fill_drops_buffered_writes_in_the_region(monkeypatch):
+    commands = []
+
+    def run_command(command):
+        commands.extend(command.split("\n"))
+        return "\n".join("1" for _ in command.split("\n"))
+
+    sends = RecordedSends()
+    monkeypatch.setattr(di, "sendBlocks", sends)
+    monkeypatch.setattr(di, "runCommand", run_command)
+    interface = Interface(10, 0, 0, buffering=True, caching=True)
+    interface.setBlock(1, 5, 1, "minecraft:stone")
+    interface.setBlock(3, 5, 3, "minecraft:stone")
+    interface.setBlock(9, 5, 9, "minecraft:stone")
+
+    assert interface.fill(0, 0, 0, 4, 9, 4, "minecraft:air") == ["1"]
+    assert commands == ["fill 10 0 0 14 9 4 minecraft:air"]
+    assert interface.buffer == {(19, 5, 9): "minecraft:stone"}
+    assert interface.getWriteStats()["coalesced"] == 2
+    # the filled blocks are no longer known to be written
+    assert (11, 5, 1) not in interface.written
+
+    interface.replace(0, 0, 0, 9, 9, 9, "minecraft:stone", "minecraft:dirt")
+    # the server has to see the buffered block before replacing
+    assert sends.sends == [[(19, 5, 9, "minecraft:stone")]]
+    assert commands[-1] == "fill 10 0 0 19 9 9 minecraft:dirt replace minecraft:stone"
+
+
+def test_batch_size_climbs_while_throughput_holds():
+    batch_size = AdaptiveBatchSize(1000)
+
+    assert batch_size.record(1000, 1.0) == 1250
+    assert batch_size.record(1250, 1.25) == 1562
+    # throughput dropped, so the size turns around
+    assert batch_size.record(1562, 3.0) == 1249
+    # compared with the smoothed throughput, so it keeps shrinking
+    assert batch_size.record(1249, 1.3) == 999
+    assert (batch_size.batches, batch_size.blocks) == (4, 5061)
+    assert batch_size.totalThroughput() == pytest.approx(5061 / 6.55)
+
+
+def test_batch_size_halves_on_failure():
+    batch_size = AdaptiveBatchSize(1000)
+
+    assert batch_size.record(1000, 0.1, failed=True) == 500
+    assert batch_size.errorRate == pytest.approx(0.3)
+    # keeps shrinking until throughput drops
+    assert batch_size.record(500, 0.5) == 400
+    assert batch_size.record(400, 0.4) == 320
+
+
+def test_batch_size_is_clamped():
+    assert AdaptiveBatchSize(10).size == 128
+    assert AdaptiveBatchSize(10 ** 6).size == 8192
+
+    batch_size = AdaptiveBatchSize(150, minimum=128, maximum=1000)
+    assert batch_size.record(150, 1.0, failed=True) == 128
+    assert batch_size.record(128, 1.0) == 128
+
+    batch_size = AdaptiveBatchSize(900, minimum=128, maximum=1000)
+    assert batch_size.record(900, 1.0) == 1000
+    assert batch_size.record(1000, 1.0) == 1000
+
+
+def test_partial_batches_keep_the_batch_size():
+    batch_size = AdaptiveBatchSize(1000)
+
+    assert batch_size.record(100, 10.0) == 1000
+    assert batch_size.throughput is None
+    assert batch_size.latency == 10.0
+    assert batch_size.record(1000, 1.0) == 1250
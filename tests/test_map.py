@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from benchmarks.clear_heightmap import calc_clear_heightmap_loop
+from conftest import make_world_slice
+from util.map import Map
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_calc_clear_heightmap_matches_loop(seed):
+    loop_slice = make_world_slice(-7, 21, 50, 60, seed)
+    vectorized_slice = make_world_slice(-7, 21, 50, 60, seed)
+    surface = loop_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"].copy()
+
+    expected = calc_clear_heightmap_loop(loop_slice)
+    result = Map.calc_clear_heightmap(vectorized_slice)
+
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+    assert (result < surface).any()
+    # both remove the trunks from the world slice heightmap in place
+    assert np.array_equal(vectorized_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"],
+                          loop_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"])
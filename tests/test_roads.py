@@ -0,0 +1,188 @@
+import heapq
+
+import numpy as np
+import pytest
+
+from village_planner import BuildArea, RoadCosts, RoadRouter
+
+STEPS = [(-1, -1, 1.4), (-1, 1, 1.4), (1, -1, 1.4), (1, 1, 1.4), (1, 0, 1), (-1, 0, 1), (0, 1, 1), (0, -1, 1)]
+
+
+def make_build_area(seed, length=48):
+    """Terraced land with a few cliffs, crossed by a river along z and a lake"""
+    rng = np.random.default_rng(seed)
+    xs, zs = np.indices((length + 1, length + 1))
+    heights = 64 + (xs // 7 + zs // 5) % 2
+    heights[rng.random(heights.shape) < 0.04] += 3
+    water = (np.abs(xs - rng.integers(12, 36)) <= rng.integers(1, 5)) | \
+            ((xs - 34) ** 2 + (zs - 12) ** 2 < rng.integers(9, 40))
+    heights[water] = 63
+    ocean_floor = np.where(water, rng.integers(55, 62, heights.shape), heights)
+    water_mask = np.where(water, 0, 1).astype(np.uint8)
+    return BuildArea.from_arrays((0, 0), (length, length), heights, water_mask, ocean_floor)
+
+
+def get_slope_cost(build_area, road_map, pos, other):
+    """Cost of moving to an adjacent block, as computed by PathNode before RoadCosts"""
+    steepness = abs(int(build_area.heightmap_no_trees[pos]) - int(build_area.heightmap_no_trees[other]))
+    cost = steepness + 1
+    if steepness >= 2 or not build_area.water_mask[other]:
+        cost = np.inf
+    if road_map[pos]:
+        cost = 0
+    return cost
+
+
+def get_bridge_cost(build_area, dir, pos, other):
+    """Cost of building a bridge from pos to other, as computed by PathNode before RoadCosts"""
+    cost = 0
+    cur_x, cur_z = pos[0] + dir[0], pos[1] + dir[1]
+    height = build_area.heightmap_no_trees[pos]
+    while cur_x != other[0] or cur_z != other[1]:
+        cost += abs(height - build_area.ocean_floor[cur_x, cur_z]) + 2
+        cur_x += dir[0]
+        cur_z += dir[1]
+    return cost
+
+
+def inside(build_area, x, z):
+    return 0 < x < build_area.length_x - 1 and 0 < z < build_area.length_z - 1
+
+
+def route_reference(build_area, start, road_map, build_map):
+    """Cost of the cheapest road with the search of add_building_to_road before RoadRouter, None if there is none"""
+    g_scores = {start: 0}
+    open = [(0, start)]
+    closed = set()
+    while open:
+        g, pos = heapq.heappop(open)
+        if pos in closed:
+            continue
+        closed.add(pos)
+        if pos != start and (road_map[pos] == 1 or build_map[pos] == 1):
+            return g
+
+        edges = []
+        need_bridges = False
+        for x_off, z_off, step in STEPS:
+            other = pos[0] + x_off, pos[1] + z_off
+            if inside(build_area, *other):
+                slope_cost = get_slope_cost(build_area, road_map, pos, other)
+                need_bridges |= slope_cost == np.inf
+                edges.append((other, step * slope_cost))
+        if need_bridges:
+            for r in range(3, RoadRouter.BRIDGE_RADIUS, 3):
+                for dir in RoadRouter.BRIDGE_DIRECTIONS:
+                    other = pos[0] + r * dir[0], pos[1] + r * dir[1]
+                    if inside(build_area, *other) and build_area.water_mask[other] == 1 and \
+                            build_area.heightmap_no_trees[pos] == build_area.heightmap_no_trees[other]:
+                        edges.append((other, get_bridge_cost(build_area, dir, pos, other)))
+        for other, cost in edges:
+            if g + cost < g_scores.get(other, np.inf):
+                g_scores[other] = g + cost
+                heapq.heappush(open, (g + cost, other))
+    return None
+
+
+def road_cost(build_area, roads, bridges, road_map):
+    """Cost of a road found by RoadRouter under the PathNode cost model, checking every step is allowed"""
+    bridge_steps = {(start, end) for end, start in bridges}
+    cost = 0
+    for pos, other in zip(roads, roads[1:]):
+        x_off, z_off = other[0] - pos[0], other[1] - pos[1]
+        assert inside(build_area, *other)
+        if (pos, other) in bridge_steps:
+            length = abs(x_off) + abs(z_off)
+            dir = x_off // length, z_off // length
+            assert length % 3 == 0 and length < RoadRouter.BRIDGE_RADIUS and 0 in dir
+            assert build_area.heightmap_no_trees[pos] == build_area.heightmap_no_trees[other]
+            assert build_area.water_mask[other] == 1
+            cost += get_bridge_cost(build_area, dir, pos, other)
+        else:
+            assert max(abs(x_off), abs(z_off)) == 1
+            slope_cost = get_slope_cost(build_area, road_map, pos, other)
+            assert slope_cost < np.inf
+            cost += (1.4 if x_off and z_off else 1) * slope_cost
+    return cost
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_route_matches_dijkstra(seed):
+    build_area = make_build_area(seed)
+    road_costs = RoadCosts(build_area)
+    router = RoadRouter(build_area, road_costs)
+    rng = np.random.default_rng(seed)
+    road_map = np.zeros((build_area.length_x + 1, build_area.length_z + 1), dtype=np.uint8)
+    build_map = np.zeros_like(road_map)
+    bridged = 0
+
+    # connect buildings one after the other, so later roads can reuse earlier ones
+    for _ in range(6):
+        start = tuple(rng.integers(1, build_area.length_x - 1, 2).tolist())
+        expected = route_reference(build_area, start, road_map, build_map)
+        roads, bridges = router.route(start, road_map, build_map)
+
+        if expected is None:
+            assert (roads, bridges) == ([], [])
+        else:
+            assert roads[0] == start
+            assert road_map[roads[-1]] or build_map[roads[-1]]
+            assert road_cost(build_area, roads, bridges, road_map) == pytest.approx(expected)
+            bridged += len(bridges)
+        for road in roads:
+            road_map[road] = 1
+        road_costs.mark_roads(roads)
+        build_map[start] = 1
+    # every terrain needs a bridge to reach across the river
+    assert bridged > 0
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_road_costs_match_path_node_costs(seed):
+    build_area = make_build_area(seed, length=40)
+    road_costs = RoadCosts(build_area)
+    road_map = np.zeros((41, 41), dtype=np.uint8)
+
+    for x in range(40):
+        for z in range(40):
+            idx = x * 40 + z
+            for d, (x_off, z_off, step) in enumerate(RoadRouter.NEIGHBORS):
+                other = x + x_off, z + z_off
+                expected = step * get_slope_cost(build_area, road_map, (x, z), other) \
+                    if inside(build_area, *other) else -1
+                assert road_costs.slope_costs[d, idx] == expected
+            for i, (r, dir) in enumerate(RoadRouter.BRIDGES):
+                other = x + r * dir[0], z + r * dir[1]
+                buildable = inside(build_area, *other) and build_area.water_mask[other] == 1 and \
+                    build_area.heightmap_no_trees[x, z] == build_area.heightmap_no_trees[other]
+                expected = get_bridge_cost(build_area, dir, (x, z), other) if buildable else np.inf
+                assert road_costs.bridge_costs[i, idx] == expected
+
+
+def test_mark_roads_makes_steps_from_roads_free():
+    build_area = make_build_area(0, length=40)
+    road_costs = RoadCosts(build_area)
+    before = road_costs.slope_costs.copy()
+    bridges_before = road_costs.bridge_costs.copy()
+    # a corner cell steps out of the area, a river bank steps into water
+    water = np.argwhere(build_area.water_mask[:40, :40] == 0)
+    bank = next((x - 1, z) for x, z in water.tolist() if build_area.water_mask[x - 1, z] == 1)
+    cells = [(0, 0), (20, 20), bank]
+
+    road_costs.mark_roads(cells)
+
+    marked = [x * 40 + z for x, z in cells]
+    assert (before[:, marked] == -1).any() and np.isinf(before[:, marked]).any()
+    assert np.array_equal(road_costs.slope_costs[:, marked], np.where(before[:, marked] == -1, -1, 0))
+    others = np.ones(40 * 40, dtype=bool)
+    others[marked] = False
+    assert np.array_equal(road_costs.slope_costs[:, others], before[:, others])
+    assert np.array_equal(road_costs.bridge_costs, bridges_before)
+
+    road_map = np.zeros((41, 41), dtype=np.uint8)
+    road_map[tuple(zip(*cells))] = 1
+    for x, z in cells:
+        for d, (x_off, z_off, step) in enumerate(RoadRouter.NEIGHBORS):
+            if inside(build_area, x + x_off, z + z_off):
+                assert road_costs.slope_costs[d, x * 40 + z] == \
+                    step * get_slope_cost(build_area, road_map, (x, z), (x + x_off, z + z_off))
@@ -0,0 +1,38 @@
+import numpy as np
+
+from conftest import make_world_slice
+from lib.worldLoader import WorldSlice
+from village_planner import BuildArea
+
+
+def test_snapshot_round_trip(tmp_path):
+    world_slice = make_world_slice(-20, 37, 45, 80)
+    world_slice.save_snapshot(tmp_path / "snapshot")
+
+    loaded = WorldSlice.from_snapshot(tmp_path / "snapshot")
+
+    assert loaded.rect == world_slice.rect
+    assert loaded.chunkRect == world_slice.chunkRect
+    assert loaded.heightmapTypes == world_slice.heightmapTypes
+    assert loaded.blockNames == world_slice.blockNames
+    assert np.array_equal(loaded.blockIds, world_slice.blockIds)
+    assert np.array_equal(loaded.biomes, world_slice.biomes)
+    assert np.array_equal(loaded.biomeGrid, world_slice.biomeGrid)
+    for name, heightmap in world_slice.heightmaps.items():
+        assert np.array_equal(loaded.heightmaps[name], heightmap)
+    assert loaded.getBlockAt(-20, 0, 37) == "minecraft:stone"
+    assert loaded.getBlockAt(-21, 0, 37) == "minecraft:void_air"
+
+
+def test_build_area_from_snapshot(tmp_path):
+    world_slice = make_world_slice(-20, 37, 45, 80)
+    world_slice.save_snapshot(tmp_path / "snapshot")
+
+    build_area = BuildArea.from_snapshot(tmp_path / "snapshot")
+    expected = BuildArea(-20, 37, 44, 79, worldslice=make_world_slice(-20, 37, 45, 80))
+
+    assert build_area.start == expected.start == (-20, 37)
+    assert build_area.end == expected.end == (44, 79)
+    assert np.array_equal(build_area.heightmap_no_trees, expected.heightmap_no_trees)
+    assert np.array_equal(build_area.water_mask, expected.water_mask)
+    assert np.array_equal(build_area.ocean_floor, expected.ocean_floor)
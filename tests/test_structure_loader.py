@@ -0,0 +1,216 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import structureLoader
+from test_structures import Recorder
+
+NAMES = ["basichouse1", "basicfarm", "basiclumberjachut"]
+
+
+@pytest.fixture
+def structure_dir(repo_root, tmp_path, monkeypatch):
+    """A few structures of the manifest copied with their own manifest, catalog and cache"""
+    with open(structureLoader.MANIFEST_FILE) as manifest_file:
+        entries = [entry for entry in json.load(manifest_file)["structures"] if entry["name"] in NAMES]
+    root = tmp_path / "structures"
+    for entry in entries:
+        for file in (entry["nbt"], entry["info"]):
+            (root / file).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(structureLoader.STRUCTURE_PATH + file, root / file)
+    with open(root / "manifest.json", "w") as manifest_file:
+        json.dump({"structures": entries}, manifest_file)
+
+    monkeypatch.setattr(structureLoader, "STRUCTURE_PATH", str(root) + os.sep)
+    monkeypatch.setattr(structureLoader, "MANIFEST_FILE", str(root / "manifest.json"))
+    monkeypatch.setattr(structureLoader, "CACHE_PATH", str(tmp_path / "cache"))
+    monkeypatch.setattr(structureLoader, "CATALOG_FILE", str(tmp_path / "cache" / "catalog.npz"))
+    return root
+
+
+def count_parses(monkeypatch):
+    parsed = []
+    loadStructure = structureLoader.loadStructure
+
+    def counting(path, infoPath, name):
+        parsed.append(name)
+        return loadStructure(path, infoPath, name)
+
+    monkeypatch.setattr(structureLoader, "loadStructure", counting)
+    return parsed
+
+
+def built_blocks(struct):
+    with open("data/biomeBlocks.json") as json_file:
+        biomesBlocks = json.load(json_file)["0"]
+    blocks = []
+    for rotation in range(4):
+        recorder = Recorder()
+        struct.build([-3, -64, -5], [100, 0, -40], rotation, recorder, biomesBlocks)
+        blocks.append(recorder.blocks)
+    return blocks
+
+
+def test_cached_structures_build_like_parsed_ones(structure_dir):
+    parsed = structureLoader.loadStructures(NAMES)
+    cached = structureLoader.loadStructures(NAMES)
+
+    assert len(os.listdir(structureLoader.CACHE_PATH)) == len(NAMES) + 2
+    for name in NAMES:
+        assert cached[name] is not parsed[name]
+        assert built_blocks(cached[name]) == built_blocks(parsed[name])
+        fresh = structureLoader.loadStructures([name], cache=False)[name]
+        assert built_blocks(cached[name]) == built_blocks(fresh)
+
+
+def test_cache_hit_parses_nothing(structure_dir, monkeypatch):
+    structureLoader.loadStructures(NAMES)
+    parsed = count_parses(monkeypatch)
+
+    structureLoader.loadStructures(NAMES)
+    assert parsed == []
+
+
+def test_touched_file_is_hashed_again(structure_dir, monkeypatch):
+    structureLoader.loadStructures(NAMES)
+    with open(os.path.join(structureLoader.CACHE_PATH, structureLoader.INDEX_FILE)) as index_file:
+        entry = json.load(index_file)["basicfarm"]
+    parsed = count_parses(monkeypatch)
+
+    nbtPath = structure_dir / entry["files"][0]
+    os.utime(nbtPath, ns=(entry["mtimes"][0] + 10 ** 9, entry["mtimes"][0] + 10 ** 9))
+    structureLoader.loadStructures(NAMES)
+
+    # same content, so the entry is still used, under the new modification time
+    assert parsed == []
+    with open(os.path.join(structureLoader.CACHE_PATH, structureLoader.INDEX_FILE)) as index_file:
+        touched = json.load(index_file)["basicfarm"]
+    assert touched["key"] == entry["key"]
+    assert touched["mtimes"][0] == entry["mtimes"][0] + 10 ** 9
+
+
+@pytest.mark.parametrize("file", [0, 1])
+def test_changed_file_is_parsed_again(structure_dir, monkeypatch, file):
+    loaded = structureLoader.loadStructures(NAMES)
+    with open(os.path.join(structureLoader.CACHE_PATH, structureLoader.INDEX_FILE)) as index_file:
+        entry = json.load(index_file)["basicfarm"]
+    parsed = count_parses(monkeypatch)
+
+    path = structure_dir / entry["files"][file]
+    if file == 0:
+        # the same structure gzipped again has other bytes
+        nbtfile = structureLoader.nbt.NBTFile(str(path), 'rb')
+        nbtfile.write_file(str(path))
+    else:
+        info = json.loads(path.read_text())
+        info["villageInfo"] = dict(info.get("villageInfo", {}), villager=7)
+        path.write_text(json.dumps(info))
+    reloaded = structureLoader.loadStructures(NAMES)
+
+    assert parsed == ["basicfarm"]
+    with open(os.path.join(structureLoader.CACHE_PATH, structureLoader.INDEX_FILE)) as index_file:
+        assert json.load(index_file)["basicfarm"]["key"] != entry["key"]
+    assert built_blocks(reloaded["basicfarm"]) == built_blocks(loaded["basicfarm"])
+    if file == 1:
+        assert reloaded["basicfarm"].info["villageInfo"]["villager"] == 7
+
+
+def read_nbt_size(path):
+    nbtfile = structureLoader.nbt.NBTFile(path, 'rb')
+    return [tag.value for tag in nbtfile["size"]]
+
+
+@pytest.fixture
+def catalog(repo_root, tmp_path, monkeypatch):
+    """Catalog of data/structures/manifest.json, built in a temporary cache"""
+    monkeypatch.setattr(structureLoader, "CACHE_PATH", str(tmp_path / "cache"))
+    monkeypatch.setattr(structureLoader, "CATALOG_FILE", str(tmp_path / "cache" / "catalog.npz"))
+    return structureLoader.loadCatalog()
+
+
+def test_catalog_lists_the_manifest(catalog):
+    with open(structureLoader.MANIFEST_FILE) as manifest_file:
+        entries = json.load(manifest_file)["structures"]
+    enabled = [entry for entry in entries if not entry.get("disabled", False)]
+
+    assert len(enabled) < len(entries)
+    assert catalog.names.tolist() == [entry["name"] for entry in enabled]
+    for entry in enabled:
+        row = catalog.rows[entry["name"]]
+        assert catalog.buildingTypes[row] == entry["type"]
+        assert (catalog.nbtFiles[row], catalog.infoFiles[row]) == (entry["nbt"], entry["info"])
+        size = read_nbt_size(structureLoader.STRUCTURE_PATH + entry["nbt"])
+        assert catalog.getSize(entry["name"]) == size
+        assert catalog.footprints[row].tolist() == [size[0], size[2]]
+        with open(structureLoader.STRUCTURE_PATH + entry["info"]) as info_file:
+            villageInfo = json.load(info_file).get("villageInfo", {})
+        assert catalog.getVillagerInfo(entry["name"]) == (villageInfo.get("villager", 0),
+                                                          villageInfo.get("gameProfession") or None)
+
+
+def test_catalog_query(catalog):
+    rows = list(zip(catalog.names.tolist(), catalog.buildingTypes.tolist(), catalog.footprints.tolist()))
+    for buildingType in set(catalog.buildingTypes.tolist()) | {None}:
+        for maxSize in [None, 5, 9, 13, 20]:
+            expected = [name for name, rowType, (sizeX, sizeZ) in rows
+                        if buildingType in (None, rowType) and (maxSize is None or sizeX <= maxSize)
+                        and (maxSize is None or sizeZ <= maxSize + 1)]
+            assert catalog.query(buildingType, maxSize, None if maxSize is None else maxSize + 1) == expected
+    assert catalog.query("no such type") == []
+
+
+def test_query_fitting_falls_back_to_the_building_type(catalog):
+    buildingType = str(catalog.buildingTypes[0])
+    ofType = catalog.query(buildingType)
+    smallest = catalog.footprints[[catalog.rows[name] for name in ofType]].max(axis=1).min()
+
+    assert catalog.queryFitting(buildingType, smallest, smallest) == catalog.query(buildingType, smallest, smallest)
+    assert catalog.queryFitting(buildingType, smallest - 1, smallest - 1) == ofType
+    assert catalog.queryFitting(buildingType, 0, 0) == ofType
+
+
+def test_disabled_structures_are_left_out(structure_dir):
+    manifest = json.loads((structure_dir / "manifest.json").read_text())
+    manifest["structures"][1]["disabled"] = True
+    (structure_dir / "manifest.json").write_text(json.dumps(manifest))
+
+    catalog = structureLoader.loadCatalog()
+    assert catalog.names.tolist() == [entry["name"] for i, entry in enumerate(manifest["structures"]) if i != 1]
+
+
+def count_builds(monkeypatch):
+    built = []
+    buildCatalog = structureLoader.buildCatalog
+
+    def counting():
+        built.append(True)
+        return buildCatalog()
+
+    monkeypatch.setattr(structureLoader, "buildCatalog", counting)
+    return built
+
+
+@pytest.mark.parametrize("changed", ["manifest.json", "nbt", "info"])
+def test_catalog_is_built_again_when_files_change(structure_dir, monkeypatch, changed):
+    structureLoader.loadCatalog()
+    built = count_builds(monkeypatch)
+    structureLoader.loadCatalog()
+    assert built == []
+
+    manifest = json.loads((structure_dir / "manifest.json").read_text())
+    path = structure_dir / (changed if changed == "manifest.json" else manifest["structures"][0][changed])
+    later = os.stat(structureLoader.CATALOG_FILE).st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(later, later))
+    structureLoader.loadCatalog()
+    assert built == [True]
+
+
+def test_catalog_of_another_version_is_built_again(structure_dir, monkeypatch):
+    structureLoader.loadCatalog()
+    built = count_builds(monkeypatch)
+    monkeypatch.setattr(structureLoader, "CACHE_VERSION", structureLoader.CACHE_VERSION + 1)
+
+    structureLoader.loadCatalog()
+    assert built == [True]
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from nbt import nbt
+
+import structureLoader
+import util.projectMath as projectMath
+from structures import Structures
+from test_base_structure import return_world_position_reference
+
+
+class Recorder:
+    """Stands in for WorldModification, recording the blocks placed"""
+
+    def __init__(self):
+        self.blocks = []
+
+    def setBlock(self, x, y, z, block, compareBlockState=False, placeImmediately=False):
+        self.blocks.append(([x, y, z], block, placeImmediately))
+
+
+def build_reference(struct, nbtfile, strucCoords, buildingCoords, rotation, biomesBlocks):
+    """The blocks Structures.build placed before compiling, one nbt block at a time"""
+    names = struct.resolvePalette(biomesBlocks)
+    struct.computeOrientation(rotation, 0)
+    blocks = []
+    for block in nbtfile["blocks"]:
+        state = block["state"].value
+        blockPalette = struct.palette[state]
+        position = [block["pos"][0].value, block["pos"][1].value, block["pos"][2].value]
+
+        blockName = names[state]
+        if blockPalette[Structures.CHANGE] and blockPalette[Structures.CHANGE_EXCLUDED_ZONES]:
+            replacement = struct.info["replacements"][blockPalette[Structures.CHANGE_REPLACEMENT_WORD]]
+            for zone in replacement["excluded"]:
+                if projectMath.isPointInSquare(position, zone):
+                    blockName = blockPalette[Structures.CHANGE_ORIGINAL_BLOCK]
+                    break
+
+        worldPosition = return_world_position_reference(
+            struct.size, [position[0], position[1] + 1, position[2]], 0, rotation, strucCoords, buildingCoords)
+        placeImmediately = any(word in blockName for word in ["chest", "shulker", "lectern", "barrel"])
+        blocks.append((worldPosition, struct.convertBlockToStr(blockName, blockPalette["Properties"]),
+                       placeImmediately))
+    return blocks
+
+
+@pytest.mark.parametrize("name", ["basichouse1", "basicfarm", "basiclumberjachut"])
+def test_build_matches_block_by_block(repo_root, name):
+    catalog = structureLoader.loadCatalog()
+    row = catalog.rows[name]
+    nbtPath, infoPath = str(catalog.nbtFiles[row]), str(catalog.infoFiles[row])
+    struct = structureLoader.loadStructure(nbtPath, infoPath, name)
+    nbtfile = nbt.NBTFile(structureLoader.STRUCTURE_PATH + nbtPath, 'rb')
+    with open("data/biomeBlocks.json") as json_file:
+        allBiomesBlocks = json.load(json_file)
+
+    strucCoords = [-3, -64, -5]
+    buildingCoords = [100, 0, -40]
+    for biome in ["0", "6"]:
+        for rotation in range(4):
+            recorder = Recorder()
+            struct.build(strucCoords, buildingCoords, rotation, recorder, allBiomesBlocks[biome])
+            expected = build_reference(struct, nbtfile, strucCoords, buildingCoords, rotation,
+                                       allBiomesBlocks[biome])
+            assert recorder.blocks == expected
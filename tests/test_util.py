@@ -0,0 +1,38 @@
+import lib.interfaceUtils as interfaceUtils
+from conftest import make_world_slice
+from lib.interfaceUtils import Interface
+from util.util import getHighestNonAirBlock
+
+# the ignored blocks found in the test terrains, oak_log is not ignored by the list of getHighestNonAirBlock
+AIR = ("minecraft:air", "minecraft:cave_air", "minecraft:void_air", "minecraft:water", "minecraft:oak_leaves")
+
+
+def highest_non_air_block_reference(cx, cz):
+    """The scan down getHighestNonAirBlock replaced, one request per block"""
+    cy = 255
+    while interfaceUtils.getBlock(cx, cy, cz) in AIR:
+        cy -= 1
+    return cy
+
+
+def test_highest_non_air_block_matches_scan(fake_server):
+    for cx, cz in [(0, 0), (5, -3), (-17, 40), (200, 31)]:
+        assert getHighestNonAirBlock(cx, 0, cz) == highest_non_air_block_reference(cx, cz)
+
+
+def test_highest_non_air_block_sees_buffered_blocks(fake_server, monkeypatch):
+    monkeypatch.setattr(interfaceUtils, "globalinterface", Interface(buffering=True, caching=True))
+    interfaceUtils.setBlock(5, 100, 5, "minecraft:stone")
+
+    assert getHighestNonAirBlock(5, 0, 5) == 100
+    assert fake_server.count("PUT", "/blocks") == 0
+    interfaceUtils.globalinterface.buffer.clear()
+
+
+def test_highest_non_air_block_from_slice():
+    world_slice = make_world_slice(0, 0, 16, 16)
+
+    for cx, cz in [(0, 0), (7, 3), (15, 15)]:
+        column = [world_slice.getBlockAt(cx, y, cz) for y in range(256)]
+        expected = max(y for y, name in enumerate(column) if name not in AIR)
+        assert getHighestNonAirBlock(cx, 0, cz, worldSlice=world_slice) == expected
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+from lib.worldLoader import WorldSlice
+
+
+class BiomeMap:
+    """
+    Biome of every column of a world slice and the replacement blocks of every biome
+
+    The grid and the tables are computed once, so looking up the biome of a building needs no request and no file.
+    """
+
+    def __init__(self, world_slice: WorldSlice, biome_file="data/biome.txt", biome_blocks_file="data/biomeBlocks.json"):
+        """
+        Args:
+            world_slice (WorldSlice): slice holding the biomes of the area
+            biome_file (str): "name:category" per biome id, see util.getNameBiome
+            biome_blocks_file (str): replacement blocks by biome category
+        """
+        self.origin = world_slice.rect[:2]
+        self.biomes = BiomeMap.calc_column_biomes(world_slice)
+
+        # biome id -> category, -1 for ids without one
+        with open(biome_file) as file:
+            lines = file.read().splitlines()
+        self.categories = np.full(max(len(lines), int(self.biomes.max()) + 1), -1, dtype=np.int16)
+        for biome_id, line in enumerate(lines):
+            if ":" in line and line.split(":")[1]:
+                self.categories[biome_id] = int(line.split(":")[1])
+
+        with open(biome_blocks_file) as file:
+            self.biome_blocks = json.load(file)
+
+    @staticmethod
+    def calc_column_biomes(world_slice: WorldSlice):
+        """**Calculate the biome id of every column of the slice**.
+
+        Biomes are stored in cells of 4x4x4 blocks, the cell at the surface of each column is taken.
+
+        Returns:
+            any: (X, Z) numpy array of biome ids
+        """
+        x, z, dx, dz = world_slice.rect
+        cell_x = (np.arange(dx) + x % 16) // 4
+        cell_z = (np.arange(dz) + z % 16) // 4
+        heightmap = world_slice.heightmaps.get("MOTION_BLOCKING_NO_LEAVES")
+        if heightmap is None:
+            cell_y = np.full((dx, dz), 16)
+        else:
+            cell_y = np.clip((heightmap[:dx, :dz] - 1) // 4, 0, 63)
+        return world_slice.biomeGrid[cell_x[:, np.newaxis], cell_y, cell_z[np.newaxis, :]]
+
+    def get_biome(self, x, z):
+        """**Return the biome id at global coordinates, clipped to the slice**."""
+        x = np.clip(np.asarray(x) - self.origin[0], 0, self.biomes.shape[0] - 1)
+        z = np.clip(np.asarray(z) - self.origin[1], 0, self.biomes.shape[1] - 1)
+        return self.biomes[x, z]
+
+    def get_category(self, x, z):
+        """**Return the biome category at global coordinates, like util.getNameBiome**."""
+        return self.categories[self.get_biome(x, z)]
+
+    def get_biome_blocks(self, x, z):
+        """**Return the replacement blocks of the biome at global coordinates**.
+
+        Biomes without replacement blocks use the ones of category 0.
+        """
+        return self.biome_blocks.get(str(int(self.get_category(x, z))), self.biome_blocks["0"])
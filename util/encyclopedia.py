@@ -71,5 +71,39 @@ class BuildingType:
         return interest / len(building_locations)
 
 
+class InterestField:
+    """Raster of BuildingType.calc_interest over the whole build area.
+
+    Each placed building adds one contribution layer, so the field is updated in O(area) per building instead of
+    re-evaluating every building for every candidate point.
+    """
+    def __init__(self, building_type: BuildingType, encyclopedia: BuildingEncyclopedia, shape: Tuple[int, int]):
+        self.building_type = building_type
+        self.encyclopedia = encyclopedia
+        self.xs, self.zs = np.indices(shape)
+        self.interest_sum = np.zeros(shape)
+        self.in_range = np.ones(shape, dtype=bool)
+        self.num_buildings = 0
+
+    def add_building(self, building: Building):
+        """Add the Lennard-Jones contribution of a newly placed building"""
+        min_dist, max_dist, break_even = \
+            self.encyclopedia.attract_repulse[self.building_type.name][building.building_type.name]
+        d = np.hypot(self.xs - building.x, self.zs - building.z)
+        # if the distance to any house is out of bounds, this is not a suitable building location
+        self.in_range &= (d >= min_dist) & (d <= max_dist)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            raw_interest = -4 * ((break_even / d) ** 12 - (break_even / d) ** 6)
+        max_interest = 2 ** (1 / 6) * break_even
+        self.interest_sum += raw_interest / max_interest
+        self.num_buildings += 1
+
+    def interest(self) -> np.ndarray:
+        """Interest of every point, same as calc_interest: 0 where unsuitable, 0.5 everywhere before any building"""
+        if self.num_buildings == 0:
+            return np.full(self.interest_sum.shape, 0.5)
+        return np.where(self.in_range, self.interest_sum / self.num_buildings, 0)
+
+
 def gen_closest_distance_comparator(point):
     return lambda building: math.dist(point, (building.x, building.z))
@@ -1,5 +1,5 @@
 import numpy as np
-from gdpc.worldLoader import WorldSlice
+from lib.worldLoader import WorldSlice
 
 
 class Map:
@@ -15,6 +15,7 @@ class Map:
         """**Calculate a heightmap ideal for building**.
 
         Trees are ignored and water is considered ground.
+        Log runs are found for the whole slice at once from the dense block ids.
 
         Args:
             worldSlice (WorldSlice): an instance of the WorldSlice class
@@ -24,51 +25,45 @@ class Map:
             any: numpy array containing the calculated heightmap
         """
         hm_mbnl = world_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"]
-        heightmapNoTrees = hm_mbnl[:]
         area = world_slice.rect
+        # like the original loop, trunks are removed from the world slice heightmap in place
+        heightmapNoTrees = hm_mbnl[:area[2], :area[3]]
 
-        for x in range(area[2]):
-            for z in range(area[3]):
-                while True:
-                    y = heightmapNoTrees[x, z]
-                    block = world_slice.getBlockAt(
-                        area[0] + x, y - 1, area[1] + z)
-                    if block[-4:] == '_log':
-                        heightmapNoTrees[x, z] -= 1
-                    else:
-                        break
+        top = int(heightmapNoTrees.max())
+        if top > 0:
+            blocks = world_slice.getBlocksInBox(area[0], 0, area[1], area[0] + area[2] - 1, top - 1,
+                                                area[1] + area[3] - 1)
+            is_log = world_slice.getBlockNameMask(lambda name: name[-4:] == '_log')[blocks]
 
-        return np.array(np.minimum(hm_mbnl, heightmapNoTrees), dtype='uint8')
+            # for every y, the highest y' <= y that is not a log
+            ys = np.arange(top, dtype=np.int16)[np.newaxis, :, np.newaxis]
+            last_non_log = np.maximum.accumulate(np.where(is_log, np.int16(-1), ys), axis=1)
+
+            # drop every column to just above the highest non-log block below its surface
+            below = np.clip(heightmapNoTrees - 1, 0, None)[:, np.newaxis, :]
+            cleared = np.take_along_axis(last_non_log, below, axis=1)[:, 0, :] + 1
+            heightmapNoTrees[...] = np.where(heightmapNoTrees > 0, cleared, heightmapNoTrees)
+
+        return np.array(hm_mbnl, dtype='uint8')
 
     @staticmethod
     def calc_flatness(build_area, sx: int, sz: int, ex: int, ez: int) -> int:
         """Evaluate flatness of a box on the heightmap heights. Flatness is the count of blocks that are not equal
         to the mode
         """
-        heights = build_area.heightmap_no_trees
-        flatness = 0
-        value_counts = {}
-        # create value counts for every height to find the mode
-        for x in range(sx, ex + 1):
-            for z in range(sz, ez + 1):
-                cur_height = heights[(x, z)]
+        heights = build_area.heightmap_no_trees[sx:ex + 1, sz:ez + 1].astype(int)
 
-                # check for non-buildable blocks. If found, abort flatness search
-                global_x, global_z = build_area.local_to_global(x, z)
-                if build_area.worldslice.getBlockAt(global_x, cur_height-1, global_z) in ["minecraft:water", "minecraft:lava"]:
-                    return -1
+        # check for non-buildable blocks. If found, abort flatness search
+        global_x, global_z = build_area.local_to_global(sx, sz)
+        xs, zs = np.indices(heights.shape)
+        block_ids = build_area.worldslice.getBlockIdsAt(xs + global_x, heights - 1, zs + global_z)
+        if build_area.worldslice.getBlockNameMask(["minecraft:water", "minecraft:lava"])[block_ids].any():
+            return -1
 
-                if cur_height in value_counts:
-                    value_counts[cur_height] += 1
-                else:
-                    value_counts[cur_height] = 1
+        # find the mode height, ties go to the height seen first in x, z order
+        values, first_seen, counts = np.unique(heights, return_index=True, return_counts=True)
+        candidates = np.flatnonzero(counts == counts.max())
+        mode_height = values[candidates[np.argmin(first_seen[candidates])]]
 
         # calculate the total number of blocks that differ from the mode height
-        mode_height = max(value_counts, key=value_counts.get)
-        for height in value_counts:
-            if height < mode_height:
-                flatness += (mode_height - height) * value_counts[height]
-            else:
-                flatness += (height - mode_height) * value_counts[height]
-
-        return flatness
+        return int(np.abs(heights - mode_height).sum())
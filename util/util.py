@@ -7,6 +7,7 @@ import requests
 from io import BytesIO
 import nbt
 import random as rd
+import numpy as np
 
 
 NUMBER = 5
@@ -15,13 +16,12 @@ def getBiome(x, z, dx, dz):
     """**Returns the chunk data.**"""
     x = math.floor(x / 16)
     z = math.floor(z / 16)
-    url = f'http://localhost:9000/chunks?x={x}&z={z}&dx={dx}&dz={dz}'
     try:
-        response = requests.get(url)
-    except ConnectionError:
+        response = di.getChunks(x, z, dx, dz)
+    except requests.exceptions.ConnectionError:
         return -1
         #return "minecraft:plains"
-    biomeId = response.text.split(":")
+    biomeId = response.split(":")
     
     try: 
         biomeinfo = biomeId[6].split(";")
@@ -32,24 +32,9 @@ def getBiome(x, z, dx, dz):
     return biome[0]
     
 def getAllBiome():
-    bytes = di.getChunks(-4, -4, 9, 9, 'bytes')
-    file_like = BytesIO(bytes)
-    nbtfile = nbt.nbt.NBTFile(buffer=file_like)
-    dicochunk = {}
-    for y in range(81):
-        for x in range(1024):
-            if f"{nbtfile['Chunks'][y]['Level']['Biomes'].value[x]}" in dicochunk:
-                dicochunk[f"{nbtfile['Chunks'][y]['Level']['Biomes'].value[x]}"] = int(dicochunk[f"{nbtfile['Chunks'][y]['Level']['Biomes'].value[x]}"]) + 1 
-            else:
-                dicochunk[f"{nbtfile['Chunks'][y]['Level']['Biomes'].value[x]}"] = "1"
-    max = 0
-    savedbiome = 0
-    for x,y in dicochunk.items():
-        if y > max:
-            savedbiome = x
-            max = y
-    value = getNameBiome(savedbiome)
-    return value
+    """**Returns the category of the most common biome in the 9x9 chunks around the origin.**"""
+    worldSlice = worldLoader.WorldSlice(-64, -64, 80, 80, heightmapTypes=[])
+    return getNameBiome(worldSlice.getBiomeMode())
         
         
 def getNameBiome(biome):
@@ -179,20 +164,33 @@ def addItemChest(x, y, z, items):
         interfaceUtils.runCommand(command)
 
 
-def getHighestNonAirBlock(cx, cy, cz):
+def getHighestNonAirBlock(cx, cy, cz, worldSlice=None):
+    """
+    Scan down from y=255 for the first block that is not ignored.
+    Columns inside the rect of worldSlice are resolved from its dense block ids in one go,
+    pass a shared slice to resolve many columns without requests.
+    Other columns are read through the global interface, which sees the blocks placed by this run
+    """
     cy = 255
     IGNORED_BLOCKS = [
-        'minecraft:air', 'minecraft:cave_air', 'minecraft:water', 'minecraft:lava',
+        'minecraft:air', 'minecraft:cave_air', 'minecraft:void_air', 'minecraft:water', 'minecraft:lava',
         'minecraft:oak_leaves',  'minecraft:leaves',  'minecraft:birch_leaves', 'minecraft:spruce_leaves', 'minecraft:dark_oak_leaves'
         'minecraft:oak_log',  'minecraft:spruce_log',  'minecraft:birch_log',  'minecraft:jungle_log', 'minecraft:acacia_log', 'minecraft:dark_oak_log',
         'minecraft:grass', 'minecraft:snow', 'minecraft:poppy', 'minecraft:pissenlit', 'minecraft:seagrass' , 'minecraft:dandelion' ,'minecraft:blue_orchid',
         'minecraft:allium', 'minecraft:azure_bluet', 'minecraft:red_tulip', 'minecraft:orange_tulip', 'minecraft:white_tulip', 'minecraft:pink_tulip',
         'minecraft:oxeye_daisy', 'minecraft:cornflower', 'minecraft:lily_of_the_valley', 'minecraft:brown_mushroom', 'minecraft:red_mushroom',
         'minecraft:sunflower', 'minecraft:peony', 'minecraft:dead_bush', "minecraft:cactus", "minecraft:sugar_cane", 'minecraft:fern']
-    ## Find highest non-air block
-    while interfaceUtils.getBlock(cx, cy, cz) in IGNORED_BLOCKS:
-        cy -= 1
-    return cy
+    if worldSlice is not None and worldSlice.rect[0] <= cx < worldSlice.rect[0] + worldSlice.rect[2] \
+            and worldSlice.rect[1] <= cz < worldSlice.rect[1] + worldSlice.rect[3]:
+        column = worldSlice.getBlocksInBox(cx, 0, cz, cx, cy, cz).ravel()
+        solid = np.flatnonzero(~worldSlice.getBlockNameMask(IGNORED_BLOCKS)[column])
+        return int(solid[-1]) if len(solid) > 0 else -1
+
+    ## Find highest non-air block, blocks missing from the cache are read in one request
+    ## sections missing from the chunk data read as void_air
+    column = interfaceUtils.getBlocksAt([(cx, y, cz) for y in range(cy + 1)])
+    solid = [y for y, name in enumerate(column) if name not in IGNORED_BLOCKS]
+    return solid[-1] if solid else -1
 
 # Create a book item from a text
 def makeBookItem(text, title = "", author = "", desc = ""):
@@ -41,3 +41,7 @@ class WorldModification:
         else :
             self.interface.setBlock(x, y, z, block)
 
+    # Wait until every block set so far is placed in the world
+    def flush(self):
+        self.interface.flush()
+
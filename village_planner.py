@@ -1,11 +1,13 @@
 import math
+import os
 import random
-from gdpc import worldLoader
-from gdpc import geometry
-from queue import PriorityQueue
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from lib import worldLoader
+import heapq
 import typing
 from BuildingSpecifications import Building
-from util.encyclopedia import BuildingType, BuildingEncyclopedia
+from util.encyclopedia import BuildingType, BuildingEncyclopedia, InterestField
 from util.map import Map
 import cv2
 import numpy as np
@@ -13,19 +15,48 @@ import csv
 
 
 class BuildArea:
-    def __init__(self, sx, sz, ex, ez):
-        self.worldslice = worldLoader.WorldSlice(sx, sz, ex + 1, ez + 1)  # this takes a while
+    def __init__(self, sx, sz, ex, ez, cache=None, worldslice=None):
+        # pass a ChunkCache to reuse the chunks of an earlier run of the same, unmodified area
+        if worldslice is None:
+            worldslice = worldLoader.WorldSlice(sx, sz, ex + 1, ez + 1, dense=True, cache=cache)  # this takes a while
+        self.worldslice = worldslice
         self.heightmap_no_trees = Map.calc_clear_heightmap(self.worldslice)
         self.start = (sx, sz)
         self.end = (ex, ez)
         self.length_x = ex - sx
         self.length_z = ez - sz
-        self.water_mask = np.array(np.where(self.worldslice.heightmaps['OCEAN_FLOOR'] < self.heightmap_no_trees, 0, 1),
-                                   dtype="uint8")
+        self.ocean_floor = self.worldslice.heightmaps['OCEAN_FLOOR']
+        self.water_mask = np.array(np.where(self.ocean_floor < self.heightmap_no_trees, 0, 1), dtype="uint8")
 
         assert self.length_x > 0
         assert self.length_z > 0
 
+    @classmethod
+    def from_arrays(cls, start, end, heightmap_no_trees, water_mask, ocean_floor) -> 'BuildArea':
+        """Build area from already computed arrays, without a world slice. Used by the plan workers"""
+        build_area = cls.__new__(cls)
+        build_area.worldslice = None
+        build_area.heightmap_no_trees = heightmap_no_trees
+        build_area.start = tuple(start)
+        build_area.end = tuple(end)
+        build_area.length_x = end[0] - start[0]
+        build_area.length_z = end[1] - start[1]
+        build_area.ocean_floor = ocean_floor
+        build_area.water_mask = water_mask
+        return build_area
+
+    @classmethod
+    def from_snapshot(cls, path) -> 'BuildArea':
+        """Build area over a world slice saved with WorldSlice.save_snapshot, needs no server"""
+        worldslice = worldLoader.WorldSlice.from_snapshot(path)
+        sx, sz, length_x, length_z = worldslice.rect
+        return cls(sx, sz, sx + length_x - 1, sz + length_z - 1, worldslice=worldslice)
+
+    def shared_arrays(self) -> 'SharedArrays':
+        """Copy the read-only arrays of this build area to shared memory, see BuildArea.from_arrays"""
+        return SharedArrays({"heightmap_no_trees": self.heightmap_no_trees, "water_mask": self.water_mask,
+                             "ocean_floor": self.ocean_floor})
+
     def local_to_global(self, x: int, z: int) -> (int, int):
         return x + self.start[0], z + self.start[1]
 
@@ -34,8 +65,12 @@ class BuildArea:
 
 
 class VillagePlanner:
+    # weights of the plan metrics in score_plan
+    PLAN_SCORE_WEIGHTS = {"num_buildings": 100, "interest": 10, "road_length": -0.1, "num_bridges": -5}
+
     def __init__(self, build_area: BuildArea, building_types: typing.List[BuildingType], attraction_file):
         self.build_area = build_area
+        self.attraction_file = attraction_file
 
         self.building_encyclopedia = BuildingEncyclopedia(attraction_file)
 
@@ -47,118 +82,103 @@ class VillagePlanner:
 
         self.buildable_points = np.where((slope <= 2) & (self.build_area.water_mask == 1),
                                          self.build_area.heightmap_no_trees, 0)
+        # summed-area table of unbuildable points, for check_buildable
+        self.unbuildable_sums = cv2.integral((self.buildable_points == 0).astype("uint8"))
         self.build_map = np.zeros_like(self.buildable_points, dtype="bool")
         self.road_map = np.zeros_like(self.buildable_points, dtype="bool")
+        self.road_costs = RoadCosts(self.build_area)
         self.building_locations: typing.List[Building] = []
         self.building_types = building_types
         self.bridges = []       # list of (x,y,z) points on bridges
 
     def check_buildable(self, point, size) -> bool:
-        row_mask = np.array(
-            [1 if (i - point[0]) ** 2 < size ** 2 else 0 for i in range(self.buildable_points.shape[0])], dtype=bool)
-        col_mask = np.array(
-            [1 if (i - point[1]) ** 2 < size ** 2 else 0 for i in range(self.buildable_points.shape[1])], dtype=bool)
-        surrounding_area = self.buildable_points[np.ix_(row_mask, col_mask)]
-        if np.any(surrounding_area == 0):
-            return False
-        return True
-
-    def add_building_to_road(self, building_x: int, building_z: int):
-        """Add a building to the road network. Uses BFS where weights are the distances"""
-        nodes = [[None for _ in range(self.build_area.length_x)] for _ in range(self.build_area.length_z)]
-        open = PriorityQueue()
-        bridge_radius = 20
-        start_node = PathNode(building_x, building_z)
-        start_node.g_score = 0
-        nodes[building_x][building_z] = start_node
-        open.put(start_node)
-
-        while not open.empty():
-            cur_node = open.get()
-
-            if cur_node.pos != start_node.pos and (
-                    self.road_map[cur_node.pos] == 1 or self.build_map[cur_node.pos] == 1):
-                roads = cur_node.reconstruct_path()
-                bridges = cur_node.reconstruct_bridges()
-                for road_pixel in roads:
-                    self.road_map[road_pixel] = 1
-                for bridge_start, bridge_end in bridges:
-                    direction = "along_z" if bridge_start[0] == bridge_end[0] else "along_x"
-                    height = self.build_area.heightmap_no_trees[bridge_start]
-                    if direction == "along_z":
-                        start_z = min(bridge_start[1], bridge_end[1])
-                        end_z = max(bridge_start[1], bridge_end[1])
-                        bridge_points = [(bridge_start[0], height, z) for z in range(start_z, end_z + 1)]
-                    else:
-                        start_x = min(bridge_start[0], bridge_end[0])
-                        end_x = max(bridge_start[0], bridge_end[0])
-                        bridge_points = [(x, height, bridge_start[1]) for x in range(start_x, end_x + 1)]
-
-                    self.bridges.append((bridge_points, direction))
-                return
-
-            need_bridges = False
-
-            # check neighbors in all possible directions for surface roads
-            for x_off, z_off, cost in [(-1, -1, 1.4), (-1, 1, 1.4), (1, -1, 1.4), (1, 1, 1.4), (1, 0, 1), (-1, 0, 1),
-                                       (0, 1, 1), (0, -1, 1)]:
-                # make sure that we are staying within the build area
-                if 0 < cur_node.x + x_off < self.build_area.length_x - 1 and 0 < cur_node.z + z_off < self.build_area.length_z - 1:
-                    if nodes[cur_node.x + x_off][cur_node.z + z_off] is None:
-                        nodes[cur_node.x + x_off][cur_node.z + z_off] = PathNode(cur_node.x + x_off, cur_node.z + z_off)
-                    neighbor = nodes[cur_node.x + x_off][cur_node.z + z_off]
-                    slope_cost = cur_node.get_slope_cost(self.build_area, self.road_map,
-                                                         neighbor)
-                    tentative_g = cur_node.g_score + cost * slope_cost
-
-                    if slope_cost == np.inf:
-                        need_bridges = True
-
-                    # TODO do we really need the f score anymore? We aren't calculating a h score so f == g
-                    if tentative_g < neighbor.g_score:
-                        # This is the new best path to here
-                        neighbor.came_from = cur_node
-                        neighbor.g_score = tentative_g
-                        neighbor.f_score = tentative_g  # + neighbor.calc_h_score(self.build_area)
-                        neighbor.type = "flat"
-                        open.put(neighbor)
+        """Check that every point closer than size to point along both axes is buildable. O(1) on the
+        summed-area table of unbuildable points
+        """
+        return bool(self.check_buildable_batch([point], [size])[0])
 
-            # check bridges of length 3 to bridge_radius
-            if need_bridges:
-                start_height = self.build_area.heightmap_no_trees[cur_node.pos]
-                for r in range(3, bridge_radius, 3):
-                    for dir in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-                        x_off = dir[0] * r
-                        z_off = dir[1] * r
-                        if 0 < cur_node.x + x_off < self.build_area.length_x - 1 and 0 < cur_node.z + z_off < self.build_area.length_z - 1:
-                            # can only build a bridge if the start and end heights are the same (or similar???)
-                            end_x = cur_node.x + x_off
-                            end_z = cur_node.z + z_off
-                            delta_h = start_height - self.build_area.heightmap_no_trees[end_x, end_z]
-                            on_land = self.build_area.water_mask[end_x, end_z] == 1
-                            if delta_h != 0 or not on_land:
-                                continue
-
-                            if nodes[cur_node.x + x_off][cur_node.z + z_off] is None:
-                                nodes[cur_node.x + x_off][cur_node.z + z_off] = PathNode(cur_node.x + x_off,
-                                                                                         cur_node.z + z_off)
-                            end_node = nodes[cur_node.x + x_off][cur_node.z + z_off]
-                            tentative_g = cur_node.g_score + cur_node.get_bridge_cost(self.build_area, dir, end_node)
-                            if tentative_g < end_node.g_score:
-                                # This is the new best path to here
-                                end_node.came_from = cur_node
-                                end_node.g_score = tentative_g
-                                end_node.f_score = tentative_g
-                                end_node.type = "bridge"
-                                open.put(end_node)
-
-    def seed_buildings(self, goal_buildings: int, display_map=True):
+    def check_buildable_batch(self, points, sizes) -> np.ndarray:
+        """check_buildable for many points and sizes at once
+            :returns
+                boolean array, one entry per point
         """
-        Wipe the old building seeds and create new building seeds.
-        This populates self.building_locations
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        sizes = np.broadcast_to(np.abs(np.asarray(sizes, dtype=int)), points.shape[:1])
+        # the square covers |i - point| < size, clipped to the map
+        start_x = np.clip(points[:, 0] - sizes + 1, 0, self.buildable_points.shape[0])
+        end_x = np.clip(points[:, 0] + sizes, 0, self.buildable_points.shape[0])
+        start_z = np.clip(points[:, 1] - sizes + 1, 0, self.buildable_points.shape[1])
+        end_z = np.clip(points[:, 1] + sizes, 0, self.buildable_points.shape[1])
+        end_x = np.maximum(start_x, end_x)
+        end_z = np.maximum(start_z, end_z)
+        unbuildable = self.unbuildable_sums[end_x, end_z] - self.unbuildable_sums[start_x, end_z] \
+            - self.unbuildable_sums[end_x, start_z] + self.unbuildable_sums[start_x, start_z]
+        return unbuildable == 0
+
+    def seed_best_plan(self, goal_buildings: int, num_plans: int = None, sample_interest=False, display_map=False,
+                       max_workers: int = None):
+        """
+        Seed num_plans independent village plans in parallel, each with its own random seed, and keep the one with
+        the best score_plan. This populates self.building_locations, self.road_map and self.bridges like
+        seed_buildings. The build area arrays are shared with the workers through shared memory.
+            :returns
+                metrics of the chosen plan
         """
+        num_plans = num_plans or os.cpu_count() or 1
+        seeds = [random.randrange(2 ** 32) for _ in range(num_plans)]
+        shared = self.build_area.shared_arrays()
+        try:
+            with ProcessPoolExecutor(max_workers=min(num_plans, max_workers or os.cpu_count() or 1)) as executor:
+                plans = list(executor.map(
+                    _seed_plan, [shared.specs] * num_plans, [self.build_area.start] * num_plans,
+                    [self.build_area.end] * num_plans, [self.building_types] * num_plans,
+                    [self.attraction_file] * num_plans, [goal_buildings] * num_plans, seeds,
+                    [sample_interest] * num_plans))
+        finally:
+            shared.unlink()
+
+        best = max(plans, key=lambda plan: plan["metrics"]["score"])
+        print(f"best of {num_plans} plans: {best['metrics']}")
+        self.building_locations = []
+        self.build_map = np.zeros_like(self.buildable_points, dtype="bool")
+        for x, z, type_index in best["buildings"]:
+            self.building_locations.append(Building((x, z), self.building_types[type_index]))
+            self.build_map[x, z] = 1
+        self.road_map = best["road_map"]
+        self.bridges = best["bridges"]
+        self.road_costs = RoadCosts(self.build_area)
+        self.road_costs.mark_roads(map(tuple, np.argwhere(self.road_map[:self.build_area.length_x,
+                                                                         :self.build_area.length_z])))
+        if display_map:
+            self.display_map()
+        return best["metrics"]
+
+    def score_plan(self) -> dict:
+        """Metrics of the current plan and their weighted sum, higher is better"""
+        interest = 0
+        for building in self.building_locations:
+            others = [other for other in self.building_locations if other is not building]
+            interest += building.building_type.calc_interest(self.build_area, (building.x, building.z), others,
+                                                             self.building_encyclopedia)
+        metrics = {"num_buildings": len(self.building_locations), "interest": interest,
+                   "road_length": int(np.count_nonzero(self.road_map)), "num_bridges": len(self.bridges)}
+        metrics["score"] = sum(VillagePlanner.PLAN_SCORE_WEIGHTS[name] * value for name, value in metrics.items())
+        return metrics
+
+    def _add_building(self, point, building_type: BuildingType) -> Building:
+        """Place a building and connect it to the road network"""
+        building = Building(point, building_type)
+        self.building_locations.append(building)
+        self.build_map[point] = 1  # TODO extend this to maybe fill in the whole building plot?
+
+        # add a road to the new building, if there are other buildings
+        if len(self.building_locations) > 1:
+            self.add_building_to_road(point[0], point[1])
+        return building
+
+    def _seed_by_rejection(self, goal_buildings: int):
+        """Pick random points and keep them with a probability that grows with their interest"""
         num_buildings = 0
-        self.building_locations: typing.List[Building] = []
         retries = 0
         force_buildings = False  # force the number of buildings to be goal_buildings, ok for testing, may inf loop
         while num_buildings < goal_buildings and (retries < goal_buildings * 400 or force_buildings):
@@ -171,8 +191,10 @@ class VillagePlanner:
 
             # Calculate the interest for each building type. Build the first one that passes the test (TODO should
             #  this test them in order of interest?)
-            for building_type in self.building_types:
-                if not self.check_buildable(point, building_type.radius):
+            buildable = self.check_buildable_batch([point] * len(self.building_types),
+                                                   [building_type.radius for building_type in self.building_types])
+            for building_type, type_buildable in zip(self.building_types, buildable):
+                if not type_buildable:
                     continue
 
                 interest = building_type.calc_interest(self.build_area, point, self.building_locations,
@@ -182,115 +204,358 @@ class VillagePlanner:
 
                 build_probability = random.uniform(interest, 1.0)
                 if build_probability >= 0.9:
-                    # add the new building
-                    self.building_locations.append(Building(point, building_type))
-                    self.build_map[point] = 1  # TODO extend this to maybe fill in the whole building plot?
+                    self._add_building(point, building_type)
                     num_buildings += 1
                     retries = 0
 
-                    # add a road to the new building, if there are other buildings
-                    if len(self.building_locations) > 1:
-                        self.add_building_to_road(point[0], point[1])
+    def _seed_from_interest_fields(self, goal_buildings: int):
+        """Draw each building straight from the valid cells of all building types.
+
+        A (building type, point) pair is drawn with the probability that one rejection sampling attempt at that
+        point would accept it, so no attempts are wasted on unsuitable points. Stops early once no point is valid.
+        """
+        shape = (self.build_area.length_x, self.build_area.length_z)
+        fields = [InterestField(building_type, self.building_encyclopedia, shape)
+                  for building_type in self.building_types]
+
+        # buildable points only depend on the terrain, so they are computed once for every building type
+        xs, zs = np.indices(shape)
+        points = np.stack([xs.ravel(), zs.ravel()], axis=1)
+        buildable = np.stack([self.check_buildable_batch(points, building_type.radius).reshape(shape) &
+                              (self.buildable_points[:shape[0], :shape[1]] != 0)
+                              for building_type in self.building_types])
+
+        for _ in range(goal_buildings):
+            interest = np.stack([field.interest() for field in fields])
+            # probability that random.uniform(interest, 1.0) >= 0.9
+            with np.errstate(divide='ignore'):
+                accept = np.where(interest >= 0.9, 1.0, 0.1 / (1.0 - interest))
+            weights = np.where(buildable & (interest != 0), accept, 0).ravel()
+            cumulative_weights = np.cumsum(weights)
+            if cumulative_weights[-1] <= 0:
+                break
+
+            choice = int(np.searchsorted(cumulative_weights, random.random() * cumulative_weights[-1], side='right'))
+            type_index, point_index = divmod(min(choice, len(weights) - 1), shape[0] * shape[1])
+            building = self._add_building(divmod(point_index, shape[1]), self.building_types[type_index])
+            for field in fields:
+                field.add_building(building)
+
+    def add_building_to_road(self, building_x: int, building_z: int):
+        """Add a building to the road network. Uses A* where weights are the distances"""
+        roads, bridges = RoadRouter(self.build_area, self.road_costs).route((building_x, building_z), self.road_map,
+                                                                            self.build_map)
+        for road_pixel in roads:
+            self.road_map[road_pixel] = 1
+        self.road_costs.mark_roads(roads)
+        for bridge_start, bridge_end in bridges:
+            global bridge_count
+            bridge_count += 1
+            print(f"adding bridge {bridge_count} - {bridge_start}")
+
+            direction = "along_z" if bridge_start[0] == bridge_end[0] else "along_x"
+            height = self.build_area.heightmap_no_trees[bridge_start]
+            if direction == "along_z":
+                start_z = min(bridge_start[1], bridge_end[1])
+                end_z = max(bridge_start[1], bridge_end[1])
+                bridge_points = [(bridge_start[0], height, z) for z in range(start_z, end_z + 1)]
+            else:
+                start_x = min(bridge_start[0], bridge_end[0])
+                end_x = max(bridge_start[0], bridge_end[0])
+                bridge_points = [(x, height, bridge_start[1]) for x in range(start_x, end_x + 1)]
+
+            self.bridges.append((bridge_points, direction))
+
+    def seed_buildings(self, goal_buildings: int, display_map=True, sample_interest=False):
+        """
+        Wipe the old building seeds and create new building seeds.
+        This populates self.building_locations
+        With sample_interest, points are drawn directly from the interest fields instead of rejection-sampled
+        """
+        self.building_locations: typing.List[Building] = []
+        if sample_interest:
+            self._seed_from_interest_fields(goal_buildings)
+        else:
+            self._seed_by_rejection(goal_buildings)
 
         if display_map:
-            new_map = np.copy(self.buildable_points)
-            # mark building locations in white
-            for building in self.building_locations:
-                new_map[(building.x, building.z)] = 255
-                new_map = cv2.circle(new_map, (building.z, building.x), building.building_type.radius, (255, 255, 255))
+            self.display_map()
+
+    def display_map(self):
+        """Show the buildings, roads and bridges of the current plan"""
+        new_map = np.copy(self.buildable_points)
+        # mark building locations in white
+        for building in self.building_locations:
+            new_map[(building.x, building.z)] = 255
+            new_map = cv2.circle(new_map, (building.z, building.x), building.building_type.radius, (255, 255, 255))
+
+        # mark roads on build map
+        new_map = np.where(self.road_map == 1, 255, new_map)
+
+        bridges_map = np.copy(self.buildable_points)
+        for bridge_points, direction in self.bridges:
+            for x, y, z in bridge_points:
+                bridges_map[(x, z)] = 255
+
+        cv2.imshow("bridges_map", bridges_map.astype(np.uint8))
+        cv2.imshow("everything map", new_map.astype(np.uint8))
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+
+
+def _seed_plan(shared_specs, start, end, building_types, attraction_file, goal_buildings, seed, sample_interest):
+    """Worker for VillagePlanner.seed_best_plan: seed one plan on the shared build area"""
+    shared = SharedArrays.attach(shared_specs)
+    plan = _seed_plan_on_arrays(shared.arrays, start, end, building_types, attraction_file, goal_buildings, seed,
+                                sample_interest)
+    # the planner holding views of the shared arrays is gone now, so the mapping can be closed
+    shared.close()
+    return plan
+
+
+def _seed_plan_on_arrays(arrays, start, end, building_types, attraction_file, goal_buildings, seed, sample_interest):
+    build_area = BuildArea.from_arrays(start, end, **arrays)
+    planner = VillagePlanner(build_area, building_types, attraction_file)
+    random.seed(seed)
+    planner.seed_buildings(goal_buildings, display_map=False, sample_interest=sample_interest)
+    return {"buildings": [(int(building.x), int(building.z), building_types.index(building.building_type))
+                          for building in planner.building_locations],
+            "road_map": planner.road_map, "bridges": planner.bridges, "metrics": planner.score_plan()}
+
+
+class SharedArrays:
+    """Numpy arrays copied to shared memory, so worker processes can map them without copying.
+    specs is picklable and is passed to SharedArrays.attach in the worker
+    """
+    def __init__(self, arrays: dict = None):
+        self.arrays = {}
+        self.specs = {}
+        self.blocks = []
+        for name, array in (arrays or {}).items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.blocks.append(block)
+            self.arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            self.arrays[name][...] = array
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    @classmethod
+    def attach(cls, specs: dict) -> 'SharedArrays':
+        shared = cls()
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            shared.blocks.append(block)
+            shared.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            shared.specs[name] = (block_name, shape, dtype)
+        return shared
+
+    def close(self):
+        """Release this process' mapping"""
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+
+    def unlink(self):
+        """Close and free the shared memory, only the creating process should call this"""
+        self.close()
+        for block in self.blocks:
+            block.unlink()
+
 
-            # mark roads on build map
-            new_map = np.where(self.road_map == 1, 255, new_map)
+bridge_count = 0
 
-            bridges_map = np.copy(self.buildable_points)
-            for bridge_points, direction in self.bridges:
-                for x, y, z in bridge_points:
-                    bridges_map[(x, z)] = 255
 
-            cv2.imshow("bridges_map", bridges_map.astype(np.uint8))
-            cv2.imshow("everything map", new_map.astype(np.uint8))
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
+def octile_distance_transform(mask, diagonal_cost=1.4):
+    """Distance from every cell to the nearest True cell of mask when moving in 8 directions, with straight steps
+    costing 1 and diagonal steps costing diagonal_cost. Exact two pass chamfer transform, inf when mask is empty
+    """
+    dist = np.where(mask, 0.0, np.inf)
+    idx = np.arange(mask.shape[1], dtype=float)
+    for rows in (range(mask.shape[0]), range(mask.shape[0] - 1, -1, -1)):
+        prev = None
+        for x in rows:
+            row = dist[x]
+            if prev is not None:
+                row = np.minimum(row, prev + 1)
+                row[1:] = np.minimum(row[1:], prev[:-1] + diagonal_cost)
+                row[:-1] = np.minimum(row[:-1], prev[1:] + diagonal_cost)
+            # straight steps along the row, in both directions
+            row = np.minimum(idx + np.minimum.accumulate(row - idx),
+                             np.minimum.accumulate((row + idx)[::-1])[::-1] - idx)
+            dist[x] = row
+            prev = row
+    return dist
+
+
+def shift_array(array, x_off: int, z_off: int, fill):
+    """Return b with b[x, z] = array[x + x_off, z + z_off], or fill where that falls outside of array"""
+    shifted = np.full_like(array, fill)
+    length_x, length_z = array.shape
+    if abs(x_off) < length_x and abs(z_off) < length_z:
+        shifted[max(-x_off, 0):length_x - max(x_off, 0), max(-z_off, 0):length_z - max(z_off, 0)] = \
+            array[max(x_off, 0):length_x - max(-x_off, 0), max(z_off, 0):length_z - max(-z_off, 0)]
+    return shifted
+
+
+class RoadCosts:
+    """Edge cost rasters for road routing, computed once per BuildArea.
+
+    Cells are flattened to x * length_z + z. slope_costs[d] holds the cost of a surface step from every cell in
+    direction RoadRouter.NEIGHBORS[d], step length included. It is inf when the step needs a bridge, -1 when it leaves
+    the build area and 0 from road cells. bridge_costs[i] holds the cost of the i-th bridge of RoadRouter.BRIDGES from
+    every cell, inf when that bridge can't be built.
+    """
+
+    def __init__(self, build_area: BuildArea):
+        self.length_x = build_area.length_x
+        self.length_z = build_area.length_z
+        heights = build_area.heightmap_no_trees[:self.length_x, :self.length_z].astype(int)
+        water_mask = build_area.water_mask[:self.length_x, :self.length_z]
+        ocean_floor = build_area.ocean_floor[:self.length_x, :self.length_z].astype(int)
+        xs, zs = np.indices(heights.shape)
+
+        def inside(x_off, z_off):
+            # targets must stay strictly within the build area
+            return (0 < xs + x_off) & (xs + x_off < self.length_x - 1) & \
+                   (0 < zs + z_off) & (zs + z_off < self.length_z - 1)
+
+        # surface roads. Steepness is penalized and the grade must be traversable
+        self.slope_costs = np.empty((len(RoadRouter.NEIGHBORS), heights.size))
+        for d, (x_off, z_off, cost) in enumerate(RoadRouter.NEIGHBORS):
+            steepness = np.abs(heights - shift_array(heights, x_off, z_off, 0))
+            slope_cost = np.where((steepness >= 2) | (shift_array(water_mask, x_off, z_off, 0) == 0),
+                                  np.inf, cost * (steepness + 1))
+            self.slope_costs[d] = np.where(inside(x_off, z_off), slope_cost, -1).ravel()
+
+        # bridges. The cost marches along the span, so it is accumulated along each axis once for every length
+        self.bridge_costs = np.empty((len(RoadRouter.BRIDGES), heights.size))
+        for dir in RoadRouter.BRIDGE_DIRECTIONS:
+            span_costs = np.zeros(heights.shape, dtype=int)
+            for r in range(1, RoadRouter.BRIDGE_RADIUS):
+                if (r, dir) in RoadRouter.BRIDGES:
+                    # can only build a bridge if the start and end heights are the same and it ends on land
+                    buildable = inside(r * dir[0], r * dir[1]) & \
+                                (shift_array(heights, r * dir[0], r * dir[1], -1) == heights) & \
+                                (shift_array(water_mask, r * dir[0], r * dir[1], 0) == 1)
+                    self.bridge_costs[RoadRouter.BRIDGES.index((r, dir))] = \
+                        np.where(buildable, span_costs, np.inf).ravel()
+                # cost is the height plus the cost of building a road on flat ground
+                delta_h = np.abs(heights - shift_array(ocean_floor, r * dir[0], r * dir[1], 0))
+                span_costs += delta_h + 2  # building a bridge should be more expensive than building a regular road
+
+    def mark_roads(self, cells):
+        """Road re-use is free, so steps leaving a road cell cost nothing"""
+        for x, z in cells:
+            idx = x * self.length_z + z
+            self.slope_costs[:, idx] = np.where(self.slope_costs[:, idx] >= 0, 0, -1)
+
+
+class RoadRouter:
+    """A* search for the cheapest road from a building to the road network.
+
+    g scores, parents and edge types are kept in flat numpy arrays indexed by x * length_z + z, the open set is a
+    heapq with lazy deletion. The heuristic is the octile distance to the nearest road or building cell. Steps leaving
+    a road cell are free (see RoadCosts.mark_roads), every other step costs at least its octile length. Since road
+    cells are goals, a free step can only be the first step of a path, so the heuristic never overestimates. It is
+    only admissible as long as every road cell stays a goal. Edge costs come from the RoadCosts rasters.
+    """
+    FLAT = 1
+    BRIDGE = 2
+    BRIDGE_RADIUS = 20
+    NEIGHBORS = [(-1, -1, 1.4), (-1, 1, 1.4), (1, -1, 1.4), (1, 1, 1.4), (1, 0, 1), (-1, 0, 1), (0, 1, 1), (0, -1, 1)]
+    BRIDGE_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+    def __init__(self, build_area: BuildArea, road_costs: RoadCosts):
+        self.build_area = build_area
+        self.road_costs = road_costs
+        self.length_x = build_area.length_x
+        self.length_z = build_area.length_z
+
+    def route(self, start, road_map, build_map):
+        """Find the cheapest road from start to any other road or building cell
+            :returns
+                (roads, bridges): road cells from start to the goal and (bridge end, bridge start) pairs, or two
+                empty lists when no other cell can be reached
+        """
+        length_x, length_z = self.length_x, self.length_z
+        slope_costs = self.road_costs.slope_costs
+        bridge_costs = self.road_costs.bridge_costs
+        neighbor_offsets = [x_off * length_z + z_off for x_off, z_off, _ in RoadRouter.NEIGHBORS]
+        bridge_offsets = [r * (dir[0] * length_z + dir[1]) for r, dir in RoadRouter.BRIDGES]
+
+        goals = (road_map[:length_x, :length_z] | build_map[:length_x, :length_z]).ravel()
+        start_idx = start[0] * length_z + start[1]
+        goals[start_idx] = False
+        if not goals.any():
+            return [], []
+        h_scores = octile_distance_transform(goals.reshape(length_x, length_z)).ravel()
+
+        g_scores = np.full(length_x * length_z, np.inf)
+        came_from = np.full(length_x * length_z, -1, dtype=np.int64)
+        edge_type = np.zeros(length_x * length_z, dtype=np.uint8)
+        closed = np.zeros(length_x * length_z, dtype=bool)
+
+        g_scores[start_idx] = 0
+        open = [(h_scores[start_idx], h_scores[start_idx], start_idx)]
+        while open:
+            _, _, cur_idx = heapq.heappop(open)
+            if closed[cur_idx]:
+                continue  # stale entry, this node was already expanded with a better score
+            closed[cur_idx] = True
+
+            if cur_idx != start_idx and goals[cur_idx]:
+                return self.reconstruct(cur_idx, came_from, edge_type)
+
+            cur_g = g_scores[cur_idx]
+            need_bridges = False
 
+            # check neighbors in all possible directions for surface roads
+            for neighbor_offset, step_cost in zip(neighbor_offsets, slope_costs[:, cur_idx].tolist()):
+                if step_cost < 0:
+                    continue  # outside of the build area
+                if step_cost == np.inf:
+                    need_bridges = True
+                    continue
 
-bridge_count = 0
+                neighbor_idx = cur_idx + neighbor_offset
+                tentative_g = cur_g + step_cost
+                if tentative_g < g_scores[neighbor_idx]:
+                    # This is the new best path to here
+                    g_scores[neighbor_idx] = tentative_g
+                    came_from[neighbor_idx] = cur_idx
+                    edge_type[neighbor_idx] = RoadRouter.FLAT
+                    heapq.heappush(open, (tentative_g + h_scores[neighbor_idx], h_scores[neighbor_idx], neighbor_idx))
 
+            if need_bridges:
+                for bridge_offset, bridge_cost in zip(bridge_offsets, bridge_costs[:, cur_idx].tolist()):
+                    if bridge_cost == np.inf:
+                        continue
 
-class PathNode:
-    def __init__(self, x: int, z: int):
-        self.x = x
-        self.z = z
-        self.f_score = np.inf
-        self.g_score = np.inf
-        self.came_from = None
-        self.type = None
-
-    def __lt__(self, other: 'PathNode'):
-        return self.f_score < other.f_score
-
-    # def calc_h_score(self, build_area: BuildArea, goal):
-    #     D = 1  # Cost of moving to an adjacent grid square
-    #     D2 = 1.4  # Cost of moving diagonally
-    #     dx = abs(self.x - goal[0])
-    #     dy = abs(self.z - goal[1])
-    #     distance = D * (dx + dy) + (D2 - 2 * D) * min(dx, dy)
-    #
-    #     # TODO how do I account for slope, water crossings, etc?
-    #     return distance
-
-    @property
-    def pos(self):
-        return self.x, self.z
-
-    def reconstruct_bridges(self):
-        assert self.pos is not None
-        if self.came_from is not None:
-            bridges = self.came_from.reconstruct_bridges()
-            if self.type == "bridge":
-                bridges.append((self.pos, self.came_from.pos))
-            return bridges
-        return []
-
-    def reconstruct_path(self):
-        assert self.pos is not None
-        if self.came_from is not None:
-            path = self.came_from.reconstruct_path()
-            path.append(self.pos)
-            if self.type == "bridge":
-                global bridge_count
-                bridge_count += 1
-                print(f"adding bridge {bridge_count} - {self.pos}")
-            return path
-        return [self.pos]
-
-    def get_slope_cost(self, build_area: BuildArea, road_map, other):
-        """Get cost of moving to an adjacent block. Steepness is penalized, road re-use is rewarded"""
-        steepness = abs(int(build_area.heightmap_no_trees[self.pos]) - int(build_area.heightmap_no_trees[other.pos]))
-        cost = steepness + 1
-        # if the grade is not traversable, we can't build a surface road. Need bridge or tunnel
-        if steepness >= 2 or not build_area.water_mask[other.pos]:
-            cost = np.inf
-
-        road_exists = road_map[self.pos]
-        if road_exists:
-            cost = 0
-        return cost
-
-    def get_bridge_cost(self, build_area: BuildArea, dir, other):
-        """Get cost of building a bridge directly to this node """
-        cost = 0
-        cur_x = self.x + dir[0]
-        cur_z = self.z + dir[1]
-        height = build_area.heightmap_no_trees[self.pos]
-
-        # march along bridge path to determine cost of building a bridge/tunnel
-        while cur_x != other.x or cur_z != other.z:
-            delta_h = abs(height - build_area.worldslice.heightmaps['OCEAN_FLOOR'][(cur_x, cur_z)])
-            # cost is the height plus the cost of building a road on flat ground
-            cost += delta_h
-            cost += 2  # building a bridge should be more expensive than building a regular road
-
-            cur_x += dir[0]
-            cur_z += dir[1]
-
-        return cost
+                    end_idx = cur_idx + bridge_offset
+                    tentative_g = cur_g + bridge_cost
+                    if tentative_g < g_scores[end_idx]:
+                        # This is the new best path to here
+                        g_scores[end_idx] = tentative_g
+                        came_from[end_idx] = cur_idx
+                        edge_type[end_idx] = RoadRouter.BRIDGE
+                        heapq.heappush(open, (tentative_g + h_scores[end_idx], h_scores[end_idx], end_idx))
+
+        return [], []
+
+    def reconstruct(self, goal_idx, came_from, edge_type):
+        """Walk the parents back from the goal. Bridges are (bridge end, bridge start) pairs"""
+        roads = []
+        bridges = []
+        idx = goal_idx
+        while idx != -1:
+            pos = divmod(int(idx), self.length_z)
+            roads.append(pos)
+            if edge_type[idx] == RoadRouter.BRIDGE:
+                bridges.append((pos, divmod(int(came_from[idx]), self.length_z)))
+            idx = came_from[idx]
+        roads.reverse()
+        bridges.reverse()
+        return roads, bridges
+
+
+# bridges of length 3 to bridge_radius, as (length, direction)
+RoadRouter.BRIDGES = [(r, dir) for r in range(3, RoadRouter.BRIDGE_RADIUS, 3) for dir in RoadRouter.BRIDGE_DIRECTIONS]